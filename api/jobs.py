@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Seconds a running job gets to stop cooperatively before its task is cancelled
+CANCEL_GRACE = 10.0
+FINISHED = ('done', 'failed', 'cancelled')
+
+class Job:
+    """One scrape job: its task, the site scraper running it, and its outcome"""
+
+    def __init__(self, site: str, scraper: Any, timeout: Optional[float] = None,
+                 client: Optional[str] = None, proxy_group: str = 'default'):
+        self.id = str(uuid.uuid4())
+        self.site = site
+        self.scraper = scraper
+        self.timeout = timeout
+        self.client = client
+        self.proxy_group = proxy_group
+        self.status = 'queued'
+        self.task: Optional[asyncio.Task] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.count: Optional[int] = None
+        self.error: Optional[str] = None
+        # Set when the API's backstop stopped the scraper rather than the scraper itself
+        self.cut_off = False
+
+    @property
+    def truncated(self) -> bool:
+        return self.cut_off or bool(getattr(self.scraper, 'truncated', False))
+
+    def to_dict(self) -> Dict:
+        return {
+            'job_id': self.id,
+            'site': self.site,
+            'client': self.client,
+            'proxy_group': self.proxy_group,
+            'status': self.status,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'count': self.count,
+            'truncated': self.truncated,
+            'error': self.error
+        }
+
+class JobRegistry:
+    """In-process job table; the newest `retain` finished jobs are kept for status queries"""
+
+    def __init__(self, retain: int = 1000):
+        self.jobs: 'OrderedDict[str, Job]' = OrderedDict()
+        self.retain = retain
+
+    def add(self, job: Job) -> Job:
+        self.jobs[job.id] = job
+        finished = [job_id for job_id, j in self.jobs.items() if j.status in FINISHED]
+        for job_id in finished[:max(0, len(finished) - self.retain)]:
+            del self.jobs[job_id]
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    async def cancel(self, job: Job) -> None:
+        """Queued jobs are dropped; running ones are asked to stop and keep partial results"""
+        if job.status in FINISHED or job.task is None:
+            return
+        if job.status == 'queued' or not hasattr(job.scraper, 'cancel'):
+            job.task.cancel()
+            return
+        job.status = 'cancelling'
+        job.scraper.cancel()
+        asyncio.get_running_loop().call_later(CANCEL_GRACE, self._force_cancel, job)
+
+    def _force_cancel(self, job: Job) -> None:
+        if job.status not in FINISHED and job.task and not job.task.done():
+            logger.warning(f"Job {job.id} did not stop within {CANCEL_GRACE}s, cancelling its task")
+            job.task.cancel()
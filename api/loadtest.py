@@ -0,0 +1,239 @@
+"""Load test for the scrape API.
+
+Submits jobs at a fixed rate, polls each to completion and saves throughput,
+latency and queueing-delay percentiles, error rates and server memory,
+sampled through the run, as JSON. Point it at a running server, or let it start one against the fake
+site plugin:
+
+    python -m api.loadtest --serve --rate 20 --duration 60
+    python -m api.loadtest --serve --compare loadtest_results/<earlier run>.json
+"""
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import aiohttp
+import typer
+
+FINISHED = ('done', 'failed', 'cancelled')
+# Summary keys where a higher value is a regression
+LOWER_IS_BETTER = ('latency_p50', 'latency_p90', 'latency_p99', 'queue_delay_p50', 'queue_delay_p90',
+                   'queue_delay_p99', 'error_rate', 'rss_peak_mb', 'rss_growth_mb', 'rss_slope_mb_per_min')
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+def slope_per_minute(samples: List[List[float]]) -> Optional[float]:
+    """Least-squares slope of (seconds, MB) samples, in MB per minute"""
+    if len(samples) < 2:
+        return None
+    mean_t = sum(t for t, _ in samples) / len(samples)
+    mean_v = sum(v for _, v in samples) / len(samples)
+    spread = sum((t - mean_t) ** 2 for t, _ in samples)
+    if not spread:
+        return None
+    return 60 * sum((t - mean_t) * (v - mean_v) for t, v in samples) / spread
+
+def wait_until_up(url: str, server: subprocess.Popen, timeout: float = 30.0) -> None:
+    """Poll the server until it answers, failing early if its process exits"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode} before answering")
+        try:
+            urllib.request.urlopen(f"{url}/openapi.json", timeout=1).close()
+            return
+        except urllib.error.HTTPError:
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server at {url} did not answer within {timeout:.0f}s")
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return None
+
+class LoadTest:
+    def __init__(self, base_url: str, token: str, site: str, urls_per_job: int,
+                 job_timeout: Optional[float], poll_interval: float = 0.25, sample_interval: float = 1.0):
+        self.base_url = base_url.rstrip('/')
+        self.headers = {'Authorization': f"Bearer {token}"}
+        self.site = site
+        self.body = {'urls': [f"https://example.test/{i}" for i in range(urls_per_job)]}
+        if job_timeout:
+            self.body['timeout'] = job_timeout
+        self.poll_interval = poll_interval
+        self.sample_interval = sample_interval
+        self.jobs: List[Dict] = []
+        self.submit_errors = 0
+        # [seconds since start, server RSS in MB], sampled through the run
+        self.rss_samples: List[List[float]] = []
+
+    async def server_rss(self, session: aiohttp.ClientSession) -> Optional[float]:
+        async with session.get(f"{self.base_url}/admission", headers=self.headers) as response:
+            if response.status != 200:
+                return None
+            return (await response.json())['probe'].get('process_rss_mb')
+
+    async def sample_rss(self, session: aiohttp.ClientSession, started: float) -> None:
+        """Record server RSS every `sample_interval` seconds until cancelled"""
+        while True:
+            try:
+                rss = await self.server_rss(session)
+            except aiohttp.ClientError:
+                rss = None
+            if rss is not None:
+                self.rss_samples.append([round(time.monotonic() - started, 3), rss])
+            await asyncio.sleep(self.sample_interval)
+
+    async def run_job(self, session: aiohttp.ClientSession) -> None:
+        submitted = time.time()
+        try:
+            async with session.post(f"{self.base_url}/scrape/{self.site}", json=self.body,
+                                    headers=self.headers) as response:
+                if response.status != 200:
+                    self.submit_errors += 1
+                    return
+                job_id = (await response.json())['job_id']
+            while True:
+                await asyncio.sleep(self.poll_interval)
+                async with session.get(f"{self.base_url}/jobs/{job_id}", headers=self.headers) as response:
+                    status = await response.json()
+                if status['status'] in FINISHED:
+                    break
+        except aiohttp.ClientError:
+            self.submit_errors += 1
+            return
+        status['submitted_at'] = submitted
+        status['completed_at'] = time.time()
+        self.jobs.append(status)
+
+    async def run(self, rate: float, duration: float) -> Dict:
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            started = time.monotonic()
+            sampler = asyncio.create_task(self.sample_rss(session, started))
+            tasks = []
+            try:
+                # Open-loop arrivals: submit on schedule whether or not earlier jobs are done
+                for i in range(int(rate * duration)):
+                    delay = started + i / rate - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    tasks.append(asyncio.create_task(self.run_job(session)))
+                await asyncio.gather(*tasks)
+                elapsed = time.monotonic() - started
+            finally:
+                sampler.cancel()
+                await asyncio.gather(sampler, return_exceptions=True)
+            rss_end = await self.server_rss(session)
+            if rss_end is not None:
+                self.rss_samples.append([round(time.monotonic() - started, 3), rss_end])
+        return self.summary(len(tasks), elapsed)
+
+    def summary(self, submitted: int, elapsed: float) -> Dict:
+        done = [job for job in self.jobs if job['status'] == 'done']
+        failed = [job for job in self.jobs if job['status'] == 'failed']
+        latencies = [job['completed_at'] - job['submitted_at'] for job in done]
+        queue_delays = [job['started_at'] - job['created_at'] for job in self.jobs if job.get('started_at')]
+        rss = [value for _, value in self.rss_samples]
+        summary = {
+            'submitted': submitted,
+            'done': len(done),
+            'failed': len(failed),
+            'submit_errors': self.submit_errors,
+            'truncated': sum(1 for job in done if job['truncated']),
+            'error_rate': (len(failed) + self.submit_errors) / submitted if submitted else 0.0,
+            'elapsed': elapsed,
+            'throughput': len(done) / elapsed if elapsed else 0.0,
+            'rss_start_mb': rss[0] if rss else None,
+            'rss_peak_mb': max(rss) if rss else None,
+            'rss_end_mb': rss[-1] if rss else None,
+            # Peak over the run, so growth that is freed again before the end still shows
+            'rss_growth_mb': max(rss) - rss[0] if rss else None,
+            # A steady rise while the load is flat points at a leak rather than warm-up
+            'rss_slope_mb_per_min': slope_per_minute(self.rss_samples),
+        }
+        for q in (50, 90, 99):
+            summary[f'latency_p{q}'] = percentile(latencies, q)
+            summary[f'queue_delay_p{q}'] = percentile(queue_delays, q)
+        return summary
+
+def compare(current: Dict, previous: Dict) -> None:
+    typer.echo(f"{'metric':<18}{'previous':>12}{'current':>12}{'change':>10}")
+    for key, value in current.items():
+        before = previous.get(key)
+        if not isinstance(value, (int, float)) or not isinstance(before, (int, float)):
+            continue
+        change = (value - before) / before if before else 0.0
+        worse = change > 0 if key in LOWER_IS_BETTER else key == 'throughput' and change < 0
+        flag = '  !' if worse and abs(change) > 0.1 else ''
+        typer.echo(f"{key:<18}{before:>12.3f}{value:>12.3f}{change:>+10.1%}{flag}")
+
+def main(
+    url: str = typer.Option("http://127.0.0.1:8000", help="Base URL of the API"),
+    token: str = typer.Option("loadtest", envvar="API_TOKEN", help="Bearer token"),
+    site: str = typer.Option("fake", help="Site plugin to drive"),
+    rate: float = typer.Option(10.0, help="Jobs submitted per second"),
+    duration: float = typer.Option(30.0, help="Seconds to keep submitting"),
+    urls_per_job: int = typer.Option(2, help="URLs in each scrape request"),
+    job_timeout: Optional[float] = typer.Option(None, help="Per-job timeout sent with each request"),
+    serve: bool = typer.Option(False, help="Start a local uvicorn server for the run"),
+    port: int = 8765,
+    out_dir: str = "loadtest_results",
+    compare_with: Optional[str] = typer.Option(None, "--compare", help="Earlier result file to compare against"),
+):
+    server = None
+    if serve:
+        url = f"http://127.0.0.1:{port}"
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'api.main:app', '--port', str(port), '--log-level', 'warning'],
+            env={**os.environ, 'LOG_LEVEL': os.getenv('LOG_LEVEL', 'WARNING')}
+        )
+    try:
+        if server:
+            wait_until_up(url, server)
+        test = LoadTest(url, token, site, urls_per_job, job_timeout)
+        summary = asyncio.run(test.run(rate, duration))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    result = {
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'revision': git_revision(),
+        'config': {
+            'site': site, 'rate': rate, 'duration': duration, 'urls_per_job': urls_per_job,
+            'job_timeout': job_timeout, 'driver': os.getenv('SCRAPER_DRIVER', 'playwright'),
+            'fake_site': {key: value for key, value in os.environ.items() if key.startswith('FAKE_SITE_')},
+        },
+        'summary': summary,
+        'rss_samples': test.rss_samples,
+    }
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+    path = Path(out_dir) / f"loadtest-{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.json"
+    path.write_text(json.dumps(result, indent=2))
+    typer.echo(json.dumps(summary, indent=2))
+    typer.echo(f"Saved {path}")
+
+    if compare_with:
+        with open(compare_with, 'r', encoding='utf-8') as f:
+            compare(summary, json.load(f)['summary'])
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -1,26 +1,206 @@
-from fastapi import FastAPI, Security, HTTPException
-from fastapi.security import HTTPBearer
+from fastapi import FastAPI, Security, HTTPException, Response
+from fastapi.responses import JSONResponse
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from pydantic import BaseModel
 import asyncio
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 from importlib import import_module
-import uuid
+import logging
+import os
+import time
+
+from api.jobs import CANCEL_GRACE, Job, JobRegistry
+from api.tenancy import (SCHEDULER_CLIENT, Client, FairQueue, QuotaExceeded, UnknownProxyGroup,
+                         job_cost, queue_headers)
+from core.admission import AdmissionController
+from core.logs import configure_logging
+from core.scheduler import Scheduler, load_schedule
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Scraper API")
 security = HTTPBearer()
+# Shared with batch runs in this process: jobs queue for a slot instead of being rejected
+admission = AdmissionController()
+jobs = JobRegistry()
+# Per-client fair queuing and quotas in front of admission, from API_CLIENTS_FILE
+tenants = FairQueue.from_env(admission)
+# Periodic scrapes from the SCHEDULE_FILE manifest, started with the app
+scheduler: Optional[Scheduler] = None
 
 class ScrapeRequest(BaseModel):
     urls: List[str]
     proxy_group: str = 'default'
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+    # Total seconds for the job; it stops with partial results when they run out
+    timeout: Optional[float] = None
+
+@app.on_event('startup')
+async def start_admission():
+    configure_logging()
+    await admission.start()
+    await tenants.start()
+
+@app.on_event('shutdown')
+async def stop_admission():
+    await tenants.stop()
+    await admission.stop()
+
+def current_client(credentials: HTTPAuthorizationCredentials = Security(security)) -> Client:
+    """The client the bearer token belongs to"""
+    client = tenants.identify(credentials.credentials)
+    if client is None:
+        raise HTTPException(status_code=401, detail="Unknown API token",
+                            headers={'WWW-Authenticate': 'Bearer'})
+    return client
+
+def admin_client(client: Client = Security(current_client)) -> Client:
+    """The calling client, if it may see process-wide status"""
+    if not client.admin:
+        raise HTTPException(status_code=403, detail="Admin client required")
+    return client
+
+@app.on_event('startup')
+async def start_scheduler():
+    global scheduler
+    schedule_file = os.getenv('SCHEDULE_FILE')
+    if schedule_file:
+        scheduler = Scheduler(
+            load_schedule(schedule_file), run_scheduled,
+            db_path=os.getenv('SCHEDULE_DB', 'scheduler.db'),
+            max_concurrent=int(os.getenv('SCHEDULE_CONCURRENCY', 2)),
+            overlap=os.getenv('SCHEDULE_OVERLAP', 'skip')
+        )
+        await scheduler.start()
+
+@app.on_event('shutdown')
+async def stop_scheduler():
+    if scheduler:
+        await scheduler.stop()
+
+async def run_scheduled(entry: dict):
+    """Run a schedule entry as an ordinary job, so it queues for admission and can be cancelled"""
+    site = entry.get('site', 'gemini')
+    module = import_module(f'sites.{site}.scraper')
+    request = ScrapeRequest(urls=entry.get('urls', []), timeout=entry.get('timeout'),
+                            proxy_group=entry.get('proxy_group', 'default'))
+    job = jobs.add(Job(site, module.Scraper(), timeout=request.timeout,
+                       client=SCHEDULER_CLIENT, proxy_group=request.proxy_group))
+    client = tenants.client(SCHEDULER_CLIENT)
+    job.task = asyncio.create_task(run_job(job, request, client))
+    result = await job.task
+    if job.status == 'failed':
+        raise RuntimeError(job.error)
+    return result
+
+async def run_job(job: Job, request: ScrapeRequest, client: Client):
+    """Run a job to completion and return its results; failures are recorded on the job"""
+    scraper = job.scraper
+    result = None
+    try:
+        pool = tenants.pool(request.proxy_group)
+        async with tenants.slot(job.id, client, pool, job_cost(request.urls)):
+            if job.status == 'queued':
+                job.status = 'running'
+            job.started_at = time.time()
+            if hasattr(scraper, 'pre_scrape_check'):
+                await scraper.pre_scrape_check(admission)
+            options = {'since': request.since, 'until': request.until}
+            if request.timeout:
+                options['timeout'] = request.timeout
+            # The scraper enforces the timeout itself; this is the backstop if it hangs
+            backstop = request.timeout + CANCEL_GRACE if request.timeout else None
+            result = await asyncio.wait_for(scraper.scrape(request.urls, **options), backstop)
+            job.count = len(result) if result is not None else 0
+            job.status = 'cancelled' if job.status == 'cancelling' else 'done'
+    except asyncio.CancelledError:
+        job.status = 'cancelled'
+    except asyncio.TimeoutError:
+        # Keep whatever the scraper had collected before it was stopped
+        logger.warning(f"Job {job.id} overran its deadline, keeping partial results")
+        result = list(getattr(scraper, 'results', None) or [])
+        job.count = len(result)
+        job.cut_off = True
+        job.status = 'done'
+    except Exception as e:
+        logger.error(f"Job {job.id} failed: {str(e)}")
+        job.status = 'failed'
+        job.error = str(e)
+    finally:
+        job.finished_at = time.time()
+    return result
+
+@app.get('/schedule')
+async def schedule_status(client: Client = Security(admin_client)):
+    """Next run, learned interval and last outcome of every scheduled entry; admin clients only"""
+    return await scheduler.status() if scheduler else []
+
+@app.get('/admission')
+async def admission_status(client: Client = Security(admin_client)):
+    """Current concurrency limit, running and queued jobs, the latest resource sample,
+    and the fair queue with its proxy-group pools; admin clients only"""
+    return {**admission.snapshot(), 'fair_queue': tenants.snapshot()}
+
+@app.get('/quota')
+async def quota_status(response: Response, client: Client = Security(current_client)):
+    """The caller's quotas and current usage"""
+    response.headers.update(client.quota_headers())
+    return client.snapshot()
 
 @app.post('/scrape/{site}')
-async def scrape_site(site: str, request: ScrapeRequest, token: str = Security(security)):
+async def scrape_site(site: str, request: ScrapeRequest, response: Response,
+                      client: Client = Security(current_client)):
     """Initiate new scraping job with proxy rotation"""
+    # Rejected requests are not charged to the rate quota
+    try:
+        tenants.pool(request.proxy_group)
+    except UnknownProxyGroup as e:
+        raise HTTPException(status_code=400, detail=str(e))
     try:
         module = import_module(f'sites.{site}.scraper')
-        scraper = module.Scraper()
-        job_id = str(uuid.uuid4())
-        asyncio.create_task(scraper.scrape(request.urls))
-        return {'job_id': job_id}
     except ModuleNotFoundError:
         raise HTTPException(status_code=404, detail=f"Site '{site}' not found")
+    try:
+        client.take()
+    except QuotaExceeded as e:
+        headers = client.quota_headers()
+        headers['Retry-After'] = str(max(1, round(e.retry_after)))
+        return JSONResponse(status_code=429, content={'detail': str(e)}, headers=headers)
+    scraper = module.Scraper()
+    job = jobs.add(Job(site, scraper, timeout=request.timeout,
+                       client=client.name, proxy_group=request.proxy_group))
+    job.task = asyncio.create_task(run_job(job, request, client))
+    # Let the job reach the fair queue so its position is known
+    await asyncio.sleep(0)
+    headers = queue_headers(tenants, client, job.id)
+    response.headers.update(headers)
+    position = headers.get('X-Queue-Position')
+    return {'job_id': job.id, 'queued': admission.waiting + tenants.queued,
+            'queue_position': int(position) if position else None}
+
+def find_job(job_id: str, client: Client) -> Job:
+    """A job of the calling client; other clients' jobs are reported as missing"""
+    job = jobs.get(job_id)
+    if job is None or job.client != client.name:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    return job
+
+@app.get('/jobs/{job_id}')
+async def job_status(job_id: str, response: Response, client: Client = Security(current_client)):
+    """Status of a job, with its result count, whether it was truncated and, while
+    queued, its place in the fair queue"""
+    job = find_job(job_id, client)
+    headers = queue_headers(tenants, client, job.id)
+    response.headers.update(headers)
+    position = headers.get('X-Queue-Position')
+    return {**job.to_dict(), 'queue_position': int(position) if position else None}
+
+@app.post('/jobs/{job_id}/cancel')
+async def cancel_job(job_id: str, client: Client = Security(current_client)):
+    """Cancel a job. Queued jobs are dropped; running ones stop at their next check
+    and keep what they collected, or are cancelled outright after a grace period"""
+    job = find_job(job_id, client)
+    await jobs.cancel(job)
+    return job.to_dict()
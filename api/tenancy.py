@@ -0,0 +1,315 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Client that scheduled runs are queued under
+SCHEDULER_CLIENT = 'scheduler'
+# Client every token shares when no client list is configured
+OPEN_CLIENT = 'anonymous'
+# Internal client names a configured tenant may not take
+RESERVED_CLIENTS = (SCHEDULER_CLIENT, OPEN_CLIENT)
+# How often dispatch is retried without an event, to pick up admission limit changes
+DISPATCH_INTERVAL = 0.5
+
+class QuotaExceeded(Exception):
+    """The client has used up its request-rate quota"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate quota exceeded, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+class UnknownProxyGroup(Exception):
+    """The request named a proxy group with no capacity pool"""
+
+class Client:
+    """One API tenant: its quotas, rate bucket and fair-queuing state.
+
+    `weight` is the client's share of dispatch under contention,
+    `max_concurrent` caps its running jobs, and `rate_per_minute`/`burst`
+    size a token bucket that job submissions draw from. `admin` clients
+    may read the process-wide status endpoints.
+    """
+
+    def __init__(self, name: str, weight: float = 1.0, max_concurrent: Optional[int] = None,
+                 rate_per_minute: Optional[float] = None, burst: Optional[int] = None, admin: bool = False):
+        self.name = name
+        self.admin = admin
+        self.weight = weight
+        self.max_concurrent = max_concurrent
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst or (max(1, int(rate_per_minute)) if rate_per_minute else None)
+        self.tokens = float(self.burst) if self.burst else math.inf
+        self.refilled_at = time.monotonic()
+        self.active = 0
+        self.last_finish = 0.0
+        self.queue: Deque['Ticket'] = deque()
+
+    def refill(self) -> None:
+        if not self.rate_per_minute:
+            return
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate_per_minute / 60)
+        self.refilled_at = now
+
+    def take(self) -> None:
+        """Spend one request from the rate quota, or raise QuotaExceeded"""
+        if not self.rate_per_minute:
+            return
+        self.refill()
+        if self.tokens < 1:
+            raise QuotaExceeded((1 - self.tokens) * 60 / self.rate_per_minute)
+        self.tokens -= 1
+
+    def quota_headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.rate_per_minute:
+            self.refill()
+            headers['X-RateLimit-Limit'] = str(self.burst)
+            headers['X-RateLimit-Remaining'] = str(int(self.tokens))
+            headers['X-RateLimit-Reset'] = str(math.ceil((self.burst - self.tokens) * 60 / self.rate_per_minute))
+        if self.max_concurrent:
+            headers['X-Concurrency-Limit'] = str(self.max_concurrent)
+        headers['X-Concurrency-Active'] = str(self.active)
+        return headers
+
+    def snapshot(self) -> Dict:
+        self.refill()
+        return {
+            'client': self.name,
+            'admin': self.admin,
+            'weight': self.weight,
+            'max_concurrent': self.max_concurrent,
+            'active': self.active,
+            'queued': len(self.queue),
+            'rate_per_minute': self.rate_per_minute,
+            'burst': self.burst,
+            'tokens': None if math.isinf(self.tokens) else round(self.tokens, 2),
+        }
+
+class Pool:
+    """Isolated capacity for one proxy group, so one group's load cannot take another's slots"""
+
+    def __init__(self, name: str, max_concurrent: Optional[int] = None):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.active = 0
+
+    @property
+    def available(self) -> bool:
+        return self.max_concurrent is None or self.active < self.max_concurrent
+
+class Ticket:
+    __slots__ = ('job_id', 'client', 'pool', 'start_tag', 'finish_tag', 'future', 'dispatched')
+
+    def __init__(self, job_id: str, client: Client, pool: Pool, start_tag: float, finish_tag: float):
+        self.job_id = job_id
+        self.client = client
+        self.pool = pool
+        self.start_tag = start_tag
+        self.finish_tag = finish_tag
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.dispatched = False
+
+class FairQueue:
+    """Weighted fair queuing of jobs across clients, in front of the admission controller.
+
+    Each job gets a virtual finish tag when queued: it starts at the later of
+    the current virtual time and the client's previous tag, and adds
+    cost / weight. Whenever the admission controller has a free slot, the
+    eligible job with the smallest tag is dispatched. A client submitting
+    faster than its share only queues behind itself, so every client sees
+    latency in proportion to its own load. A job is eligible when its client
+    is below `max_concurrent` and its proxy group's pool has room.
+
+    Clients come from the API_CLIENTS_FILE JSON:
+
+        {"clients": [{"name": "...", "token": "...", "weight": 2, "max_concurrent": 4,
+                      "rate_per_minute": 60, "burst": 10, "admin": true}],
+         "default": {"weight": 1, "max_concurrent": 2},
+         "proxy_groups": {"default": {"max_concurrent": 8}, "residential": {"max_concurrent": 2}}}
+
+    Without a file, every bearer token is accepted as one shared admin
+    client with the default quotas, so quotas hold however many tokens are
+    made up, and proxy groups get unbounded pools on first use.
+    """
+
+    def __init__(self, admission, config: Optional[Dict] = None):
+        config = config or {}
+        self.admission = admission
+        self.default_quota = config.get('default', {})
+        self.clients_by_token: Dict[str, Client] = {}
+        self.clients: Dict[str, Client] = {}
+        for entry in config.get('clients', []):
+            if entry['name'] in RESERVED_CLIENTS:
+                raise ValueError(f"Client name {entry['name']!r} is reserved for internal use")
+            quota = {key: value for key, value in entry.items() if key not in ('name', 'token')}
+            client = self.clients[entry['name']] = Client(entry['name'], **quota)
+            self.clients_by_token[entry['token']] = client
+        # Only configured tokens are accepted once a client list exists
+        self.open = not self.clients_by_token
+        self.fixed_pools = 'proxy_groups' in config
+        self.pools: Dict[str, Pool] = {
+            name: Pool(name, settings.get('max_concurrent'))
+            for name, settings in config.get('proxy_groups', {}).items()
+        }
+        self.virtual_time = 0.0
+        self.starting = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls, admission) -> 'FairQueue':
+        path = os.getenv('API_CLIENTS_FILE')
+        if not path:
+            logger.warning("API_CLIENTS_FILE is not set, every bearer token is accepted as one shared client")
+            return cls(admission)
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(admission, json.load(f))
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(DISPATCH_INTERVAL)
+            self.dispatch()
+
+    def identify(self, token: str) -> Optional[Client]:
+        """The client a token belongs to; None for unknown tokens once clients are configured"""
+        client = self.clients_by_token.get(token)
+        if client is None and self.open:
+            if OPEN_CLIENT not in self.clients:
+                self.clients[OPEN_CLIENT] = Client(OPEN_CLIENT, **{'admin': True, **self.default_quota})
+            client = self.clients[OPEN_CLIENT]
+        return client
+
+    def client(self, name: str) -> Client:
+        """A named internal client, such as the scheduler's"""
+        if name not in self.clients:
+            self.clients[name] = Client(name, **self.default_quota)
+        return self.clients[name]
+
+    def pool(self, name: str) -> Pool:
+        if name not in self.pools:
+            if self.fixed_pools:
+                raise UnknownProxyGroup(f"Unknown proxy group: {name}")
+            self.pools[name] = Pool(name)
+        return self.pools[name]
+
+    def enqueue(self, job_id: str, client: Client, pool: Pool, cost: float) -> Ticket:
+        start_tag = max(self.virtual_time, client.last_finish)
+        finish_tag = start_tag + cost / client.weight
+        client.last_finish = finish_tag
+        ticket = Ticket(job_id, client, pool, start_tag, finish_tag)
+        client.queue.append(ticket)
+        return ticket
+
+    @property
+    def queued(self) -> int:
+        return sum(len(client.queue) for client in self.clients.values())
+
+    def has_capacity(self) -> bool:
+        # One job beyond the limit is let through to wait inside admission,
+        # which only raises its limit while something is waiting there
+        return self.admission.active + self.starting <= self.admission.limit
+
+    def next_ticket(self) -> Optional[Ticket]:
+        best = None
+        for client in self.clients.values():
+            if client.max_concurrent is not None and client.active >= client.max_concurrent:
+                continue
+            # A client's tags increase along its queue, so its first eligible ticket is its best
+            ticket = next((ticket for ticket in client.queue if ticket.pool.available), None)
+            if ticket and (best is None or ticket.finish_tag < best.finish_tag):
+                best = ticket
+        return best
+
+    def dispatch(self) -> None:
+        while self.has_capacity():
+            ticket = self.next_ticket()
+            if ticket is None:
+                return
+            ticket.client.queue.remove(ticket)
+            self.virtual_time = max(self.virtual_time, ticket.start_tag)
+            ticket.client.active += 1
+            ticket.pool.active += 1
+            self.starting += 1
+            ticket.dispatched = True
+            ticket.future.set_result(None)
+
+    def release(self, ticket: Ticket) -> None:
+        ticket.client.active -= 1
+        ticket.pool.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, job_id: str, client: Client, pool: Pool, cost: float = 1.0):
+        """Queue fairly for dispatch, then hold an admission slot for the body"""
+        ticket = self.enqueue(job_id, client, pool, cost)
+        self.dispatch()
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            if ticket.dispatched:
+                self.starting -= 1
+                self.release(ticket)
+            else:
+                client.queue.remove(ticket)
+            self.dispatch()
+            raise
+        started = False
+        try:
+            async with self.admission.slot():
+                self.starting -= 1
+                started = True
+                yield
+        finally:
+            if not started:
+                self.starting -= 1
+            self.release(ticket)
+            self.dispatch()
+
+    def position(self, job_id: str) -> Optional[int]:
+        """1-based place of a queued job in dispatch order, or None when it is not queued"""
+        queued = sorted((ticket for client in self.clients.values() for ticket in client.queue),
+                        key=lambda ticket: ticket.finish_tag)
+        for i, ticket in enumerate(queued):
+            if ticket.job_id == job_id:
+                return i + 1
+        return None
+
+    def snapshot(self) -> Dict:
+        return {
+            'virtual_time': self.virtual_time,
+            'queued': self.queued,
+            'pools': [{'proxy_group': pool.name, 'max_concurrent': pool.max_concurrent, 'active': pool.active}
+                      for pool in self.pools.values()],
+        }
+
+def queue_headers(queue: FairQueue, client: Client, job_id: str) -> Dict[str, str]:
+    headers = client.quota_headers()
+    position = queue.position(job_id)
+    if position is not None:
+        headers['X-Queue-Position'] = str(position)
+    return headers
+
+def job_cost(urls: List[str]) -> float:
+    """Jobs are weighed by URL count, so a 50-URL job uses more of its client's share than a 1-URL job"""
+    return float(max(1, len(urls)))
+
@@ -0,0 +1,60 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from api import main
+from api.jobs import Job
+from api.tenancy import FairQueue
+from core.admission import AdmissionController
+
+class StuckScraper:
+    """Collects one result, then ignores its own timeout"""
+
+    def __init__(self):
+        self.results = []
+        self.truncated = False
+
+    async def scrape(self, urls, since=None, until=None, timeout=None):
+        self.results.append({'timestamp': None, 'content': 'collected before the hang'})
+        await asyncio.Event().wait()
+
+class PromptScraper:
+    """Stops at its own deadline and reports partial results"""
+
+    def __init__(self):
+        self.truncated = False
+
+    async def scrape(self, urls, since=None, until=None, timeout=None):
+        self.truncated = timeout is not None
+        return [{'timestamp': None, 'content': url} for url in urls]
+
+class RunJobTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tenants = FairQueue(AdmissionController())
+        for name, value in (('tenants', self.tenants), ('CANCEL_GRACE', 0.05)):
+            patcher = mock.patch.object(main, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = self.tenants.identify('token')
+
+    async def test_backstop_keeps_partial_results(self):
+        job = Job('gemini', StuckScraper(), timeout=0.05)
+        request = main.ScrapeRequest(urls=['https://example.test/app'], timeout=0.05)
+        result = await main.run_job(job, request, self.client)
+        self.assertEqual(result, job.scraper.results)
+        self.assertEqual((job.status, job.count), ('done', 1))
+        self.assertTrue(job.cut_off)
+        self.assertTrue(job.truncated)
+        self.assertEqual(self.client.active, 0)
+
+    async def test_scraper_deadline_marks_the_job_truncated(self):
+        job = Job('gemini', PromptScraper(), timeout=5)
+        request = main.ScrapeRequest(urls=['a', 'b'], timeout=5)
+        result = await main.run_job(job, request, self.client)
+        self.assertEqual(len(result), 2)
+        self.assertEqual(job.status, 'done')
+        self.assertFalse(job.cut_off)
+        self.assertTrue(job.truncated)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,206 @@
+import asyncio
+import unittest
+from contextlib import asynccontextmanager
+from unittest import mock
+
+from api.tenancy import SCHEDULER_CLIENT, Client, FairQueue, Pool, QuotaExceeded, UnknownProxyGroup
+
+class FakeAdmission:
+    """Admission controller whose slots are handed out by the test"""
+
+    def __init__(self, limit: int = 100):
+        self.limit = limit
+        self.active = 0
+        self.open = asyncio.Event()
+        self.open.set()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.open.wait()
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+
+class Clock:
+    """Stands in for time.monotonic so buckets refill without waiting"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def drain(queue: FairQueue):
+    """Client names in the order next_ticket() picks their jobs"""
+    order = []
+    while True:
+        ticket = queue.next_ticket()
+        if ticket is None:
+            return order
+        ticket.client.queue.remove(ticket)
+        order.append(ticket.client.name)
+
+class FairQueueTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.admission = FakeAdmission()
+        self.queue = FairQueue(self.admission, {
+            'clients': [
+                {'name': 'heavy', 'token': 'h', 'weight': 2},
+                {'name': 'light', 'token': 'l', 'weight': 1},
+                {'name': 'capped', 'token': 'c', 'max_concurrent': 1},
+            ],
+            'proxy_groups': {'default': {'max_concurrent': 8}, 'residential': {'max_concurrent': 1}},
+        })
+        self.heavy, self.light, self.capped = (self.queue.identify(token) for token in 'hlc')
+        self.pool = self.queue.pool('default')
+
+    async def test_dispatches_by_weighted_finish_tag(self):
+        for _ in range(4):
+            self.queue.enqueue('job', self.heavy, self.pool, 1)
+            self.queue.enqueue('job', self.light, self.pool, 1)
+        self.assertEqual(drain(self.queue), ['heavy', 'heavy', 'light', 'heavy', 'heavy', 'light', 'light', 'light'])
+
+    async def test_flooding_client_only_queues_behind_itself(self):
+        for i in range(10):
+            self.queue.enqueue(f'heavy-{i}', self.heavy, self.pool, 2)
+        self.queue.enqueue('light-0', self.light, self.pool, 1)
+        self.assertEqual(self.queue.position('light-0'), 2)
+        self.assertEqual(self.queue.position('heavy-9'), 11)
+        self.assertIsNone(self.queue.position('unknown'))
+
+    async def test_cost_counts_against_the_share(self):
+        self.queue.enqueue('big', self.heavy, self.pool, 50)
+        self.queue.enqueue('small', self.light, self.pool, 1)
+        self.assertEqual(drain(self.queue), ['light', 'heavy'])
+
+    async def test_client_at_max_concurrent_is_not_eligible(self):
+        self.queue.enqueue('capped', self.capped, self.pool, 1)
+        self.queue.enqueue('light', self.light, self.pool, 5)
+        self.capped.active = 1
+        self.assertEqual(drain(self.queue), ['light'])
+        self.capped.active = 0
+        self.assertEqual(drain(self.queue), ['capped'])
+
+    async def test_full_pool_does_not_block_other_pools(self):
+        residential = self.queue.pool('residential')
+        residential.active = 1
+        self.queue.enqueue('stuck', self.heavy, residential, 1)
+        self.queue.enqueue('free', self.heavy, self.pool, 1)
+        self.queue.enqueue('other', self.light, residential, 1)
+        self.assertEqual(self.queue.next_ticket().job_id, 'free')
+        self.assertEqual(drain(self.queue), ['heavy'])
+        self.assertEqual(self.queue.queued, 2)
+
+    def test_unknown_pool_is_rejected_when_groups_are_configured(self):
+        with self.assertRaises(UnknownProxyGroup):
+            self.queue.pool('mobile')
+        self.assertIsInstance(FairQueue(self.admission).pool('mobile'), Pool)
+
+    def test_reserved_client_names_are_rejected(self):
+        for name in (SCHEDULER_CLIENT, 'anonymous'):
+            with self.subTest(name=name), self.assertRaises(ValueError):
+                FairQueue(self.admission, {'clients': [{'name': name, 'token': 't'}]})
+
+    def test_open_mode_shares_one_client(self):
+        queue = FairQueue(self.admission, {'default': {'max_concurrent': 2}})
+        self.assertIs(queue.identify('a'), queue.identify('b'))
+        self.assertTrue(queue.identify('a').admin)
+        self.assertIsNone(self.queue.identify('made-up'))
+
+    async def test_slot_holds_and_releases_counters(self):
+        async with self.queue.slot('job', self.heavy, self.pool):
+            self.assertEqual((self.heavy.active, self.pool.active, self.queue.starting), (1, 1, 0))
+            self.assertEqual(self.admission.active, 1)
+        self.assertEqual((self.heavy.active, self.pool.active, self.queue.starting), (0, 0, 0))
+
+    async def run_slot(self, client: Client):
+        async with self.queue.slot('job', client, self.pool):
+            await asyncio.Event().wait()
+
+    async def cancel(self, task: asyncio.Task):
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+
+    def assertReleased(self, client: Client):
+        self.assertEqual(list(client.queue), [])
+        self.assertEqual((client.active, self.pool.active, self.queue.starting), (0, 0, 0))
+
+    async def test_cancel_while_queued(self):
+        # No capacity: the job stays queued
+        self.admission.active, self.admission.limit = 1, 0
+        task = asyncio.create_task(self.run_slot(self.light))
+        await asyncio.sleep(0)
+        self.assertEqual(len(self.light.queue), 1)
+        await self.cancel(task)
+        self.assertReleased(self.light)
+
+    async def test_cancel_between_dispatch_and_admission(self):
+        self.admission.active, self.admission.limit = 1, 0
+        task = asyncio.create_task(self.run_slot(self.light))
+        await asyncio.sleep(0)
+        self.admission.active, self.admission.limit = 0, 1
+        self.queue.dispatch()
+        self.assertEqual(self.queue.starting, 1)
+        await self.cancel(task)
+        self.assertReleased(self.light)
+
+    async def test_cancel_while_waiting_for_admission(self):
+        self.admission.open.clear()
+        task = asyncio.create_task(self.run_slot(self.light))
+        await asyncio.sleep(0)
+        self.assertEqual((self.light.active, self.queue.starting), (1, 1))
+        await self.cancel(task)
+        self.assertReleased(self.light)
+
+    async def test_cancel_while_running_dispatches_the_next_job(self):
+        self.admission.limit = 0
+        first = asyncio.create_task(self.run_slot(self.light))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(self.run_slot(self.heavy))
+        await asyncio.sleep(0)
+        self.assertEqual(len(self.heavy.queue), 1)
+        await self.cancel(first)
+        await asyncio.sleep(0)
+        self.assertEqual((self.heavy.active, len(self.heavy.queue)), (1, 0))
+        await self.cancel(second)
+        self.assertReleased(self.heavy)
+
+class ClientQuotaTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch('api.tenancy.time.monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = Client('reports', rate_per_minute=60, burst=2)
+
+    def test_take_spends_the_burst_then_raises(self):
+        self.client.take()
+        self.client.take()
+        with self.assertRaises(QuotaExceeded) as raised:
+            self.client.take()
+        self.assertAlmostEqual(raised.exception.retry_after, 1.0)
+
+    def test_refill_is_proportional_and_capped(self):
+        self.client.take()
+        self.client.take()
+        self.clock.now += 0.5
+        with self.assertRaises(QuotaExceeded) as raised:
+            self.client.take()
+        self.assertAlmostEqual(raised.exception.retry_after, 0.5)
+        self.clock.now += 0.5
+        self.client.take()
+        self.clock.now += 1000
+        self.client.refill()
+        self.assertEqual(self.client.tokens, 2)
+
+    def test_without_a_rate_there_is_no_limit(self):
+        client = Client('free')
+        for _ in range(100):
+            client.take()
+        self.assertNotIn('X-RateLimit-Limit', client.quota_headers())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+BROWSER_PROCESS_NAMES = ('chrome', 'chromium', 'headless_shell')
+
+class ResourceProbe:
+    """Latest host sample; read by callers instead of probing on every call"""
+
+    def __init__(self):
+        self.cpu_percent = 0.0
+        self.memory_percent = 0.0
+        self.available_mb = 0.0
+        self.total_mb = 0.0
+        self.browser_rss_mb = 0.0
+        self.process_rss_mb = 0.0
+        self.docker_available: Optional[bool] = None
+        self.sampled_at = 0.0
+
+    def as_dict(self) -> Dict:
+        return dict(vars(self))
+
+def sample_resources(probe: ResourceProbe) -> None:
+    """Blocking psutil sampling; run in a thread by the controller.
+
+    Browser RSS only counts browsers started by this process (through
+    Playwright's driver or chromedriver), not other Chrome instances on the
+    host, so it divided by this process's running jobs is a per-job cost.
+    """
+    memory = psutil.virtual_memory()
+    probe.cpu_percent = psutil.cpu_percent(interval=None)
+    probe.memory_percent = memory.percent
+    probe.available_mb = memory.available / 2**20
+    probe.total_mb = memory.total / 2**20
+    current = psutil.Process()
+    rss = 0
+    for process in current.children(recursive=True):
+        try:
+            name = process.name().lower()
+            if any(browser in name for browser in BROWSER_PROCESS_NAMES):
+                rss += process.memory_info().rss
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+    probe.browser_rss_mb = rss / 2**20
+    probe.process_rss_mb = current.memory_info().rss / 2**20
+    probe.sampled_at = time.time()
+
+_docker_cache = {'available': None, 'checked_at': 0.0}
+
+async def probe_docker() -> bool:
+    try:
+        process = await asyncio.create_subprocess_exec(
+            'docker', 'info', stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+        )
+    except OSError:
+        return False
+    try:
+        return await asyncio.wait_for(process.wait(), timeout=10) == 0
+    except asyncio.TimeoutError:
+        process.kill()
+        return False
+
+async def docker_host_available(ttl: float = 60.0) -> bool:
+    """`docker info` result, re-run at most once per `ttl` seconds"""
+    if _docker_cache['available'] is None or time.monotonic() - _docker_cache['checked_at'] > ttl:
+        _docker_cache.update(available=await probe_docker(), checked_at=time.monotonic())
+    return _docker_cache['available']
+
+class AdmissionController:
+    """Adaptive concurrency limit for scrapes and browser contexts.
+
+    A background task samples CPU, memory and browser RSS every `interval`
+    seconds. The limit grows by one while there is headroom and jobs are
+    waiting, and halves when memory or CPU go past their ceilings. It never
+    drops below `min_slots`, so jobs wait in FIFO order in `slot()` instead of
+    being rejected. Browser RSS per running job caps the limit to what the
+    remaining memory can hold.
+    """
+
+    def __init__(self, min_slots: int = 1, max_slots: Optional[int] = None,
+                 target_memory: float = 75, max_memory: float = 90,
+                 target_cpu: float = 80, max_cpu: float = 95,
+                 interval: float = 2.0, docker_interval: float = 60.0):
+        self.min_slots = min_slots
+        self.max_slots = max_slots or int(os.getenv('MAX_CONCURRENT_SCRAPES', (os.cpu_count() or 1) * 2))
+        self.target_memory = target_memory
+        self.max_memory = max_memory
+        self.target_cpu = target_cpu
+        self.max_cpu = max_cpu
+        self.interval = interval
+        self.docker_interval = docker_interval
+        self.limit = min_slots
+        self.active = 0
+        self.waiting = 0
+        self.probe = ResourceProbe()
+        # Set once the background task has probed Docker
+        self.docker_checked = asyncio.Event()
+        self._condition = asyncio.Condition()
+        self._task = None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        last_docker = 0.0
+        while True:
+            try:
+                if time.monotonic() - last_docker >= self.docker_interval:
+                    self.probe.docker_available = await probe_docker()
+                    last_docker = time.monotonic()
+                    _docker_cache.update(available=self.probe.docker_available, checked_at=last_docker)
+                    self.docker_checked.set()
+                await asyncio.to_thread(sample_resources, self.probe)
+                await self.adjust()
+            except Exception as e:
+                logger.warning(f"Resource sampling failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    async def docker_available(self) -> bool:
+        """The latest Docker probe, waiting for the first one instead of probing again"""
+        if self._task is None:
+            return await docker_host_available()
+        await self.docker_checked.wait()
+        return bool(self.probe.docker_available)
+
+    def memory_cap(self) -> int:
+        """Slots the free memory could hold at the current per-job browser footprint"""
+        if not self.active or not self.probe.browser_rss_mb:
+            return self.max_slots
+        per_slot = self.probe.browser_rss_mb / self.active
+        spare = self.probe.available_mb - (100 - self.max_memory) / 100 * self.probe.total_mb
+        return max(self.min_slots, self.active + int(spare // per_slot))
+
+    async def adjust(self) -> None:
+        probe = self.probe
+        limit = self.limit
+        if probe.memory_percent >= self.max_memory or probe.cpu_percent >= self.max_cpu:
+            limit = max(self.min_slots, limit // 2)
+        elif (probe.memory_percent < self.target_memory and probe.cpu_percent < self.target_cpu
+              and self.waiting and self.active >= limit):
+            limit = min(self.max_slots, limit + 1)
+        limit = max(self.min_slots, min(limit, self.memory_cap()))
+
+        if limit != self.limit:
+            logger.info(f"Admission limit {self.limit} -> {limit} "
+                        f"(cpu {probe.cpu_percent:.0f}%, mem {probe.memory_percent:.0f}%, "
+                        f"browsers {probe.browser_rss_mb:.0f} MiB)")
+            self.limit = limit
+            async with self._condition:
+                self._condition.notify_all()
+
+    @asynccontextmanager
+    async def slot(self):
+        """Wait for a free slot, run the body, then release the slot"""
+        async with self._condition:
+            self.waiting += 1
+            try:
+                await self._condition.wait_for(lambda: self.active < self.limit)
+            finally:
+                self.waiting -= 1
+            self.active += 1
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self.active -= 1
+                self._condition.notify()
+
+    def snapshot(self) -> Dict:
+        return {
+            'limit': self.limit,
+            'active': self.active,
+            'waiting': self.waiting,
+            'probe': self.probe.as_dict()
+        }
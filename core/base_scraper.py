@@ -1,44 +1,162 @@
-from abc import ABC, abstractmethod
-from typing import Dict, Any
+from datetime import datetime
+from typing import Dict, List, Optional
+import asyncio
 import json
+import logging
 import os
-import sys
-import subprocess
-from stealth import Stealth
-import psutil
-
-from core.exceptions import ScraperConfigurationError, ResourceThresholdExceededError
-
-class BaseScraper(ABC):
-    def __init__(self, config_path: str):
-        with open(config_path) as f:
-            self.config = json.load(f)
-        
-    @abstractmethod
+import time
+
+from aiolimiter import AsyncLimiter
+
+from core.admission import AdmissionController, docker_host_available
+from core.driver import Driver, create_driver
+from core.exceptions import ScraperConfigurationError
+from core.plan import CLICK_JS, ExtractionPlan, compile_plan, epoch_ms
+
+logger = logging.getLogger(__name__)
+
+# Site name -> semaphore enforcing the config's `concurrency` across jobs
+_site_slots: Dict[str, asyncio.Semaphore] = {}
+# Site name -> limiter enforcing the config's `rate_limit` across jobs
+_site_limiters: Dict[str, AsyncLimiter] = {}
+
+class BaseScraper:
+    """Site scraper written against core.driver.Driver, so it runs on any backend.
+
+    A site described by a config (schemas/config_schema.json) needs no code:
+    the config is compiled into an ExtractionPlan and extract_data() reads
+    each page with the plan's single script. Sites can still override
+    authenticate() and extract_data(). scrape() walks the URLs within an
+    optional timeout and honours cancel() between and during URLs, returning
+    partial results with `truncated` set. `results` holds what was collected
+    so far, so a caller that has to cancel the scrape can still use it.
+    """
+
+    # Subclasses point this at their site config
+    config_path: Optional[str] = None
+
+    def __init__(self, driver: Optional[Driver] = None, config_path: Optional[str] = None):
+        config_path = config_path or self.config_path
+        self.config = {}
+        self.plan: Optional[ExtractionPlan] = None
+        if config_path:
+            with open(config_path) as f:
+                self.config = json.load(f)
+            self.plan = compile_plan(self.config)
+        self.driver = driver or create_driver()
+        self.since: Optional[datetime] = None
+        self.until: Optional[datetime] = None
+        self.truncated = False
+        self.results: List[Dict[str, str]] = []
+        self.cancelled = asyncio.Event()
+
     async def authenticate(self):
-        pass
+        """Block the config's URLs and load its cookies file, a JSON object of name to value"""
+        if self.plan and self.plan.blocked_urls:
+            await self.driver.block(self.plan.blocked_urls)
+        auth = self.config.get('auth', {})
+        cookies_file = os.getenv(auth['cookies_file_env'], '') if auth.get('cookies_file_env') else ''
+        cookies_file = cookies_file or auth.get('cookies_file')
+        if not cookies_file or not os.path.exists(cookies_file):
+            return
+        with open(cookies_file, 'r') as f:
+            cookies = json.load(f)
+        domain = auth.get('domain', '')
+        await self.driver.add_cookies([
+            {'name': name, 'value': value, 'domain': domain, 'path': '/'} for name, value in cookies.items()
+        ])
 
-    @abstractmethod
-    async def extract_data(self):
-        pass
+    async def paginate(self) -> None:
+        """Click the next/show-more control until it is gone or the list has passed `since`"""
+        plan = self.plan
+        for _ in range(plan.max_clicks):
+            if self.since and plan.oldest_script:
+                oldest = await self.driver.extract(plan.oldest_script)
+                if oldest is not None and oldest < epoch_ms(self.since):
+                    return
+            if not await self.driver.extract(CLICK_JS, plan.next_selector):
+                return
+            await asyncio.sleep(plan.click_delay)
+        logger.warning(f"Stopped paginating {plan.site} after {plan.max_clicks} clicks")
 
-    async def stealth_setup(self):
-        stealth = Stealth(self.page)
-        stealth.randomize_user_agent()
-        stealth.disable_webdriver()
-        await stealth.apply()
+    async def extract_data(self, url: str) -> List[Dict[str, str]]:
+        plan = self.plan
+        if plan is None:
+            raise ScraperConfigurationError(f"{type(self).__name__} has no site config")
+        await self.driver.navigate(url)
+        if await self.driver.wait_for(plan.wait_selectors, timeout=plan.wait_timeout) is None:
+            logger.warning(f"No {plan.site} items appeared at {url}")
+            return []
+        if plan.paginate:
+            await self.paginate()
+        items = await self.driver.extract(plan.script, [epoch_ms(self.since), epoch_ms(self.until)])
+        return plan.records(items)
 
-    def pre_scrape_check(self):
-        # Existing checks
-        if not self.docker_host_available():  # New check
-            raise ScraperConfigurationError("Docker host unavailable")
-        # Original resource checks
-        if psutil.virtual_memory().percent > 90:
-            raise ResourceThresholdExceededError
+    def site_slot(self) -> Optional[asyncio.Semaphore]:
+        if not self.plan or not self.plan.concurrency:
+            return None
+        return _site_slots.setdefault(self.plan.site, asyncio.Semaphore(self.plan.concurrency))
+
+    def site_limiter(self) -> Optional[AsyncLimiter]:
+        if not self.plan or not self.plan.rate_limit:
+            return None
+        requests, seconds = self.plan.rate_limit
+        return _site_limiters.setdefault(self.plan.site, AsyncLimiter(requests, seconds))
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+
+    async def within(self, url: str, remaining: Optional[float]) -> Optional[List[Dict[str, str]]]:
+        """extract_data(url), or None when the time runs out or the job is cancelled first"""
+        task = asyncio.create_task(self.extract_data(url))
+        cancelled = asyncio.create_task(self.cancelled.wait())
+        try:
+            await asyncio.wait({task, cancelled}, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            cancelled.cancel()
+        if task.done():
+            return task.result()
+        task.cancel()
+        return None
+
+    async def scrape(self, urls: List[str], since: Optional[datetime] = None,
+                     until: Optional[datetime] = None, timeout: Optional[float] = None) -> List[Dict[str, str]]:
+        slot = self.site_slot()
+        if slot is None:
+            return await self.run(urls, since, until, timeout)
+        async with slot:
+            return await self.run(urls, since, until, timeout)
 
-    def docker_host_available(self):
+    async def run(self, urls: List[str], since: Optional[datetime], until: Optional[datetime],
+                  timeout: Optional[float]) -> List[Dict[str, str]]:
+        urls = urls or self.config.get('start_urls', [])
+        self.since, self.until = since, until
+        self.truncated = False
+        expires_at = time.monotonic() + timeout if timeout else None
+        results = self.results = []
+        limiter = self.site_limiter()
+        await self.driver.start()
         try:
-            subprocess.run(['docker', 'info'], check=True, capture_output=True)
-            return True
-        except subprocess.CalledProcessError:
-            return False
+            await self.authenticate()
+            for url in urls:
+                if limiter and not self.cancelled.is_set():
+                    await limiter.acquire()
+                remaining = expires_at - time.monotonic() if expires_at is not None else None
+                extracted = None
+                if not self.cancelled.is_set() and (remaining is None or remaining > 0):
+                    extracted = await self.within(url, remaining)
+                if extracted is None:
+                    logger.warning(f"Output truncated at {url}")
+                    self.truncated = True
+                    break
+                results.extend(extracted)
+            return results
+        finally:
+            await self.driver.close()
+
+    async def pre_scrape_check(self, admission: Optional[AdmissionController] = None):
+        # Configuration check only: memory and CPU pressure no longer reject
+        # jobs, they wait in AdmissionController.slot() instead
+        available = await admission.docker_available() if admission else await docker_host_available()
+        if not available:
+            raise ScraperConfigurationError("Docker host unavailable")
@@ -0,0 +1,271 @@
+import asyncio
+import logging
+import os
+import re
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence
+
+from core.exceptions import ScraperConfigurationError
+
+logger = logging.getLogger(__name__)
+
+try:
+    from playwright.async_api import async_playwright
+except ImportError:
+    async_playwright = None
+
+try:
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.common.exceptions import TimeoutException
+except ImportError:
+    webdriver = None
+
+try:
+    from playwright_stealth import stealth_async
+except ImportError:
+    stealth_async = None
+
+Cookie = Dict[str, Any]
+
+# Returns the first selector, in order, that matches anything on the page
+FIRST_MATCH_JS = """
+(selectors) => selectors.find(selector => document.querySelector(selector) !== null) || null
+"""
+
+def wildcard_regex(patterns: Sequence[str]) -> re.Pattern:
+    """One regex matching a whole URL against any of the '*' wildcard patterns.
+
+    '*' matches any run of characters, '/' included, as in Chrome's
+    Network.setBlockedURLs. Playwright's own globs stop '*' at '/', so
+    '*.png' would never match a full URL there.
+    """
+    alternatives = ('.*'.join(re.escape(part) for part in pattern.split('*')) for pattern in patterns)
+    return re.compile('^(?:' + '|'.join(alternatives) + ')$')
+
+def headless_default() -> bool:
+    return os.getenv('SCRAPER_HEADLESS', 'true').lower() not in ('0', 'false', 'no')
+
+class Driver(ABC):
+    """What a site scraper needs from a browser, independent of the backend.
+
+    Scripts passed to extract() are JavaScript function expressions taking
+    one argument, e.g. "(selector) => ...", and must return JSON-serialisable
+    data, so a whole page is read in a single round trip on every backend.
+    Timeouts are in seconds.
+    """
+
+    name = 'driver'
+
+    @abstractmethod
+    async def start(self) -> None:
+        pass
+
+    @abstractmethod
+    async def close(self) -> None:
+        pass
+
+    @abstractmethod
+    async def navigate(self, url: str, timeout: float = 30.0) -> None:
+        pass
+
+    @abstractmethod
+    async def wait_for(self, selectors: Sequence[str], timeout: float = 10.0) -> Optional[str]:
+        """Wait until any of `selectors` matches; the first matching one in order, or None"""
+
+    @abstractmethod
+    async def extract(self, script: str, arg: Any = None) -> Any:
+        pass
+
+    @abstractmethod
+    async def content(self) -> str:
+        pass
+
+    @abstractmethod
+    async def add_cookies(self, cookies: List[Cookie]) -> None:
+        """Cookies as dicts with name, value, domain and path"""
+
+    @abstractmethod
+    async def cookies(self) -> List[Cookie]:
+        pass
+
+    @abstractmethod
+    async def block(self, patterns: Sequence[str]) -> None:
+        """Abort requests whose URL matches any of the '*' wildcard patterns"""
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+class PlaywrightDriver(Driver):
+    name = 'playwright'
+
+    def __init__(self, headless: Optional[bool] = None, user_agent: Optional[str] = None,
+                 proxy: Optional[Dict[str, str]] = None, stealth: bool = False):
+        self.headless = headless_default() if headless is None else headless
+        self.user_agent = user_agent
+        self.proxy = proxy
+        self.stealth = stealth
+        self.playwright = None
+        self.browser = None
+        self.context = None
+        self.page = None
+
+    async def start(self) -> None:
+        if async_playwright is None:
+            raise ScraperConfigurationError("playwright is not installed")
+        self.playwright = await async_playwright().start()
+        self.browser = await self.playwright.chromium.launch(headless=self.headless, proxy=self.proxy)
+        options = {'user_agent': self.user_agent} if self.user_agent else {}
+        self.context = await self.browser.new_context(**options)
+        self.page = await self.context.new_page()
+        if self.stealth and stealth_async is not None:
+            await stealth_async(self.page)
+
+    async def close(self) -> None:
+        if self.browser:
+            await self.browser.close()
+            self.browser = None
+        if self.playwright:
+            await self.playwright.stop()
+            self.playwright = None
+
+    async def navigate(self, url: str, timeout: float = 30.0) -> None:
+        await self.page.goto(url, timeout=timeout * 1000, wait_until='domcontentloaded')
+
+    async def wait_for(self, selectors: Sequence[str], timeout: float = 10.0) -> Optional[str]:
+        # One wait on the union instead of a full timeout per selector
+        try:
+            await self.page.wait_for_selector(', '.join(selectors), timeout=timeout * 1000)
+        except Exception:
+            return None
+        return await self.page.evaluate(FIRST_MATCH_JS, list(selectors))
+
+    async def extract(self, script: str, arg: Any = None) -> Any:
+        return await self.page.evaluate(script, arg)
+
+    async def content(self) -> str:
+        return await self.page.content()
+
+    async def add_cookies(self, cookies: List[Cookie]) -> None:
+        await self.context.add_cookies(cookies)
+
+    async def cookies(self) -> List[Cookie]:
+        return await self.context.cookies()
+
+    async def block(self, patterns: Sequence[str]) -> None:
+        if patterns:
+            await self.context.route(wildcard_regex(patterns), lambda route: route.abort())
+
+@lru_cache(maxsize=None)
+def chromedriver_path() -> str:
+    """Path of the chromedriver binary, resolved once per process.
+
+    CHROMEDRIVER_PATH skips webdriver_manager entirely; otherwise its
+    version lookup and download happen on the first call only.
+    """
+    path = os.getenv('CHROMEDRIVER_PATH')
+    if path:
+        return path
+    from webdriver_manager.chrome import ChromeDriverManager
+    path = ChromeDriverManager().install()
+    logger.info(f"Using chromedriver at {path}")
+    return path
+
+class SeleniumDriver(Driver):
+    """Chrome through Selenium. WebDriver calls block, so each runs in a thread.
+
+    Cookies and URL blocking go through the DevTools protocol, which sets
+    them in one call and without first navigating to each cookie's domain.
+    """
+
+    name = 'selenium'
+
+    def __init__(self, headless: Optional[bool] = None, user_agent: Optional[str] = None,
+                 proxy: Optional[str] = None, window_size: str = '1920,1080'):
+        self.headless = headless_default() if headless is None else headless
+        self.user_agent = user_agent
+        self.proxy = proxy
+        self.window_size = window_size
+        self.webdriver = None
+
+    def options(self) -> 'Options':
+        options = Options()
+        if self.headless:
+            options.add_argument('--headless=new')
+        options.add_argument(f'--window-size={self.window_size}')
+        options.add_argument('--disable-gpu')
+        options.add_argument('--no-sandbox')
+        options.add_argument('--disable-dev-shm-usage')
+        if self.user_agent:
+            options.add_argument(f'--user-agent={self.user_agent}')
+        if self.proxy:
+            options.add_argument(f'--proxy-server={self.proxy}')
+        # Return from get() at DOMContentLoaded, as PlaywrightDriver does
+        options.page_load_strategy = 'eager'
+        return options
+
+    async def start(self) -> None:
+        if webdriver is None:
+            raise ScraperConfigurationError("selenium is not installed")
+        service = Service(await asyncio.to_thread(chromedriver_path))
+        self.webdriver = await asyncio.to_thread(webdriver.Chrome, service=service, options=self.options())
+
+    async def close(self) -> None:
+        if self.webdriver:
+            await asyncio.to_thread(self.webdriver.quit)
+            self.webdriver = None
+
+    def _navigate(self, url: str, timeout: float) -> None:
+        self.webdriver.set_page_load_timeout(timeout)
+        self.webdriver.get(url)
+
+    async def navigate(self, url: str, timeout: float = 30.0) -> None:
+        await asyncio.to_thread(self._navigate, url, timeout)
+
+    def _wait_for(self, selectors: Sequence[str], timeout: float) -> Optional[str]:
+        script = f"return ({FIRST_MATCH_JS})(arguments[0]);"
+        try:
+            return WebDriverWait(self.webdriver, timeout).until(
+                lambda browser: browser.execute_script(script, list(selectors))
+            )
+        except TimeoutException:
+            return None
+
+    async def wait_for(self, selectors: Sequence[str], timeout: float = 10.0) -> Optional[str]:
+        return await asyncio.to_thread(self._wait_for, selectors, timeout)
+
+    async def extract(self, script: str, arg: Any = None) -> Any:
+        return await asyncio.to_thread(self.webdriver.execute_script, f"return ({script})(arguments[0]);", arg)
+
+    async def content(self) -> str:
+        return await asyncio.to_thread(lambda: self.webdriver.page_source)
+
+    async def add_cookies(self, cookies: List[Cookie]) -> None:
+        await asyncio.to_thread(self.webdriver.execute_cdp_cmd, 'Network.setCookies', {'cookies': cookies})
+
+    async def cookies(self) -> List[Cookie]:
+        result = await asyncio.to_thread(self.webdriver.execute_cdp_cmd, 'Network.getAllCookies', {})
+        return result['cookies']
+
+    async def block(self, patterns: Sequence[str]) -> None:
+        await asyncio.to_thread(self.webdriver.execute_cdp_cmd, 'Network.enable', {})
+        await asyncio.to_thread(self.webdriver.execute_cdp_cmd, 'Network.setBlockedURLs', {'urls': list(patterns)})
+
+DRIVERS = {
+    'playwright': PlaywrightDriver,
+    'selenium': SeleniumDriver,
+}
+
+def create_driver(name: Optional[str] = None, **options) -> Driver:
+    """A driver by name, defaulting to SCRAPER_DRIVER or playwright"""
+    name = name or os.getenv('SCRAPER_DRIVER', 'playwright')
+    if name not in DRIVERS:
+        raise ScraperConfigurationError(f"Unknown driver: {name}")
+    return DRIVERS[name](**options)
@@ -0,0 +1,5 @@
+class ScraperConfigurationError(Exception):
+    """The scraper or its environment is not set up to run"""
+
+class ResourceThresholdExceededError(Exception):
+    """The host has no headroom left for another scrape"""
@@ -0,0 +1,76 @@
+import atexit
+import logging
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+import structlog
+
+_listener: Optional[QueueListener] = None
+
+class RecordQueueHandler(QueueHandler):
+    """Enqueue records untouched.
+
+    The stock prepare() formats the message on the calling thread, which is
+    the work being moved off the event loop, and drops the exception info
+    ProcessorFormatter renders.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+def add_record_time(logger, method_name, event_dict):
+    """Timestamp from when the record was created; the listener renders it later"""
+    created = event_dict['_record'].created
+    event_dict['timestamp'] = datetime.fromtimestamp(created, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+    return event_dict
+
+PRE_CHAIN = [
+    structlog.stdlib.add_logger_name,
+    structlog.stdlib.add_log_level,
+    add_record_time,
+    structlog.stdlib.ExtraAdder(),
+]
+
+def configure_logging(level: Optional[str] = None, fmt: Optional[str] = None,
+                      log_file: Optional[str] = None) -> None:
+    """Route stdlib logging through a queue to one rendering handler.
+
+    Callers only enqueue records; a QueueListener thread renders them with
+    structlog as JSON (fmt='json', the default) or readable console lines
+    (fmt='console') and writes them, so the event loop never waits on log
+    I/O. Each line has the logger name, level, the time the record was
+    created and anything passed through ``extra``. Only entry points call this.
+    """
+    global _listener
+    level = (level or os.getenv('LOG_LEVEL', 'INFO')).upper()
+    fmt = fmt or os.getenv('LOG_FORMAT', 'json')
+    log_file = log_file or os.getenv('LOG_FILE')
+
+    renderer = (structlog.processors.JSONRenderer() if fmt == 'json'
+                else structlog.dev.ConsoleRenderer(colors=sys.stderr.isatty()))
+    formatter = structlog.stdlib.ProcessorFormatter(
+        foreign_pre_chain=PRE_CHAIN,
+        processors=[
+            structlog.stdlib.ProcessorFormatter.remove_processors_meta,
+            structlog.processors.format_exc_info,
+            renderer,
+        ],
+    )
+    handler = logging.FileHandler(log_file, encoding='utf-8') if log_file else logging.StreamHandler()
+    handler.setFormatter(formatter)
+
+    if _listener:
+        _listener.stop()
+    else:
+        atexit.register(lambda: _listener.stop())
+    log_queue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    root.handlers[:] = [RecordQueueHandler(log_queue)]
+    root.setLevel(level)
@@ -0,0 +1,208 @@
+import hashlib
+import json
+import logging
+import re
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from jsonschema import Draft7Validator
+
+from core.exceptions import ScraperConfigurationError
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_PATH = Path(__file__).resolve().parent.parent / 'schemas' / 'config_schema.json'
+DEFAULT_WAIT_TIMEOUT = 20.0
+DEFAULT_MAX_CLICKS = 100
+
+# Epoch milliseconds from a raw timestamp: seconds, milliseconds or
+# microseconds since the epoch, or anything Date.parse() accepts
+PARSE_TIME_JS = """
+const parseTime = (raw) => {
+    raw = raw.replace(/"/g, '').trim();
+    if (/^\\d+$/.test(raw)) {
+        const n = Number(raw);
+        return n > 1e14 ? n / 1000 : n > 1e11 ? n : n * 1000;
+    }
+    const parsed = Date.parse(raw);
+    return isNaN(parsed) ? null : parsed;
+};
+"""
+
+# Reads one field of an item as the field spec describes, trying its
+# fallback when empty; null when absent
+READ_FIELD_JS = """
+const readField = (el, field) => {
+    const target = field.selector ? el.querySelector(field.selector) : el;
+    let value = !target ? null : field.attribute ? target.getAttribute(field.attribute)
+        : field.html ? target.innerHTML : target.textContent;
+    if (value !== null && field.pattern) {
+        const match = value.match(new RegExp(field.pattern));
+        value = !match ? null : match[1] !== undefined ? match[1] : match[0];
+    }
+    if (value !== null) value = value.trim() || null;
+    if (value === null) return field.fallback ? readField(el, field.fallback) : null;
+    return field.type === 'timestamp' ? parseTime(value) : value;
+};
+"""
+
+# Fills a template field from fields read before it; null if any is missing
+FILL_TEMPLATE_JS = """
+const fillTemplate = (template, record) => {
+    let missing = false;
+    const value = template.replace(/\\{(\\w+)\\}/g, (_, name) => {
+        if (record[name] === undefined) missing = true;
+        return missing ? '' : String(record[name]);
+    });
+    return missing ? null : value;
+};
+"""
+
+TEMPLATE_NAME = re.compile(r'\{(\w+)\}')
+
+# The spec is substituted as a JSON literal, so nothing in a config is ever
+# spliced into the script as code
+EXTRACT_TEMPLATE = """
+([since, until]) => {
+    const spec = __SPEC__;
+""" + PARSE_TIME_JS + READ_FIELD_JS + FILL_TEMPLATE_JS + """
+    const records = [];
+    for (const el of document.querySelectorAll(spec.items)) {
+        const record = {};
+        let keep = true;
+        for (const field of spec.fields) {
+            const value = field.template ? fillTemplate(field.template, record) : readField(el, field);
+            if (value === null) {
+                if (field.required) { keep = false; break; }
+                continue;
+            }
+            record[field.name] = value;
+        }
+        if (!keep) continue;
+        const time = spec.timeField ? record[spec.timeField] : undefined;
+        if (time !== undefined && ((since !== null && time < since) || (until !== null && time > until))) continue;
+        if (spec.contentField && (record[spec.contentField] || '').length < spec.minLength) continue;
+        records.push(record);
+    }
+    return records;
+}
+"""
+
+# Oldest time among the last few items, which are the oldest on newest-first
+# lists, so pagination can stop once it has passed `since`
+OLDEST_TEMPLATE = """
+() => {
+    const spec = __SPEC__;
+""" + PARSE_TIME_JS + READ_FIELD_JS + """
+    const times = Array.from(document.querySelectorAll(spec.items)).slice(-5)
+        .map(el => readField(el, spec.timeSpec)).filter(time => time !== null);
+    return times.length ? Math.min(...times) : null;
+}
+"""
+
+CLICK_JS = """
+(selector) => {
+    const button = document.querySelector(selector);
+    if (!button || button.disabled) return false;
+    button.click();
+    return true;
+}
+"""
+
+@lru_cache(maxsize=None)
+def validator() -> Draft7Validator:
+    with open(SCHEMA_PATH, 'r', encoding='utf-8') as f:
+        return Draft7Validator(json.load(f))
+
+def validate_config(config: Dict[str, Any]) -> None:
+    errors = sorted(validator().iter_errors(config), key=lambda error: list(error.path))
+    if errors:
+        problems = '; '.join(f"{'/'.join(map(str, error.path)) or '<root>'}: {error.message}" for error in errors)
+        raise ScraperConfigurationError(f"Invalid site config: {problems}")
+
+def config_digest(config: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+def epoch_ms(value: Optional[datetime]) -> Optional[float]:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp() * 1000
+
+class ExtractionPlan:
+    """A validated site config compiled for the driver.
+
+    `script` reads every record on the page in one call and `oldest_script`
+    supports early-stopping pagination; both take their selectors from the
+    config. `wait_selectors` and `wait_timeout` are the wait strategy.
+    """
+
+    def __init__(self, config: Dict[str, Any], digest: str):
+        self.site = config['name']
+        self.digest = digest
+        self.fields = [dict(spec, name=name) for name, spec in config['fields'].items()]
+        for i, field in enumerate(self.fields):
+            earlier = {other['name'] for other in self.fields[:i]}
+            for name in TEMPLATE_NAME.findall(field.get('template', '')):
+                if name not in earlier:
+                    raise ScraperConfigurationError(
+                        f"Field {field['name']} uses {{{name}}}, which is not a field listed before it"
+                    )
+        self.time_fields = [field['name'] for field in self.fields if field.get('type') == 'timestamp']
+        time_spec = next((field for field in self.fields if field.get('type') == 'timestamp'), None)
+        spec = {
+            'items': config['items'],
+            'fields': self.fields,
+            'timeField': time_spec['name'] if time_spec else None,
+            'timeSpec': time_spec,
+            'contentField': config.get('content_field'),
+            'minLength': config.get('min_content_length', 0),
+        }
+        literal = json.dumps(spec)
+        self.script = EXTRACT_TEMPLATE.replace('__SPEC__', literal)
+        self.oldest_script = OLDEST_TEMPLATE.replace('__SPEC__', literal) if time_spec else None
+
+        wait = config.get('wait', {})
+        self.wait_selectors: List[str] = wait.get('selectors', [config['items']])
+        self.wait_timeout: float = wait.get('timeout', DEFAULT_WAIT_TIMEOUT)
+        pagination = config.get('pagination', {'type': 'none'})
+        self.paginate = pagination['type'] == 'click' and bool(pagination.get('selector'))
+        self.next_selector: Optional[str] = pagination.get('selector')
+        self.max_clicks: int = pagination.get('max_clicks', DEFAULT_MAX_CLICKS)
+        self.click_delay: float = pagination.get('delay', 1.0)
+        self.blocked_urls: List[str] = config.get('blocked_urls', [])
+        rate_limit = config.get('rate_limit')
+        self.rate_limit: Optional[Tuple[int, float]] = (
+            (rate_limit['requests'], rate_limit['seconds']) if rate_limit else None
+        )
+        self.concurrency: Optional[int] = config.get('concurrency')
+
+    def records(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Turn the script's output into records, with timestamps as UTC ISO 8601, or None"""
+        for item in items:
+            for name in self.time_fields:
+                value = item.get(name)
+                item[name] = datetime.fromtimestamp(value / 1000, timezone.utc).isoformat() if value is not None else None
+        return items
+
+# (site, config digest) -> plan; configs are compiled once per process
+_plans: Dict[Tuple[str, str], ExtractionPlan] = {}
+
+def compile_plan(config: Dict[str, Any]) -> ExtractionPlan:
+    """The cached plan for a config, validating and compiling it on first use"""
+    digest = config_digest(config)
+    key = (config.get('name'), digest)
+    plan = _plans.get(key)
+    if plan is None:
+        validate_config(config)
+        plan = _plans[key] = ExtractionPlan(config, digest)
+        logger.debug("Compiled extraction plan %s/%s", plan.site, digest)
+    return plan
+
+def load_plan(path: str) -> Tuple[Dict[str, Any], ExtractionPlan]:
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    return config, compile_plan(config)
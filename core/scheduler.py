@@ -0,0 +1,346 @@
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import random
+import re
+import sqlite3
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS schedules (
+    name TEXT PRIMARY KEY,
+    base_interval REAL NOT NULL,
+    interval REAL NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    next_run REAL NOT NULL,
+    slot REAL,
+    running INTEGER NOT NULL DEFAULT 0,
+    pending INTEGER NOT NULL DEFAULT 0,
+    last_start REAL,
+    last_finish REAL,
+    last_new INTEGER,
+    runs INTEGER NOT NULL DEFAULT 0,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS seen (
+    name TEXT NOT NULL,
+    digest BLOB NOT NULL,
+    seen_at REAL,
+    PRIMARY KEY (name, digest)
+) WITHOUT ROWID;
+"""
+
+OVERLAP_POLICIES = ('skip', 'coalesce')
+
+def parse_interval(value) -> float:
+    """Seconds from a number or a string such as '90s', '30m', '6h' or '1d'"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)([smhd]?)', str(value).strip())
+    if not match:
+        raise ValueError(f"Cannot parse interval: {value}")
+    return float(match.group(1)) * {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}[match.group(2)]
+
+def load_schedule(path: str) -> List[Dict]:
+    """Load a JSON list of entries with a unique ``name`` and an ``interval``;
+    ``priority`` and ``jitter`` are optional, other keys are passed to the runner"""
+    with open(path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+    names = set()
+    for entry in entries:
+        if not entry.get('name'):
+            raise ValueError(f"Schedule entry without a name in {path}")
+        if entry['name'] in names:
+            raise ValueError(f"Duplicate schedule entry: {entry['name']}")
+        names.add(entry['name'])
+        entry['interval'] = parse_interval(entry.get('interval', 3600))
+    return entries
+
+class ScheduleStore:
+    """Schedule state in SQLite, so next runs and learned intervals survive restarts.
+
+    Also keeps a digest of every record seen per entry, with when it was
+    last seen, which is how the scheduler tells new records from re-scraped
+    ones. The methods block; Scheduler calls them in a thread, one at a time.
+    """
+
+    def __init__(self, db_path: str):
+        self.conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+        columns = {row['name'] for row in self.conn.execute("PRAGMA table_info(schedules)")}
+        if 'slot' not in columns:
+            self.conn.execute("ALTER TABLE schedules ADD COLUMN slot REAL")
+        self.conn.execute("UPDATE schedules SET slot = next_run WHERE slot IS NULL")
+        columns = {row['name'] for row in self.conn.execute("PRAGMA table_info(seen)")}
+        if 'seen_at' not in columns:
+            self.conn.execute("ALTER TABLE seen ADD COLUMN seen_at REAL")
+        # Digests from before seen_at existed count as seen now
+        self.conn.execute("UPDATE seen SET seen_at = ? WHERE seen_at IS NULL", (time.time(),))
+        # Runs in flight when the process died are not running any more
+        self.conn.execute("UPDATE schedules SET running = 0, pending = 0")
+
+    def sync(self, entries: List[Dict], now: float, catchup: float) -> None:
+        """Add new entries spread evenly across their interval; overdue ones are
+        spread across `catchup` seconds instead of all starting at once"""
+        existing = {row['name']: row for row in self.conn.execute("SELECT * FROM schedules")}
+        by_interval: Dict[float, List[Dict]] = {}
+        for entry in entries:
+            by_interval.setdefault(entry['interval'], []).append(entry)
+
+        for interval, group in by_interval.items():
+            fresh = sorted((e for e in group if e['name'] not in existing), key=lambda e: e['name'])
+            for i, entry in enumerate(fresh):
+                self.conn.execute(
+                    "INSERT INTO schedules (name, base_interval, interval, priority, next_run, slot) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (entry['name'], interval, interval, entry.get('priority', 0),
+                     now + interval * i / len(fresh), now + interval * i / len(fresh))
+                )
+            for entry in group:
+                row = existing.get(entry['name'])
+                if row and (row['base_interval'] != interval or row['priority'] != entry.get('priority', 0)):
+                    self.conn.execute(
+                        "UPDATE schedules SET base_interval = ?, interval = ?, priority = ? WHERE name = ?",
+                        (interval, interval, entry.get('priority', 0), entry['name'])
+                    )
+
+        overdue = [row for row in existing.values() if row['next_run'] < now]
+        overdue.sort(key=lambda row: (-row['priority'], row['next_run']))
+        for i, row in enumerate(overdue):
+            self.set_next_run(row['name'], now + catchup * i / len(overdue))
+
+        names = [entry['name'] for entry in entries]
+        for table in ('schedules', 'seen'):
+            self.conn.execute(
+                f"DELETE FROM {table} WHERE name NOT IN ({','.join('?' * len(names))})", names
+            )
+
+    def set_next_run(self, name: str, next_run: float, slot: Optional[float] = None) -> None:
+        """`slot` is the unjittered planned time the next run belongs to; it defaults to `next_run`"""
+        self.conn.execute(
+            "UPDATE schedules SET next_run = ?, slot = ? WHERE name = ?",
+            (next_run, next_run if slot is None else slot, name)
+        )
+
+    def due(self, now: float) -> List[sqlite3.Row]:
+        return self.conn.execute(
+            "SELECT * FROM schedules WHERE next_run <= ? OR (pending = 1 AND running = 0) "
+            "ORDER BY priority DESC, next_run",
+            (now,)
+        ).fetchall()
+
+    def get(self, name: str) -> sqlite3.Row:
+        return self.conn.execute("SELECT * FROM schedules WHERE name = ?", (name,)).fetchone()
+
+    def mark_started(self, name: str, now: float, next_run: float, slot: float) -> None:
+        """`next_run` is provisional: the run overlaps itself if still going by then"""
+        self.conn.execute(
+            "UPDATE schedules SET running = 1, pending = 0, last_start = ?, next_run = ?, slot = ? "
+            "WHERE name = ?",
+            (now, next_run, slot, name)
+        )
+
+    def mark_pending(self, name: str) -> None:
+        """Run once more as soon as the current run finishes, for the slot it overran"""
+        self.conn.execute("UPDATE schedules SET pending = 1 WHERE name = ?", (name,))
+
+    def mark_finished(self, name: str, now: float, interval: float, next_run: float, slot: float,
+                      new: Optional[int], error: Optional[str]) -> None:
+        self.conn.execute(
+            "UPDATE schedules SET running = 0, last_finish = ?, interval = ?, next_run = ?, slot = ?, "
+            "last_new = ?, runs = runs + 1, error = ? WHERE name = ?",
+            (now, interval, next_run, slot, new, error, name)
+        )
+
+    def count_seen(self, name: str) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM seen WHERE name = ?", (name,)).fetchone()[0]
+
+    def record_seen(self, name: str, digests: Iterable[bytes], now: float, forget_before: float) -> int:
+        """Store digests as seen at `now` and return how many were not seen before.
+
+        Digests last seen before `forget_before` are then dropped, so the
+        table only holds what recent runs could still find. Nothing changes
+        on error.
+        """
+        self.conn.execute('BEGIN')
+        try:
+            before = self.count_seen(name)
+            self.conn.executemany(
+                "INSERT INTO seen (name, digest, seen_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (name, digest) DO UPDATE SET seen_at = excluded.seen_at",
+                ((name, digest, now) for digest in digests)
+            )
+            new = self.count_seen(name) - before
+            self.conn.execute("DELETE FROM seen WHERE name = ? AND seen_at < ?", (name, forget_before))
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        self.conn.execute('COMMIT')
+        return new
+
+    def rows(self) -> List[Dict]:
+        return [dict(row) for row in self.conn.execute("SELECT * FROM schedules ORDER BY next_run")]
+
+class Scheduler:
+    """Runs periodic scrapes per entry without thundering herds.
+
+    Entries sharing an interval start evenly spread across it, and each run
+    is shifted by up to +/- `jitter` of its interval. Runs are planned on a
+    fixed grid: each slot is one interval after the previous planned slot,
+    not after the previous run finished, so run time does not push the
+    schedule later. Slots missed while a run was going are skipped. Higher priority entries
+    are started first when several are due and at most `max_concurrent` run
+    at once. A run that comes due while the previous one is still going is
+    skipped (`overlap='skip'`) or run once as soon as it finishes
+    (`overlap='coalesce'`).
+
+    Intervals adapt to the change rate: a run that finds nothing new
+    stretches the interval by `backoff`, up to `max_factor` times the
+    configured one, and a run with new records shrinks it back, down to
+    `min_factor` times the configured one. Digests of records not seen
+    again for `retain_runs` of the longest adapted interval are forgotten.
+
+    `run(entry)` returns the records scraped (dicts with a ``content`` key)
+    or None, and raises when the scrape failed, so a failure is recorded as
+    an error instead of as a run that found nothing new.
+
+    SQLite calls run in a thread, one at a time, so they never block the
+    loop; the database is opened by start().
+    """
+
+    def __init__(self, entries: List[Dict], run: Callable[[Dict], Awaitable[Optional[List[Dict]]]],
+                 db_path: str = 'scheduler.db', max_concurrent: int = 2, jitter: float = 0.1,
+                 overlap: str = 'skip', backoff: float = 1.5, min_factor: float = 0.5,
+                 max_factor: float = 4.0, tick: float = 1.0, retain_runs: int = 3):
+        if overlap not in OVERLAP_POLICIES:
+            raise ValueError(f"Unknown overlap policy: {overlap}")
+        self.entries = {entry['name']: entry for entry in entries}
+        self.run_entry = run
+        self.db_path = db_path
+        self.store: Optional[ScheduleStore] = None
+        self.db_lock = asyncio.Lock()
+        self.semaphore = asyncio.Semaphore(max(1, max_concurrent))
+        self.jitter = jitter
+        self.overlap = overlap
+        self.backoff = backoff
+        self.min_factor = min_factor
+        self.max_factor = max_factor
+        self.tick = tick
+        self.retain_runs = retain_runs
+        self.running: Dict[str, asyncio.Task] = {}
+        self._task = None
+
+    def plan(self, entry: Dict, slot: float, interval: float, now: float) -> Tuple[float, float]:
+        """The slot after `slot` that is not yet past, and its jittered run time"""
+        slot += interval
+        if slot < now:
+            slot += math.ceil((now - slot) / interval) * interval
+        spread = entry.get('jitter', self.jitter)
+        return slot, max(now, slot + interval * random.uniform(-spread, spread))
+
+    async def db(self, method: str, *args):
+        """Call a ScheduleStore method in a thread, one at a time"""
+        async with self.db_lock:
+            return await asyncio.to_thread(getattr(self.store, method), *args)
+
+    def forget_before(self, row: sqlite3.Row, now: float) -> float:
+        """Digests last seen before this are dropped: `retain_runs` of the longest interval"""
+        return now - row['base_interval'] * self.max_factor * self.retain_runs
+
+    def adapt(self, row: sqlite3.Row, new: Optional[int]) -> float:
+        interval, base = row['interval'], row['base_interval']
+        if new is None:
+            return interval
+        if new == 0:
+            return min(base * self.max_factor, interval * self.backoff)
+        return max(base * self.min_factor, interval / self.backoff)
+
+    async def start(self) -> None:
+        if self._task is None:
+            if self.store is None:
+                self.store = await asyncio.to_thread(ScheduleStore, self.db_path)
+            now = time.time()
+            catchup = min(entry['interval'] for entry in self.entries.values()) / 10 if self.entries else 0
+            await self.db('sync', list(self.entries.values()), now, catchup)
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            for task in self.running.values():
+                task.cancel()
+            await asyncio.gather(self._task, *self.running.values(), return_exceptions=True)
+            self._task = None
+
+    async def serve(self) -> None:
+        """Run until cancelled"""
+        await self.start()
+        try:
+            await self._task
+        finally:
+            await self.stop()
+
+    async def _loop(self) -> None:
+        while True:
+            now = time.time()
+            for row in await self.db('due', now):
+                name = row['name']
+                entry = self.entries[name]
+                if name in self.running:
+                    if row['pending']:
+                        continue
+                    if self.overlap == 'coalesce':
+                        logger.info(f"{name} is still running, coalescing the next run into one")
+                        await self.db('mark_pending', name)
+                    else:
+                        logger.info(f"{name} is still running, skipping this run")
+                        slot, next_run = self.plan(entry, row['slot'], row['interval'], now)
+                        await self.db('set_next_run', name, next_run, slot)
+                    continue
+                slot, next_run = self.plan(entry, row['slot'], row['interval'], now)
+                await self.db('mark_started', name, now, next_run, slot)
+                self.running[name] = asyncio.create_task(self._run(entry, row['slot']))
+            await asyncio.sleep(self.tick)
+
+    async def _run(self, entry: Dict, slot: float) -> None:
+        """Run the entry for its planned `slot` and schedule the next one from it"""
+        name = entry['name']
+        new, error = None, None
+        try:
+            async with self.semaphore:
+                records = await self.run_entry(entry)
+            if records is not None:
+                digests = [hashlib.blake2b(record['content'].encode(), digest_size=8).digest()
+                           for record in records]
+                now = time.time()
+                row = await self.db('get', name)
+                new = await self.db('record_seen', name, digests, now, self.forget_before(row, now))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Scheduled run of {name} failed: {str(e)}")
+            error = str(e)
+        finally:
+            self.running.pop(name, None)
+
+        row = await self.db('get', name)
+        interval = self.adapt(row, new)
+        now = time.time()
+        if row['pending']:
+            # A coalesced run starts right away, for the slot this run overran
+            slot, next_run = row['slot'], now
+        else:
+            slot, next_run = self.plan(entry, slot, interval, now)
+        await self.db('mark_finished', name, now, interval, next_run, slot, new, error)
+        logger.info(f"{name}: {new if new is not None else '?'} new records, "
+                    f"next run in {next_run - now:.0f}s (interval {interval:.0f}s)")
+
+    async def status(self) -> List[Dict]:
+        return await self.db('rows') if self.store else []
@@ -0,0 +1,152 @@
+import copy
+import json
+import unittest
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from core.exceptions import ScraperConfigurationError
+from core.plan import DEFAULT_MAX_CLICKS, DEFAULT_WAIT_TIMEOUT, compile_plan, epoch_ms, load_plan
+
+GEMINI_CONFIG = Path(__file__).resolve().parent.parent / 'sites' / 'gemini' / 'config.json'
+
+def config(**overrides):
+    base = {
+        'name': 'example',
+        'auth': {'cookies_file': 'example_cookies.json'},
+        'items': '.history-item',
+        'fields': {
+            'timestamp': {'selector': 'time', 'attribute': 'datetime', 'type': 'timestamp'},
+            'content': {'selector': '.body', 'required': True},
+        },
+    }
+    base.update(overrides)
+    return base
+
+def spec(script: str):
+    """The JSON literal a compiled script reads its spec from"""
+    line = next(line for line in script.splitlines() if 'const spec = ' in line)
+    return json.loads(line.split('const spec = ', 1)[1].rstrip(';'))
+
+class CompilePlanTest(unittest.TestCase):
+    def test_defaults(self):
+        plan = compile_plan(config())
+        self.assertEqual(plan.site, 'example')
+        self.assertEqual(plan.wait_selectors, ['.history-item'])
+        self.assertEqual(plan.wait_timeout, DEFAULT_WAIT_TIMEOUT)
+        self.assertFalse(plan.paginate)
+        self.assertIsNone(plan.next_selector)
+        self.assertEqual(plan.max_clicks, DEFAULT_MAX_CLICKS)
+        self.assertEqual(plan.blocked_urls, [])
+        self.assertIsNone(plan.rate_limit)
+        self.assertIsNone(plan.concurrency)
+        self.assertEqual(plan.time_fields, ['timestamp'])
+
+    def test_options(self):
+        plan = compile_plan(config(
+            wait={'selectors': ['.list', '.empty'], 'timeout': 5},
+            pagination={'type': 'click', 'selector': 'button.more', 'max_clicks': 50, 'delay': 0.5},
+            rate_limit={'requests': 10, 'seconds': 60},
+            concurrency=2,
+            blocked_urls=['*.png'],
+        ))
+        self.assertEqual((plan.wait_selectors, plan.wait_timeout), (['.list', '.empty'], 5))
+        self.assertTrue(plan.paginate)
+        self.assertEqual((plan.next_selector, plan.max_clicks, plan.click_delay), ('button.more', 50, 0.5))
+        self.assertEqual(plan.rate_limit, (10, 60))
+        self.assertEqual(plan.concurrency, 2)
+        self.assertEqual(plan.blocked_urls, ['*.png'])
+
+    def test_script_carries_fields_in_config_order(self):
+        plan = compile_plan(config(content_field='content', min_content_length=10, fields={
+            'content': {'selector': '.body', 'required': True},
+            'id': {'attribute': 'data-id', 'fallback': {'selector': 'a', 'attribute': 'href', 'pattern': '/(\\w+)$'}},
+            'url': {'template': 'https://example.com/item/{id}'},
+        }))
+        compiled = spec(plan.script)
+        self.assertEqual([field['name'] for field in compiled['fields']], ['content', 'id', 'url'])
+        self.assertEqual(compiled['fields'][1]['fallback']['pattern'], '/(\\w+)$')
+        self.assertEqual((compiled['contentField'], compiled['minLength']), ('content', 10))
+        # No timestamp field: no time filter and no early stop
+        self.assertIsNone(compiled['timeField'])
+        self.assertIsNone(plan.oldest_script)
+
+    def test_oldest_script_reads_the_first_timestamp_field(self):
+        plan = compile_plan(config(fields={
+            'content': {'required': True},
+            'created': {'attribute': 'data-created', 'type': 'timestamp'},
+            'edited': {'attribute': 'data-edited', 'type': 'timestamp'},
+        }))
+        self.assertEqual(plan.time_fields, ['created', 'edited'])
+        self.assertEqual(spec(plan.oldest_script)['timeSpec']['name'], 'created')
+        self.assertEqual(spec(plan.script)['timeField'], 'created')
+
+    def test_config_text_is_data_not_code(self):
+        plan = compile_plan(config(items='"]); alert(1); (["'))
+        self.assertEqual(spec(plan.script)['items'], '"]); alert(1); (["')
+
+    def test_plans_are_cached_by_content(self):
+        first = compile_plan(config())
+        self.assertIs(compile_plan(config()), first)
+        changed = compile_plan(config(min_content_length=3))
+        self.assertIsNot(changed, first)
+        self.assertNotEqual(changed.digest, first.digest)
+
+    def test_records_convert_timestamps(self):
+        plan = compile_plan(config())
+        records = plan.records([{'timestamp': 1700000000000, 'content': 'a'}, {'timestamp': None, 'content': 'b'}])
+        self.assertEqual(records[0]['timestamp'], '2023-11-14T22:13:20+00:00')
+        self.assertIsNone(records[1]['timestamp'])
+
+    def test_gemini_config_compiles(self):
+        loaded, plan = load_plan(str(GEMINI_CONFIG))
+        self.assertEqual(plan.site, loaded['name'])
+        self.assertTrue(plan.paginate)
+        self.assertEqual(plan.rate_limit, (30, 60))
+
+class ValidationTest(unittest.TestCase):
+    def assertInvalid(self, config, *expected):
+        with self.assertRaises(ScraperConfigurationError) as raised:
+            compile_plan(config)
+        for text in expected:
+            self.assertIn(text, str(raised.exception))
+
+    def test_missing_required_keys(self):
+        broken = config()
+        del broken['items'], broken['auth']
+        self.assertInvalid(broken, "<root>: 'auth' is a required property", "<root>: 'items' is a required property")
+
+    def test_error_names_the_path(self):
+        broken = config()
+        broken['fields']['timestamp']['type'] = 'date'
+        self.assertInvalid(broken, 'fields/timestamp/type:')
+
+    def test_unknown_pagination_type(self):
+        self.assertInvalid(config(pagination={'type': 'scroll'}), 'pagination/type:')
+
+    def test_template_must_use_earlier_fields(self):
+        fields = {
+            'url': {'template': 'https://example.com/item/{id}'},
+            'id': {'attribute': 'data-id'},
+        }
+        self.assertInvalid(config(fields=fields), 'Field url uses {id}, which is not a field listed before it')
+
+    def test_template_of_unknown_field(self):
+        fields = copy.deepcopy(config()['fields'])
+        fields['url'] = {'template': '{slug}'}
+        self.assertInvalid(config(fields=fields), 'Field url uses {slug}')
+
+    def test_invalid_config_is_not_cached(self):
+        broken = config(pagination={'type': 'scroll'})
+        for _ in range(2):
+            self.assertInvalid(broken, 'pagination/type:')
+
+class EpochMsTest(unittest.TestCase):
+    def test_naive_times_are_utc(self):
+        aware = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        self.assertEqual(epoch_ms(aware.replace(tzinfo=None)), epoch_ms(aware))
+        self.assertEqual(epoch_ms(aware.astimezone(timezone(timedelta(hours=2)))), epoch_ms(aware))
+        self.assertEqual(epoch_ms(aware), 1704067200000)
+        self.assertIsNone(epoch_ms(None))
+
+if __name__ == "__main__":
+    unittest.main()
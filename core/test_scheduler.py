@@ -0,0 +1,187 @@
+import asyncio
+import sqlite3
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from core.scheduler import ScheduleStore, Scheduler, parse_interval
+
+async def nothing(entry):
+    return []
+
+def row(interval: float, base: float):
+    return {'interval': interval, 'base_interval': base}
+
+class SchedulerTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.db_path = str(Path(tmp.name) / 'scheduler.db')
+
+    def scheduler(self, entries, run=nothing, **options) -> Scheduler:
+        scheduler = Scheduler(entries, run, db_path=self.db_path, **options)
+        self.addAsyncCleanup(scheduler.stop)
+        return scheduler
+
+class PlanTest(SchedulerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.scheduler = Scheduler([], nothing, db_path=self.db_path, jitter=0)
+
+    def test_next_slot_is_one_interval_after_the_planned_one(self):
+        # The run finished late, but the next slot stays on the grid
+        self.assertEqual(self.scheduler.plan({}, 1000, 100, now=1050), (1100, 1100))
+
+    def test_missed_slots_are_skipped(self):
+        self.assertEqual(self.scheduler.plan({}, 1000, 100, now=1350), (1400, 1400))
+        self.assertEqual(self.scheduler.plan({}, 1000, 100, now=1400), (1400, 1400))
+
+    def test_jitter_stays_within_bounds(self):
+        for _ in range(200):
+            slot, next_run = self.scheduler.plan({'jitter': 0.1}, 1000, 100, now=1000)
+            self.assertEqual(slot, 1100)
+            self.assertGreaterEqual(next_run, 1090)
+            self.assertLessEqual(next_run, 1110)
+
+    def test_jitter_never_plans_in_the_past(self):
+        with mock.patch('core.scheduler.random.uniform', return_value=-0.1):
+            self.assertEqual(self.scheduler.plan({'jitter': 0.1}, 1000, 100, now=1095), (1100, 1095))
+
+    def test_interval_adapts_within_bounds(self):
+        adapt = self.scheduler.adapt
+        self.assertEqual(adapt(row(100, 100), 0), 150)
+        self.assertEqual(adapt(row(300, 100), 0), 400)
+        self.assertEqual(adapt(row(150, 100), 3), 100)
+        self.assertEqual(adapt(row(60, 100), 3), 50)
+        self.assertEqual(adapt(row(150, 100), None), 150)
+
+    def test_parse_interval(self):
+        self.assertEqual([parse_interval(v) for v in (90, '90s', '30m', '6h', '1d')],
+                         [90, 90, 1800, 21600, 86400])
+        with self.assertRaises(ValueError):
+            parse_interval('soon')
+
+class ScheduleStoreTest(SchedulerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.store = ScheduleStore(self.db_path)
+
+    def test_new_entries_are_spread_across_the_interval(self):
+        entries = [{'name': name, 'interval': 100} for name in 'abcd']
+        self.store.sync(entries, now=1000, catchup=10)
+        self.assertEqual([r['next_run'] for r in self.store.rows()], [1000, 1025, 1050, 1075])
+
+    def test_record_seen_counts_new_digests(self):
+        self.assertEqual(self.store.record_seen('a', [b'1', b'2'], 1000, 0), 2)
+        self.assertEqual(self.store.record_seen('a', [b'2', b'3'], 1100, 0), 1)
+        self.assertEqual(self.store.record_seen('b', [b'1'], 1100, 0), 1)
+
+    def test_record_seen_forgets_old_digests(self):
+        self.store.record_seen('a', [b'old', b'kept'], 1000, 0)
+        self.store.record_seen('a', [b'kept'], 2000, 0)
+        self.assertEqual(self.store.record_seen('a', [b'new'], 3000, forget_before=1500), 1)
+        self.assertEqual(self.store.count_seen('a'), 2)
+        # A forgotten record counts as new if it comes back
+        self.assertEqual(self.store.record_seen('a', [b'old'], 3100, 0), 1)
+
+    def test_removed_entries_lose_their_digests(self):
+        self.store.record_seen('gone', [b'1'], 1000, 0)
+        self.store.sync([{'name': 'a', 'interval': 100}], now=1000, catchup=10)
+        self.assertEqual(self.store.count_seen('gone'), 0)
+
+    def test_digests_from_before_seen_at_are_migrated(self):
+        self.store.conn.close()
+        Path(self.db_path).unlink()
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE seen (name TEXT NOT NULL, digest BLOB NOT NULL, "
+                     "PRIMARY KEY (name, digest)) WITHOUT ROWID")
+        conn.execute("INSERT INTO seen VALUES ('a', x'01')")
+        conn.commit()
+        conn.close()
+        store = ScheduleStore(self.db_path)
+        self.assertEqual(store.record_seen('a', [b'\x01'], time.time(), time.time() - 60), 0)
+        self.assertEqual(store.count_seen('a'), 1)
+
+class OverlapTest(SchedulerTestCase):
+    """Runs an entry due every 50ms whose first run is held for 200ms and later runs until the end"""
+
+    def setUp(self):
+        super().setUp()
+        self.calls = []
+        self.release = asyncio.Event()
+
+    async def scrape(self, entry):
+        self.calls.append(time.time())
+        await (self.release.wait() if len(self.calls) == 1 else asyncio.Event().wait())
+        return [{'content': f'record {len(self.calls)}'}]
+
+    async def overrun(self, overlap: str) -> Scheduler:
+        scheduler = self.scheduler([{'name': 'a', 'interval': 0.05}], self.scrape,
+                                   overlap=overlap, jitter=0, tick=0.01)
+        await scheduler.start()
+        await asyncio.sleep(0.2)
+        return scheduler
+
+    async def test_skip_drops_runs_that_come_due_meanwhile(self):
+        scheduler = await self.overrun('skip')
+        self.assertEqual(len(self.calls), 1)
+        state = (await scheduler.status())[0]
+        self.assertEqual((state['running'], state['pending']), (1, 0))
+        self.assertGreater(state['next_run'], time.time() - 0.05)
+        self.release.set()
+        await asyncio.sleep(0.03)
+        state = (await scheduler.status())[0]
+        self.assertEqual((state['runs'], state['last_new']), (1, 1))
+        # No backlog of the skipped runs: at most the next slot has started
+        self.assertLessEqual(len(self.calls), 2)
+        self.assertEqual(state['pending'], 0)
+
+    async def test_coalesce_runs_once_right_after(self):
+        scheduler = await self.overrun('coalesce')
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual((await scheduler.status())[0]['pending'], 1)
+        self.release.set()
+        await asyncio.sleep(0.03)
+        self.assertEqual(len(self.calls), 2)
+
+class AdaptiveIntervalTest(SchedulerTestCase):
+    async def run_once(self, scheduler: Scheduler, records) -> dict:
+        scheduler.run_entry = mock.AsyncMock(return_value=records)
+        state = (await scheduler.status())[0]
+        await scheduler._run(scheduler.entries['a'], state['slot'])
+        return (await scheduler.status())[0]
+
+    async def test_interval_follows_new_records(self):
+        scheduler = self.scheduler([{'name': 'a', 'interval': 100}], jitter=0)
+        # The store without the loop, so runs happen only when the test says
+        scheduler.store = ScheduleStore(self.db_path)
+        scheduler.store.sync(list(scheduler.entries.values()), time.time(), 0)
+        first = [{'content': 'a'}]
+        state = await self.run_once(scheduler, first)
+        self.assertEqual(state['last_new'], 1)
+        self.assertAlmostEqual(state['interval'], 100 / 1.5)
+        runs = [await self.run_once(scheduler, first) for _ in range(5)]
+        # Nothing new: x1.5 per run, capped at 4x
+        self.assertEqual([round(state['interval'], 1) for state in runs], [100, 150, 225, 337.5, 400])
+        self.assertEqual(runs[-1]['last_new'], 0)
+        state = await self.run_once(scheduler, first + [{'content': 'b'}])
+        self.assertAlmostEqual(state['interval'], 400 / 1.5)
+        self.assertEqual(state['last_new'], 1)
+        state = await self.run_once(scheduler, None)
+        self.assertAlmostEqual(state['interval'], 400 / 1.5)
+        self.assertEqual(state['runs'], 8)
+
+    async def test_failed_run_keeps_the_interval(self):
+        async def run(entry):
+            raise RuntimeError('login expired')
+
+        scheduler = self.scheduler([{'name': 'a', 'interval': 10}], run, jitter=0, tick=0.005)
+        await scheduler.start()
+        await asyncio.sleep(0.05)
+        state = (await scheduler.status())[0]
+        self.assertEqual((state['interval'], state['last_new'], state['error']), (10, None, 'login expired'))
+
+if __name__ == "__main__":
+    unittest.main()
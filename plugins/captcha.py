@@ -1,10 +1,109 @@
-from twocaptcha import TwoCaptcha
+import asyncio
+import functools
+import logging
 import os
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, Dict, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# reCAPTCHA tokens expire 120 s after issue; keep a safety margin
+DEFAULT_TOKEN_TTL = 110
+
+class CaptchaProvider(ABC):
+    """Backend that turns a (sitekey, url) challenge into a response token"""
+
+    @abstractmethod
+    async def solve(self, sitekey: str, url: str) -> str:
+        pass
+
+class TwoCaptchaProvider(CaptchaProvider):
+    """2Captcha backend; the blocking client polls in a thread pool, off the event loop"""
+
+    def __init__(self, api_key: Optional[str] = None, max_workers: int = 4):
+        from twocaptcha import TwoCaptcha
+        self.solver = TwoCaptcha(api_key or os.getenv('CAPTCHA_API_KEY'))
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='captcha')
+
+    async def solve(self, sitekey: str, url: str) -> str:
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            self.executor, functools.partial(self.solver.recaptcha, sitekey=sitekey, url=url)
+        )
+        return result['code']
+
+class FakeCaptchaProvider(CaptchaProvider):
+    """Local solver for tests and benchmarks with configurable latency"""
+
+    def __init__(self, latency: float = 0.0, token: str = 'fake-captcha-token'):
+        self.latency = latency
+        self.token = token
+        self.calls = 0
+
+    async def solve(self, sitekey: str, url: str) -> str:
+        self.calls += 1
+        call = self.calls
+        await asyncio.sleep(self.latency)
+        return f"{self.token}-{call}"
 
 class CaptchaSolver:
-    def __init__(self):
-        self.solver = TwoCaptcha(os.getenv('CAPTCHA_API_KEY'))
+    """Non-blocking captcha solving with bounded concurrency, timeouts and a token cache.
+
+    Tokens are single-use, so the cache is a pool of unused tokens per
+    (sitekey, url) that expire after ``ttl`` seconds. ``presolve`` fills the
+    pool ahead of an expected challenge; ``solve_recaptcha`` takes a pooled
+    token when one is still valid and solves a new one otherwise.
+    """
+
+    def __init__(self, provider: Optional[CaptchaProvider] = None,
+                 max_concurrency: Optional[int] = None, timeout: Optional[float] = None,
+                 ttl: float = DEFAULT_TOKEN_TTL):
+        self.provider = provider or TwoCaptchaProvider()
+        self.semaphore = asyncio.Semaphore(max_concurrency or int(os.getenv('CAPTCHA_CONCURRENCY', 4)))
+        self.timeout = timeout or float(os.getenv('CAPTCHA_TIMEOUT', 120))
+        self.ttl = ttl
+        self.cache: Dict[Tuple[str, str], Deque[Tuple[str, float]]] = defaultdict(deque)
+        self.presolving: Set[asyncio.Task] = set()
+
+    def cached_token(self, sitekey: str, url: str) -> Optional[str]:
+        tokens = self.cache[(sitekey, url)]
+        now = time.monotonic()
+        while tokens:
+            token, expires = tokens.popleft()
+            if expires > now:
+                return token
+        return None
+
+    async def solve_fresh(self, sitekey: str, url: str) -> Tuple[str, float]:
+        async with self.semaphore:
+            token = await asyncio.wait_for(self.provider.solve(sitekey, url), self.timeout)
+        return token, time.monotonic() + self.ttl
 
     async def solve_recaptcha(self, sitekey, url):
-        result = self.solver.recaptcha(sitekey, url)
-        return result['code']
+        token = self.cached_token(sitekey, url)
+        if token:
+            return token
+        token, _ = await self.solve_fresh(sitekey, url)
+        return token
+
+    async def _presolve_one(self, sitekey: str, url: str) -> None:
+        # Nothing awaits these tasks, so failures are logged here instead of lost
+        try:
+            solved = await self.solve_fresh(sitekey, url)
+        except asyncio.TimeoutError:
+            logger.warning(f"Presolving a captcha for {url} timed out after {self.timeout:.0f}s")
+            return
+        except Exception as e:
+            logger.warning(f"Presolving a captcha for {url} failed: {str(e)}")
+            return
+        self.cache[(sitekey, url)].append(solved)
+
+    def presolve(self, sitekey: str, url: str, count: int = 1) -> None:
+        """Start solving ``count`` tokens in the background for a later challenge"""
+        for _ in range(count):
+            task = asyncio.create_task(self._presolve_one(sitekey, url))
+            self.presolving.add(task)
+            task.add_done_callback(self.presolving.discard)
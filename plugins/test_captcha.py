@@ -0,0 +1,98 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from plugins.captcha import CaptchaSolver, FakeCaptchaProvider
+
+SITEKEY, URL = 'site-key', 'https://example.test/login'
+
+class Clock:
+    """Stands in for time.monotonic so cached tokens expire without waiting"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+class TrackingProvider(FakeCaptchaProvider):
+    """Records the most solves in flight at once"""
+
+    def __init__(self, latency: float = 0.01):
+        super().__init__(latency=latency)
+        self.in_flight = 0
+        self.peak = 0
+
+    async def solve(self, sitekey: str, url: str) -> str:
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            return await super().solve(sitekey, url)
+        finally:
+            self.in_flight -= 1
+
+class FailingProvider(FakeCaptchaProvider):
+    async def solve(self, sitekey: str, url: str) -> str:
+        raise RuntimeError('ERROR_ZERO_BALANCE')
+
+class CaptchaSolverTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.clock = Clock()
+        # Only the module's view of time: the event loop keeps the real clock
+        patcher = mock.patch('plugins.captcha.time', mock.Mock(monotonic=self.clock))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.provider = FakeCaptchaProvider()
+        self.solver = CaptchaSolver(self.provider, max_concurrency=2, timeout=1, ttl=100)
+
+    async def presolve(self, count: int = 1):
+        self.solver.presolve(SITEKEY, URL, count)
+        await asyncio.gather(*self.solver.presolving)
+
+    async def test_presolved_tokens_are_used_once_each(self):
+        await self.presolve(2)
+        tokens = [await self.solver.solve_recaptcha(SITEKEY, URL) for _ in range(3)]
+        self.assertEqual(tokens, ['fake-captcha-token-1', 'fake-captcha-token-2', 'fake-captcha-token-3'])
+        self.assertEqual(self.provider.calls, 3)
+
+    async def test_expired_tokens_are_not_used(self):
+        await self.presolve()
+        self.clock.now += 100
+        self.assertIsNone(self.solver.cached_token(SITEKEY, URL))
+        self.assertEqual(await self.solver.solve_recaptcha(SITEKEY, URL), 'fake-captcha-token-2')
+
+    async def test_tokens_are_kept_per_challenge(self):
+        await self.presolve()
+        self.assertIsNone(self.solver.cached_token(SITEKEY, 'https://example.test/other'))
+        self.assertEqual(self.solver.cached_token(SITEKEY, URL), 'fake-captcha-token-1')
+
+    async def test_concurrency_is_bounded(self):
+        provider = TrackingProvider()
+        solver = CaptchaSolver(provider, max_concurrency=2, timeout=1)
+        await asyncio.gather(*(solver.solve_recaptcha(SITEKEY, URL) for _ in range(6)))
+        self.assertEqual(provider.calls, 6)
+        self.assertEqual(provider.peak, 2)
+
+    async def test_presolve_failure_is_logged(self):
+        self.solver.provider = FailingProvider()
+        with self.assertLogs('plugins.captcha', 'WARNING') as logs:
+            await self.presolve()
+        self.assertIn('ERROR_ZERO_BALANCE', logs.output[0])
+        self.assertIsNone(self.solver.cached_token(SITEKEY, URL))
+
+    async def test_presolve_timeout_is_logged(self):
+        self.solver.provider = FakeCaptchaProvider(latency=10)
+        self.solver.timeout = 0.01
+        with self.assertLogs('plugins.captcha', 'WARNING') as logs:
+            await self.presolve()
+        self.assertIn('timed out', logs.output[0])
+        self.assertEqual(self.solver.presolving, set())
+
+    async def test_solve_timeout_raises(self):
+        self.solver.provider = FakeCaptchaProvider(latency=10)
+        self.solver.timeout = 0.01
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.solver.solve_recaptcha(SITEKEY, URL)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import asyncio
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+class Scraper:
+    """Browserless stand-in for a site scraper, for load-testing the API.
+
+    Each URL takes a random latency around FAKE_SITE_LATENCY seconds, yields
+    FAKE_SITE_ITEMS conversation-shaped records and fails with probability
+    FAKE_SITE_FAILURE_RATE. FAKE_SITE_PAYLOAD sets the content size in bytes,
+    so memory behaves like real results. Honours timeout and cancel() like
+    the Gemini scraper.
+    """
+
+    def __init__(self):
+        self.latency = float(os.getenv('FAKE_SITE_LATENCY', 0.5))
+        self.items = int(os.getenv('FAKE_SITE_ITEMS', 50))
+        self.failure_rate = float(os.getenv('FAKE_SITE_FAILURE_RATE', 0.0))
+        self.payload = int(os.getenv('FAKE_SITE_PAYLOAD', 200))
+        self.truncated = False
+        self.results: List[Dict[str, str]] = []
+        self.cancelled = asyncio.Event()
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+
+    async def pre_scrape_check(self, admission=None) -> None:
+        # Nothing to check: no browser, no docker
+        pass
+
+    def records(self, url: str, since: Optional[datetime], until: Optional[datetime]) -> List[Dict[str, str]]:
+        """One record per minute going back from now, limited to the window"""
+        now = datetime.now(timezone.utc)
+        filler = 'x' * self.payload
+        records = []
+        for i in range(self.items):
+            timestamp = now - timedelta(minutes=i)
+            if (since and timestamp < since) or (until and timestamp > until):
+                continue
+            records.append({
+                'timestamp': timestamp.isoformat(),
+                'content': f"{url} #{i} {filler}",
+                'title': f"Fake conversation {i}",
+            })
+        return records
+
+    async def scrape(self, urls: List[str], since: Optional[datetime] = None,
+                     until: Optional[datetime] = None, timeout: Optional[float] = None) -> List[Dict[str, str]]:
+        since, until = (bound.replace(tzinfo=timezone.utc) if bound and bound.tzinfo is None else bound
+                        for bound in (since, until))
+        expires_at = time.monotonic() + timeout if timeout else None
+        results = self.results = []
+        for url in urls:
+            delay = random.expovariate(1 / self.latency) if self.latency > 0 else 0
+            if expires_at is not None:
+                delay = min(delay, max(0.0, expires_at - time.monotonic()))
+            try:
+                await asyncio.wait_for(self.cancelled.wait(), delay)
+                self.truncated = True
+                break
+            except asyncio.TimeoutError:
+                pass
+            if expires_at is not None and time.monotonic() >= expires_at:
+                self.truncated = True
+                break
+            if random.random() < self.failure_rate:
+                raise RuntimeError(f"Simulated failure for {url}")
+            results.extend(self.records(url, since, until))
+        return results
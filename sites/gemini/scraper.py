@@ -1,7 +1,8 @@
+from pathlib import Path
+
 from core.base_scraper import BaseScraper
-from playwright.async_api import async_playwright
 
-class GeminiScraper(BaseScraper):
-    async def authenticate(self):
-        # Gemini-specific authentication logic
-        pass
+class Scraper(BaseScraper):
+    """Gemini conversation list, described entirely by config.json"""
+
+    config_path = str(Path(__file__).with_name('config.json'))
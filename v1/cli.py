@@ -11,6 +11,12 @@ from gemini_scraper import GeminiScraper
 app = typer.Typer()
 console = Console()
 
+@app.callback()
+def main(log_level: str = typer.Option("INFO", envvar="LOG_LEVEL", help="DEBUG, INFO, WARNING or ERROR")):
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from core.logs import configure_logging
+    configure_logging(log_level, 'console')
+
 def debug_info():
     """Print debug information"""
     console.print("[yellow]Debug Information:[/yellow]")
@@ -4,9 +4,8 @@ import browser_cookie3
 import jwt
 from pathlib import Path
 import logging
+import sys
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 def extract_google_cookies():
@@ -68,5 +67,8 @@ def extract_google_cookies():
         return None
 
 if __name__ == "__main__":
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from core.logs import configure_logging
+    configure_logging()
     print("Extracting Google authentication data...")
     extract_google_cookies()
@@ -0,0 +1,97 @@
+import argparse
+import json
+import re
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+# The JSON literal a batch or index val exports, as written by ValTownService
+EXPORT_DATA = re.compile(r'export const (?:conversations|batches) = (.*?);\nexport', re.DOTALL)
+
+class FakeValTown:
+    """In-memory stand-in for the parts of the Val.Town API that ValTownService uses.
+
+    Vals are created with POST /vals, get new versions with
+    POST /vals/{id}/versions, and run with POST /eval/@{user}/{name}, which
+    slices the data a batch val exports the way its getConversations() does.
+
+    Failures can be queued per request: statuses in `fail_before` are
+    returned without doing anything, and statuses in `fail_after` are
+    returned after the request was applied, like a server that errors or
+    times out once the write went through.
+    """
+
+    def __init__(self, username: str = 'fake'):
+        self.username = username
+        self.vals: Dict[str, Dict] = {}
+        self.requests: List[str] = []
+        self.fail_before: List[int] = []
+        self.fail_after: List[int] = []
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self.failures])
+        app.router.add_post('/vals', self.create_val)
+        app.router.add_post('/vals/{val_id}/versions', self.add_version)
+        app.router.add_post('/eval/@{username}/{name}', self.run_val)
+        return app
+
+    @web.middleware
+    async def failures(self, request: web.Request, handler):
+        self.requests.append(f"{request.method} {request.path}")
+        if self.fail_before:
+            return web.json_response({'error': 'injected'}, status=self.fail_before.pop(0))
+        response = await handler(request)
+        if self.fail_after:
+            return web.json_response({'error': 'injected'}, status=self.fail_after.pop(0))
+        return response
+
+    def by_name(self, name: str) -> Optional[Dict]:
+        return next((val for val in self.vals.values() if val['name'] == name), None)
+
+    async def create_val(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        if self.by_name(payload['name']):
+            return web.json_response({'error': f"Val {payload['name']} already exists"}, status=409)
+        val_id = f"val-{len(self.vals) + 1}"
+        self.vals[val_id] = {'id': val_id, 'name': payload['name'], 'code': payload['code'], 'version': 0}
+        return web.json_response({'id': val_id, 'name': payload['name'], 'author': self.username, 'version': 0})
+
+    async def add_version(self, request: web.Request) -> web.Response:
+        val = self.vals.get(request.match_info['val_id'])
+        if val is None:
+            return web.json_response({'error': 'not found'}, status=404)
+        val['code'] = (await request.json())['code']
+        val['version'] += 1
+        return web.json_response({'id': val['id'], 'version': val['version']})
+
+    async def run_val(self, request: web.Request) -> web.Response:
+        val = self.by_name(request.match_info['name'])
+        if val is None or request.match_info['username'] != self.username:
+            return web.json_response({'error': 'not found'}, status=404)
+        data = self.data(val)
+        args = (await request.json()).get('args', [])
+        if 'export const conversations' in val['code']:
+            offset = args[0] if args else 0
+            limit = args[1] if len(args) > 1 else len(data)
+            data = data[offset:offset + limit]
+        return web.json_response({'data': data})
+
+    @staticmethod
+    def data(val: Dict) -> List:
+        return json.loads(EXPORT_DATA.search(val['code']).group(1))
+
+    def conversations(self) -> List[Dict]:
+        """Every conversation in the batch vals, in val order"""
+        return [
+            conversation
+            for val in self.vals.values() if 'export const conversations' in val['code']
+            for conversation in self.data(val)
+        ]
+
+if __name__ == "__main__":
+    # Point the client at it with VALTOWN_API_URL=http://localhost:<port>
+    parser = argparse.ArgumentParser(description="Run a fake Val.Town API locally")
+    parser.add_argument('--port', type=int, default=8787)
+    parser.add_argument('--username', default='fake')
+    args = parser.parse_args()
+    web.run_app(FakeValTown(args.username).app(), port=args.port)
@@ -3,6 +3,8 @@ import json
 import time
 from datetime import datetime
 import logging
+import sys
+from pathlib import Path
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
@@ -13,8 +15,6 @@ from selenium.common.exceptions import TimeoutException, NoSuchElementException
 from webdriver_manager.chrome import ChromeDriverManager
 from dotenv import load_dotenv
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 class GeminiScraper:
@@ -124,7 +124,7 @@ class GeminiScraper:
                         'timestamp': timestamp,
                         'content': content
                     })
-                    logger.debug(f"Extracted conversation with timestamp: {timestamp}")
+                    logger.debug("Extracted conversation with timestamp: %s", timestamp)
                 except NoSuchElementException as e:
                     logger.warning(f"Failed to extract conversation item: {str(e)}")
                     
@@ -174,5 +174,8 @@ class GeminiScraper:
                 self.driver.quit()
 
 if __name__ == "__main__":
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from core.logs import configure_logging
+    configure_logging()
     scraper = GeminiScraper(cookies_file="cookies.json")
     scraper.run()
@@ -9,13 +9,12 @@ from datetime import datetime
 import json
 import asyncio
 import logging
+import sys
 from pathlib import Path
 from extract_token import extract_google_cookies
 from gemini_scraper import GeminiScraper
 from valtown_service import ValTownService
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 class StatusLog(Log):
@@ -215,5 +214,8 @@ class GeminiTUI(App):
         self.view_results()
 
 if __name__ == "__main__":
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from core.logs import configure_logging
+    configure_logging()
     app = GeminiTUI()
     app.run()
@@ -0,0 +1,78 @@
+import os
+import tempfile
+import unittest
+
+import aiohttp
+from aiohttp.test_utils import TestServer
+
+from fake_valtown import FakeValTown
+from valtown_service import ValTownService
+
+def conversation(conversation_id: str, content: str) -> dict:
+    return {'conversation_id': conversation_id, 'timestamp': '2024-01-01T00:00:00+00:00', 'content': content}
+
+class ValTownServiceTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.fake = FakeValTown()
+        self.server = TestServer(self.fake.app())
+        await self.server.start_server()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.service = self.new_service()
+
+    async def asyncTearDown(self):
+        await self.service.close()
+        await self.server.close()
+        self.tmp.cleanup()
+
+    def new_service(self, **options) -> ValTownService:
+        return ValTownService(
+            base_url=str(self.server.make_url('')).rstrip('/'),
+            state_file=os.path.join(self.tmp.name, 'sync.json'),
+            retry_backoff=0, **options
+        )
+
+    async def test_sync_pushes_only_new_conversations(self):
+        result = await self.service.sync_conversations([conversation('a', 'one'), conversation('b', 'two')])
+        self.assertEqual(result['pushed'], 2)
+        result = await self.service.sync_conversations(
+            [conversation('a', 'one'), conversation('b', 'two'), conversation('c', 'three')]
+        )
+        self.assertEqual((result['pushed'], result['unchanged']), (1, 2))
+        self.assertEqual(len(self.fake.conversations()), 3)
+
+    async def test_changed_conversation_replaces_old_version(self):
+        await self.service.sync_conversations([conversation('a', 'one'), conversation('b', 'two')])
+        result = await self.service.sync_conversations([conversation('a', 'one, edited'), conversation('b', 'two')])
+        self.assertEqual((result['pushed'], result['updated']), (0, 1))
+        stored = await self.service.get_conversations('fake')
+        self.assertEqual([c['content'] for c in stored], ['one, edited', 'two'])
+
+    async def test_create_is_not_resent_after_server_error(self):
+        # The val was created before the 500, so resending would create a duplicate
+        self.fake.fail_after.append(500)
+        with self.assertRaises(aiohttp.ClientResponseError):
+            await self.service.sync_conversations([conversation('a', 'one')])
+        self.assertEqual(self.fake.requests.count('POST /vals'), 1)
+
+    async def test_rejected_create_is_resent(self):
+        self.fake.fail_before.append(429)
+        result = await self.service.sync_conversations([conversation('a', 'one')])
+        self.assertEqual(result['pushed'], 1)
+        self.assertEqual(len(self.fake.conversations()), 1)
+
+    async def test_reads_are_retried(self):
+        await self.service.sync_conversations([conversation('a', 'one')])
+        self.fake.fail_before.extend([503, 502])
+        stored = await self.service.get_conversations('fake')
+        self.assertEqual([c['content'] for c in stored], ['one'])
+
+    async def test_get_conversations_pages_across_batches(self):
+        service = self.new_service(batch_bytes=200)
+        await service.sync_conversations([conversation(str(i), f"content {i}") for i in range(10)])
+        await service.close()
+        self.assertGreater(len(self.fake.vals), 2)
+        page = await self.service.get_conversations('fake', offset=3, limit=4, page_size=2)
+        self.assertEqual([c['content'] for c in page], [f"content {i}" for i in range(3, 7)])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,56 +1,275 @@
 import aiohttp
 import asyncio
+import hashlib
 import json
-from typing import Dict, List, Optional
+import random
+from typing import AsyncIterator, Dict, List, Optional
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Statuses that mean the request was not processed, so even a POST can be resent
+REJECTED_STATUSES = {429}
+
+BATCH_VAL_CODE = """
+export const conversations = {data};
+export async function getConversations(offset = 0, limit = conversations.length) {{
+    return conversations.slice(offset, offset + limit);
+}}
+"""
+
+INDEX_VAL_CODE = """
+export const batches = {data};
+export async function getConversations() {{
+    return batches;
+}}
+"""
+
+def conversation_hash(conversation: Dict) -> str:
+    return hashlib.sha256(
+        json.dumps(conversation, sort_keys=True, ensure_ascii=False).encode()
+    ).hexdigest()
+
+def record_key(conversation: Dict) -> str:
+    """Identity of a conversation across syncs, so a changed one replaces its old version"""
+    return conversation.get('conversation_id') or conversation.get('url') or conversation_hash(conversation)
+
 class ValTownService:
-    def __init__(self):
+    """Val.Town client with one pooled keep-alive session and delta sync.
+
+    Conversations are pushed as size-bounded batch vals. The hash and batch
+    of everything already pushed are kept in a local state file, so each
+    sync only uploads new records, and a changed record is replaced in the
+    batch val holding it. A small index val lists the batch vals for readers.
+
+    Only idempotent calls are retried after a server error or timeout;
+    creating vals and versions is retried only when the request was
+    rejected unprocessed (429) or never reached the server.
+    """
+
+    def __init__(self, base_url: Optional[str] = None, state_file: str = '.valtown_sync.json',
+                 batch_bytes: int = 256 * 1024, max_retries: int = 3, retry_backoff: float = 1.0):
         self.api_key = os.getenv("VALTOWN_API_KEY")
-        self.base_url = "https://api.val.town/v1"
+        self.base_url = base_url or os.getenv("VALTOWN_API_URL", "https://api.val.town/v1")
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
+        self.state_file = state_file
+        self.batch_bytes = batch_bytes
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._session = None
+
+    async def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=8, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                headers=self.headers,
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=60)
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def request(self, method: str, path: str, payload: Optional[Dict] = None,
+                      idempotent: bool = False) -> Dict:
+        """Send a request, retrying transient failures with exponential backoff.
+
+        Requests that are not `idempotent` may have been applied when the
+        server errors or times out, so they are only resent when they were
+        rejected unprocessed or the connection was never made.
+        """
+        session = await self.session()
+        url = f"{self.base_url}{path}"
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with session.request(method, url, json=payload) as response:
+                    if response.status in RETRY_STATUSES and attempt < self.max_retries:
+                        raise aiohttp.ClientResponseError(
+                            response.request_info, response.history, status=response.status
+                        )
+                    response.raise_for_status()
+                    return await response.json()
+            except (aiohttp.ClientConnectionError, aiohttp.ClientResponseError, asyncio.TimeoutError) as e:
+                if isinstance(e, aiohttp.ClientResponseError):
+                    retryable = e.status in (RETRY_STATUSES if idempotent else REJECTED_STATUSES)
+                else:
+                    retryable = idempotent or isinstance(e, aiohttp.ClientConnectorError)
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                await asyncio.sleep(random.uniform(0, self.retry_backoff * 2 ** attempt))
 
     async def create_val(self, name: str, code: str) -> Dict:
         """Create a new Val function"""
-        async with aiohttp.ClientSession() as session:
-            url = f"{self.base_url}/vals"
-            payload = {
-                "name": name,
-                "code": code,
-                "public": True
-            }
-            async with session.post(url, headers=self.headers, json=payload) as response:
-                return await response.json()
-
-    async def run_val(self, username: str, val_name: str, args: Optional[List] = None) -> Dict:
-        """Run a Val function"""
-        async with aiohttp.ClientSession() as session:
-            url = f"{self.base_url}/eval/@{username}/{val_name}"
-            payload = {"args": args or []}
-            async with session.post(url, headers=self.headers, json=payload) as response:
-                return await response.json()
+        payload = {
+            "name": name,
+            "code": code,
+            "public": True
+        }
+        return await self.request("POST", "/vals", payload)
+
+    async def update_val(self, val_id: str, code: str) -> Dict:
+        """Publish a new version of an existing Val function"""
+        return await self.request("POST", f"/vals/{val_id}/versions", {"code": code})
+
+    async def run_val(self, username: str, val_name: str, args: Optional[List] = None,
+                      idempotent: bool = False) -> Dict:
+        """Run a Val function; pass `idempotent` for vals without side effects so failures are retried"""
+        payload = {"args": args or []}
+        return await self.request("POST", f"/eval/@{username}/{val_name}", payload, idempotent=idempotent)
+
+    def load_state(self) -> Dict:
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            state = {"batches": [], "index_id": None, "author": None}
+        # record key -> [content hash, batch number]; states from before
+        # records were tracked only have "hashes", which are still skipped
+        state.setdefault("records", {})
+        state.setdefault("hashes", [])
+        return state
+
+    def save_state(self, state: Dict) -> None:
+        tmp_file = f"{self.state_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_file, self.state_file)
+
+    def batches(self, conversations: List[Dict]) -> List[List[Dict]]:
+        """Split conversations into batches whose JSON stays under batch_bytes"""
+        batches, current, size = [], [], 0
+        for conversation in conversations:
+            item_size = len(json.dumps(conversation, ensure_ascii=False).encode()) + 1
+            if current and size + item_size > self.batch_bytes:
+                batches.append(current)
+                current, size = [], 0
+            current.append(conversation)
+            size += item_size
+        if current:
+            batches.append(current)
+        return batches
+
+    async def read_batch(self, username: str, batch: Dict) -> List[Dict]:
+        result = await self.run_val(username, batch["name"], [0, batch["count"]], idempotent=True)
+        return result.get("data", [])
+
+    async def sync_conversations(self, conversations: List[Dict]) -> Dict:
+        """Push conversations not present in the last successful sync, and replace changed ones"""
+        state = self.load_state()
+        records = state["records"]
+        legacy = set(state["hashes"])
+        seen = set()
+        delta = []
+        changed: Dict[int, Dict[str, Dict]] = {}
+        for conversation in conversations:
+            key = record_key(conversation)
+            digest = conversation_hash(conversation)
+            known = records.get(key)
+            # A record repeated within one sync is only sent once
+            if key in seen or known and known[0] == digest or digest in legacy:
+                continue
+            seen.add(key)
+            if known and state["batches"][known[1]].get("id"):
+                changed.setdefault(known[1], {})[key] = conversation
+            else:
+                delta.append((key, digest, conversation))
+
+        updated = 0
+        for number, replacements in changed.items():
+            batch = state["batches"][number]
+            contents = []
+            for conversation in await self.read_batch(state["author"], batch):
+                key = record_key(conversation)
+                contents.append(replacements.get(key, conversation))
+            await self.update_val(batch["id"], BATCH_VAL_CODE.format(data=json.dumps(contents)))
+            present = {record_key(conversation) for conversation in contents}
+            for key, conversation in replacements.items():
+                if key in present:
+                    records[key] = [conversation_hash(conversation), number]
+                    updated += 1
+                else:
+                    # Not in its batch any more, so it is pushed again
+                    delta.append((key, conversation_hash(conversation), conversation))
+            self.save_state(state)
+
+        pushed = 0
+        for batch in self.batches([conversation for _, _, conversation in delta]):
+            number = len(state["batches"])
+            name = f"gemini_conversations_{number:05d}"
+            result = await self.create_val(name, BATCH_VAL_CODE.format(data=json.dumps(batch)))
+            state["author"] = result.get("author", state["author"])
+            state["batches"].append({"name": name, "count": len(batch), "id": result.get("id")})
+            for key, digest, _ in delta[pushed:pushed + len(batch)]:
+                records[key] = [digest, number]
+            pushed += len(batch)
+            # Persist after each batch so an interrupted sync resumes from here
+            self.save_state(state)
+
+        if pushed or not state["index_id"]:
+            index_code = INDEX_VAL_CODE.format(data=json.dumps(state["batches"]))
+            if state["index_id"]:
+                await self.update_val(state["index_id"], index_code)
+            else:
+                result = await self.create_val("gemini_conversations", index_code)
+                state["index_id"] = result.get("id")
+                state["author"] = result.get("author", state["author"])
+            self.save_state(state)
+
+        return {"pushed": pushed, "updated": updated,
+                "unchanged": len(conversations) - pushed - updated, "batches": len(state["batches"])}
 
     async def store_conversations(self, conversations: List[Dict]) -> str:
         """Store conversations in Val.Town and return the URL"""
-        # Create a Val function to store and serve the conversations
-        store_code = f"""
-        export const conversations = {json.dumps(conversations)};
-        export async function getConversations() {{
-            return conversations;
-        }}
+        await self.sync_conversations(conversations)
+        return f"https://val.town/v/{self.load_state()['author']}/gemini_conversations"
+
+    async def iter_conversations(self, username: str, page_size: int = 500) -> AsyncIterator[List[Dict]]:
+        """Read stored conversations page by page across all batch vals"""
+        index = await self.run_val(username, "gemini_conversations", idempotent=True)
+        for batch in index.get("data", []):
+            for offset in range(0, batch["count"], page_size):
+                result = await self.run_val(username, batch["name"], [offset, page_size], idempotent=True)
+                page = result.get("data", [])
+                if page:
+                    yield page
+
+    async def get_conversations(self, username: str, offset: int = 0,
+                                limit: Optional[int] = None, page_size: int = 500) -> List[Dict]:
+        """Retrieve conversations from Val.Town, optionally a single page.
+
+        Batch sizes come from the index val, so batches before ``offset``
+        are skipped without being read.
         """
-        
-        val_name = "gemini_conversations"
-        result = await self.create_val(val_name, store_code)
-        return f"https://val.town/v/{result['author']}/{val_name}"
-
-    async def get_conversations(self, username: str) -> List[Dict]:
-        """Retrieve conversations from Val.Town"""
-        result = await self.run_val(username, "gemini_conversations")
-        return result.get("data", [])
+        index = await self.run_val(username, "gemini_conversations", idempotent=True)
+        conversations = []
+        position = 0
+        for batch in index.get("data", []):
+            if position + batch["count"] <= offset:
+                position += batch["count"]
+                continue
+            start = max(0, offset - position)
+            while start < batch["count"]:
+                wanted = page_size if limit is None else min(page_size, limit - len(conversations))
+                result = await self.run_val(username, batch["name"], [start, wanted], idempotent=True)
+                page = result.get("data", [])
+                if not page:
+                    break
+                conversations.extend(page)
+                start += len(page)
+                if limit is not None and len(conversations) >= limit:
+                    return conversations
+            position += batch["count"]
+        return conversations
@@ -0,0 +1,28 @@
+import json
+import re
+from typing import Dict, List
+
+def load_manifest(manifest_file: str) -> List[Dict]:
+    """Load an accounts manifest.
+
+    The manifest is a JSON list of objects with a unique ``name`` and a
+    ``cookies_file``; ``urls``, ``proxy`` and ``user_agent`` are optional.
+    """
+    with open(manifest_file, 'r', encoding='utf-8') as f:
+        accounts = json.load(f)
+
+    names = set()
+    for account in accounts:
+        if not account.get('name'):
+            raise ValueError(f"Account without a name in {manifest_file}")
+        if account['name'] in names:
+            raise ValueError(f"Duplicate account name: {account['name']}")
+        names.add(account['name'])
+    return accounts
+
+def account_slug(name: str) -> str:
+    """Filesystem-safe form of an account name"""
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', name)
+
+def session_file_for(name: str) -> str:
+    return f".session.{account_slug(name)}"
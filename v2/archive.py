@@ -0,0 +1,307 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import random
+import struct
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import zstandard
+
+from query import epoch_seconds
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FORMAT = 1
+MANIFEST = 'manifest.json'
+DICTIONARY_DIR = 'dictionaries'
+DEFAULT_LEVEL = 9
+DEFAULT_DICT_SIZE = 112640
+DEFAULT_SAMPLE_SIZE = 5000
+# zstd cannot train a useful dictionary from fewer samples than this
+MIN_SAMPLES = 64
+# Version 0 means compressed without a dictionary
+NO_DICTIONARY = 0
+# byte offset, byte length, dictionary version, content hash, epoch seconds (NaN when none)
+INDEX_ENTRY = struct.Struct('<QIIQd')
+
+Record = Dict[str, str]
+
+def content_hash(record: Record) -> int:
+    digest = hashlib.blake2b(record.get('content', '').encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+def encode(record: Record) -> bytes:
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def reservoir_sample(records: Iterable[Record], size: int, seed: int = 0) -> List[bytes]:
+    """A uniform sample of encoded records in one pass and bounded memory"""
+    rng = random.Random(seed)
+    sample: List[bytes] = []
+    for i, record in enumerate(records):
+        if i < size:
+            sample.append(encode(record))
+        else:
+            j = rng.randint(0, i)
+            if j < size:
+                sample[j] = encode(record)
+    return sample
+
+def train(samples: List[bytes], dict_size: int = DEFAULT_DICT_SIZE,
+          level: int = DEFAULT_LEVEL) -> Optional[zstandard.ZstdCompressionDict]:
+    if len(samples) < MIN_SAMPLES:
+        logger.warning(f"Only {len(samples)} samples, records will be compressed without a dictionary")
+        return None
+    dict_size = min(dict_size, max(1024, sum(map(len, samples)) // 10))
+    return zstandard.train_dictionary(dict_size, samples, level=level)
+
+class Archive:
+    """Conversation records compressed one by one with a trained zstd dictionary.
+
+    A directory holding:
+        manifest.json             format, generation, current dictionary, level
+        dictionaries/<v>.zdict    every dictionary version ever trained
+        records-<gen>.zst         compressed records, concatenated
+        records-<gen>.idx         INDEX_ENTRY per record
+
+    Each record is its own zstd frame, so get(i) decompresses one record
+    only. Frames remember their dictionary version; retraining adds a
+    version used for new records while old records stay readable, and
+    migrate() recompresses everything with the current one into a new
+    generation of files.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.manifest = self.load_manifest()
+        self._dictionaries: Dict[int, zstandard.ZstdCompressionDict] = {}
+        self._decompressors: Dict[int, zstandard.ZstdDecompressor] = {}
+        self._compressor: Optional[zstandard.ZstdCompressor] = None
+        self._index: Optional[mmap.mmap] = None
+        self._data: Optional[mmap.mmap] = None
+        self._files = []
+
+    def load_manifest(self) -> Dict:
+        try:
+            with open(self.path / MANIFEST, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return {'format': ARCHIVE_FORMAT, 'generation': 1, 'current': NO_DICTIONARY,
+                    'level': DEFAULT_LEVEL, 'dictionaries': {}}
+        if manifest.get('format') != ARCHIVE_FORMAT:
+            raise ValueError(f"Unsupported archive format in {self.path}: {manifest.get('format')}")
+        return manifest
+
+    def save_manifest(self) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        tmp = self.path / (MANIFEST + '.tmp')
+        tmp.write_text(json.dumps(self.manifest, indent=2), encoding='utf-8')
+        os.replace(tmp, self.path / MANIFEST)
+
+    def records_path(self, generation: Optional[int] = None) -> Path:
+        return self.path / f"records-{generation or self.manifest['generation']}.zst"
+
+    def index_path(self, generation: Optional[int] = None) -> Path:
+        return self.path / f"records-{generation or self.manifest['generation']}.idx"
+
+    # Dictionaries
+
+    def dictionary(self, version: int) -> Optional[zstandard.ZstdCompressionDict]:
+        if version == NO_DICTIONARY:
+            return None
+        if version not in self._dictionaries:
+            data = (self.path / DICTIONARY_DIR / f"{version}.zdict").read_bytes()
+            self._dictionaries[version] = zstandard.ZstdCompressionDict(data)
+        return self._dictionaries[version]
+
+    def add_dictionary(self, dictionary: Optional[zstandard.ZstdCompressionDict], samples: int) -> int:
+        """Store a new dictionary version and make it current; returns the version"""
+        if dictionary is None:
+            return self.manifest['current']
+        version = max(map(int, self.manifest['dictionaries']), default=NO_DICTIONARY) + 1
+        directory = self.path / DICTIONARY_DIR
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / f"{version}.zdict").write_bytes(dictionary.as_bytes())
+        self.manifest['dictionaries'][str(version)] = {
+            'dict_id': dictionary.dict_id(),
+            'size': len(dictionary.as_bytes()),
+            'samples': samples,
+            'trained_at': datetime.now(timezone.utc).isoformat(),
+        }
+        self.manifest['current'] = version
+        self._compressor = None
+        self.save_manifest()
+        logger.info(f"Trained dictionary v{version} ({len(dictionary.as_bytes())} bytes) on {samples} samples")
+        return version
+
+    def compressor(self) -> zstandard.ZstdCompressor:
+        if self._compressor is None:
+            level = self.manifest['level']
+            dictionary = self.dictionary(self.manifest['current'])
+            if dictionary is not None:
+                dictionary.precompute_compress(level=level)
+            self._compressor = zstandard.ZstdCompressor(level=level, dict_data=dictionary)
+        return self._compressor
+
+    def decompressor(self, version: int) -> zstandard.ZstdDecompressor:
+        if version not in self._decompressors:
+            self._decompressors[version] = zstandard.ZstdDecompressor(dict_data=self.dictionary(version))
+        return self._decompressors[version]
+
+    # Reading
+
+    def open(self) -> None:
+        """Memory-map the current generation for random access"""
+        self.close()
+        for path in (self.index_path(), self.records_path()):
+            if not path.exists() or path.stat().st_size == 0:
+                return
+        index_file = open(self.index_path(), 'rb')
+        data_file = open(self.records_path(), 'rb')
+        self._files = [index_file, data_file]
+        self._index = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._data = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self) -> None:
+        for handle in (self._index, self._data, *self._files):
+            if handle is not None:
+                handle.close()
+        self._index = self._data = None
+        self._files = []
+
+    def __len__(self) -> int:
+        path = self.index_path()
+        return path.stat().st_size // INDEX_ENTRY.size if path.exists() else 0
+
+    def entries(self) -> Iterator[Tuple[int, int, int, int, float]]:
+        if self._index is None:
+            self.open()
+        if self._index is None:
+            return
+        for i in range(len(self._index) // INDEX_ENTRY.size):
+            yield INDEX_ENTRY.unpack_from(self._index, i * INDEX_ENTRY.size)
+
+    def entry(self, i: int) -> Tuple[int, int, int, int, float]:
+        if self._index is None:
+            self.open()
+        if self._index is None or not 0 <= i < len(self._index) // INDEX_ENTRY.size:
+            raise IndexError(f"No record {i} in {self.path}")
+        return INDEX_ENTRY.unpack_from(self._index, i * INDEX_ENTRY.size)
+
+    def decode(self, offset: int, length: int, version: int) -> Record:
+        return json.loads(self.decompressor(version).decompress(self._data[offset:offset + length]))
+
+    def get(self, i: int) -> Record:
+        offset, length, version, _, _ = self.entry(i)
+        return self.decode(offset, length, version)
+
+    def __iter__(self) -> Iterator[Record]:
+        for offset, length, version, _, _ in self.entries():
+            yield self.decode(offset, length, version)
+
+    def hashes(self) -> Set[int]:
+        return {entry[3] for entry in self.entries()}
+
+    # Writing
+
+    def append(self, records: Iterable[Record], dedupe: bool = True) -> int:
+        """Compress and append records with the current dictionary; returns how many were added.
+
+        Records whose content is already archived are skipped when `dedupe`.
+        """
+        seen = self.hashes() if dedupe else set()
+        self.close()
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.save_manifest()
+        compressor = self.compressor()
+        version = self.manifest['current']
+        added = 0
+        with open(self.records_path(), 'ab') as data, open(self.index_path(), 'ab') as index:
+            offset = data.tell()
+            for record in records:
+                digest = content_hash(record)
+                if dedupe:
+                    if digest in seen:
+                        continue
+                    seen.add(digest)
+                frame = compressor.compress(encode(record))
+                data.write(frame)
+                # The index entry goes last, so a record is only visible once fully written
+                index.write(INDEX_ENTRY.pack(offset, len(frame), version, digest,
+                                             epoch_seconds(record.get('timestamp'))))
+                offset += len(frame)
+                added += 1
+        return added
+
+    def retrain(self, sample_size: int = DEFAULT_SAMPLE_SIZE, dict_size: int = DEFAULT_DICT_SIZE) -> int:
+        """Train a new dictionary version from a sample of the archive's own records"""
+        samples = reservoir_sample(iter(self), sample_size)
+        return self.add_dictionary(train(samples, dict_size, self.manifest['level']), len(samples))
+
+    def migrate(self, level: Optional[int] = None, prune: bool = False) -> int:
+        """Recompress every record with the current dictionary into a new generation.
+
+        The manifest switches to the new files only once they are complete;
+        the old generation is then deleted. With `prune`, dictionary versions
+        no longer referenced are deleted too.
+        """
+        if level is not None:
+            self.manifest['level'] = level
+            self._compressor = None
+        old_generation = self.manifest['generation']
+        new_generation = old_generation + 1
+        compressor = self.compressor()
+        version = self.manifest['current']
+        count = 0
+        with open(self.records_path(new_generation), 'wb') as data, \
+                open(self.index_path(new_generation), 'wb') as index:
+            offset = 0
+            for old_offset, length, old_version, digest, seconds in self.entries():
+                raw = self.decompressor(old_version).decompress(self._data[old_offset:old_offset + length])
+                frame = compressor.compress(raw)
+                data.write(frame)
+                index.write(INDEX_ENTRY.pack(offset, len(frame), version, digest, seconds))
+                offset += len(frame)
+                count += 1
+        self.close()
+        self.manifest['generation'] = new_generation
+        self.save_manifest()
+        for path in (self.records_path(old_generation), self.index_path(old_generation)):
+            if path.exists():
+                path.unlink()
+        if prune:
+            for old_version in list(self.manifest['dictionaries']):
+                if int(old_version) != version:
+                    (self.path / DICTIONARY_DIR / f"{old_version}.zdict").unlink(missing_ok=True)
+                    del self.manifest['dictionaries'][old_version]
+                    self._dictionaries.pop(int(old_version), None)
+            self.save_manifest()
+        logger.info(f"Migrated {count} records of {self.path} to dictionary v{version}")
+        return count
+
+    def stats(self) -> Dict:
+        """Record count, stored and original sizes, and records per dictionary version"""
+        stored = original = 0
+        versions: Dict[int, int] = {}
+        for offset, length, version, _, _ in self.entries():
+            stored += length
+            original += zstandard.frame_content_size(self._data[offset:offset + length])
+            versions[version] = versions.get(version, 0) + 1
+        return {
+            'records': sum(versions.values()),
+            'stored_bytes': stored,
+            'original_bytes': original,
+            'ratio': original / stored if stored else None,
+            'current_dictionary': self.manifest['current'],
+            'records_per_dictionary': versions,
+        }
+
+def pack(archive: Archive, records: Iterable[Record], sample: Optional[List[bytes]] = None,
+         dict_size: int = DEFAULT_DICT_SIZE) -> int:
+    """Append records, training the first dictionary from `sample` when the archive has none"""
+    if archive.manifest['current'] == NO_DICTIONARY and sample:
+        archive.add_dictionary(train(sample, dict_size, archive.manifest['level']), len(sample))
+    return archive.append(records)
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from playwright.async_api import async_playwright
+
+from accounts import account_slug, session_file_for
+from gemini_scraper import GeminiScraper
+
+logger = logging.getLogger(__name__)
+
+# Per-context proxy for accounts without one, when the browser has a placeholder proxy
+DIRECT_PROXY = {'server': 'direct://'}
+
+def account_proxy(account: Dict) -> Optional[Dict[str, str]]:
+    """Normalize an account's proxy setting to Playwright's proxy dict"""
+    proxy = account.get('proxy')
+    if not proxy:
+        return None
+    if isinstance(proxy, str):
+        return {
+            'server': proxy,
+            'username': os.getenv('PROXY_USER'),
+            'password': os.getenv('PROXY_PASS')
+        }
+    return proxy
+
+class BatchRunner:
+    """Scrapes many accounts concurrently, one isolated context each, in a single browser.
+
+    Every account gets its own cookies, proxy, user agent and session file.
+    At most ``concurrency`` accounts run at once; an ``admission`` object with
+    an async ``slot()`` context manager can be passed to share that cap with
+    other callers instead.
+    """
+
+    def __init__(self, accounts: List[Dict], concurrency: int = 4,
+                 out_dir: str = 'batch_output', admission=None):
+        self.accounts = accounts
+        self.out_dir = out_dir
+        self.semaphore = asyncio.Semaphore(max(1, concurrency))
+        self.admission = admission
+
+    def slot(self):
+        return self.admission.slot() if self.admission else self.semaphore
+
+    async def run_account(self, browser, account: Dict, placeholder_proxy: bool = False) -> Dict:
+        name = account['name']
+        proxy = account_proxy(account)
+        if proxy is None and placeholder_proxy:
+            # Without an override the context would inherit the placeholder and fail to connect
+            proxy = DIRECT_PROXY
+        output_file = str(Path(self.out_dir) / f"{account_slug(name)}.json")
+        async with self.slot():
+            scraper = GeminiScraper(
+                urls=account.get('urls'),
+                session_file=session_file_for(name),
+                output_file=output_file
+            )
+            try:
+                await scraper.attach(
+                    browser, proxy=proxy, user_agent=account.get('user_agent')
+                )
+                conversations = await scraper.scrape(cookies_file=account.get('cookies_file'))
+            except Exception as e:
+                logger.error(f"Account {name} failed: {str(e)}")
+                await scraper.close()
+                return {'account': name, 'count': 0, 'output': None, 'errors': [str(e)]}
+
+        logger.info(f"Account {name}: {len(conversations)} conversations")
+        return {
+            'account': name,
+            'count': len(conversations),
+            'output': output_file if conversations else None,
+            'errors': [str(error) for _, error in scraper.errors]
+        }
+
+    async def run(self) -> List[Dict]:
+        Path(self.out_dir).mkdir(parents=True, exist_ok=True)
+        async with async_playwright() as playwright:
+            # Chromium only honours per-context proxies when the browser was
+            # launched with a placeholder proxy.
+            launch_proxy = {'server': 'http://per-context'} if any(
+                account.get('proxy') for account in self.accounts
+            ) else None
+            browser = await playwright.chromium.launch(headless=True, proxy=launch_proxy)
+            try:
+                return await asyncio.gather(
+                    *(self.run_account(browser, account, placeholder_proxy=launch_proxy is not None)
+                      for account in self.accounts)
+                )
+            finally:
+                await browser.close()
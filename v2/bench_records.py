@@ -0,0 +1,55 @@
+"""Memory benchmark: plain dicts vs Conversation slots vs ConversationBatch.
+
+    python bench_records.py --count 100000
+"""
+import gc
+import json
+import random
+import tracemalloc
+
+import typer
+
+from records import Conversation, ConversationBatch
+
+TITLES = [f"Conversation topic {i}" for i in range(500)]
+SOURCES = ['https://gemini.google.com/app', 'https://myactivity.google.com/product/gemini']
+
+def synthetic_records(count: int):
+    """Records shaped like scraper output; strings are rebuilt per record as when
+    they come out of json.load or text_content()"""
+    day = 1707436800
+    for i in range(count):
+        yield {
+            'timestamp': f"2024-02-{1 + (i % 28):02d}T00:00:00+00:00",
+            'content': f"{random.choice(TITLES)} preview text for record {i}",
+            'title': ''.join(random.choice(TITLES)),
+            'conversation_id': f"{day + i:016x}",
+            'url': f"https://gemini.google.com/app/{day + i:016x}",
+            'source': ''.join(random.choice(SOURCES)),
+        }
+
+def measure(build) -> int:
+    gc.collect()
+    tracemalloc.start()
+    data = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del data
+    return current
+
+def main(count: int = 100000, seed: int = 0):
+    results = {}
+    random.seed(seed)
+    results['dicts'] = measure(lambda: list(synthetic_records(count)))
+    random.seed(seed)
+    results['slots'] = measure(lambda: [Conversation.from_dict(r) for r in synthetic_records(count)])
+    random.seed(seed)
+    results['batch'] = measure(lambda: ConversationBatch(synthetic_records(count)))
+
+    baseline = results['dicts']
+    for name, size in results.items():
+        typer.echo(f"{name:>6}: {size / 2**20:8.1f} MiB  ({size / count:6.0f} B/record, {size / baseline:5.1%} of dicts)")
+    typer.echo(json.dumps({'count': count, 'bytes': results}))
+
+if __name__ == "__main__":
+    typer.run(main)
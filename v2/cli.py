@@ -1,30 +1,513 @@
 import typer
 import asyncio
 import logging
-from gemini_scraper import GeminiScraper
+import re
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import List, Optional
+from gemini_scraper import GeminiScraper, parse_timestamp
 from gemini_tui import GeminiTUI
+from sinks import JsonFileSink
+from transcripts import scrape_transcripts
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 app = typer.Typer()
 
+def use_core() -> None:
+    """Make the shared core package at the repo root importable"""
+    root = str(Path(__file__).resolve().parent.parent)
+    if root not in sys.path:
+        sys.path.insert(0, root)
+
+@app.callback()
+def main(
+    log_level: str = typer.Option("INFO", envvar="LOG_LEVEL", help="DEBUG, INFO, WARNING or ERROR"),
+    log_format: str = typer.Option("json", envvar="LOG_FORMAT", help="'json' or 'console'"),
+    log_file: Optional[str] = typer.Option(None, envvar="LOG_FILE", help="Write logs here instead of stderr"),
+):
+    use_core()
+    from core.logs import configure_logging
+    configure_logging(log_level, log_format, log_file)
+
+def parse_bound(value: Optional[str]) -> Optional[datetime]:
+    """Accept a relative age such as '7d' or '12h', or an absolute date/timestamp"""
+    if not value:
+        return None
+    match = re.fullmatch(r'(\d+)([dhm])', value.strip())
+    if match:
+        amount, unit = int(match.group(1)), match.group(2)
+        delta = {'d': timedelta(days=amount), 'h': timedelta(hours=amount), 'm': timedelta(minutes=amount)}[unit]
+        return datetime.now(timezone.utc) - delta
+    parsed = parse_timestamp(value)
+    if parsed is None:
+        raise typer.BadParameter(f"Cannot parse time bound: {value}")
+    return parsed
+
 @app.command()
-def scrape(cookies_file: str = "cookies.json"):
+def scrape(
+    cookies_file: str = "cookies.json",
+    pipelined: bool = typer.Option(False, help="Extract while expanding instead of after"),
+    prune: Optional[str] = typer.Option(None, help="Pipelined only: 'hide' or 'detach' processed items"),
+    output: str = "gemini_conversations.json",
+    since: Optional[str] = typer.Option(None, help="Only conversations newer than this, e.g. 7d or 2024-02-01"),
+    until: Optional[str] = typer.Option(None, help="Only conversations older than this"),
+    near_dedup: bool = typer.Option(False, help="Drop near-duplicate conversations"),
+    neardup_index: str = typer.Option(".neardup.npz", help="Near-duplicate index kept between runs"),
+    similarity: float = typer.Option(0.8, help="Jaccard similarity at which records are near-duplicates"),
+    merge_policy: str = typer.Option("keep_first", help="keep_first, keep_latest, keep_longest or merge"),
+    record_har: Optional[str] = typer.Option(None, help="Save the run's network traffic to this HAR (.zip keeps bodies separate)"),
+    replay_har: Optional[str] = typer.Option(None, help="Serve all requests from this HAR instead of the network"),
+    replay_latency: float = typer.Option(0.0, help="Seconds of delay added to each replayed request"),
+    snapshot_dir: Optional[str] = typer.Option(None, help="Archive a gzipped DOM snapshot of each page here"),
+    timeout: Optional[float] = typer.Option(None, help="Total seconds for the run; partial results are kept"),
+    enrich: Optional[str] = typer.Option(None, help="Comma-separated enrichers: whitespace, timestamp, language, tokens or module:function"),
+    enrich_workers: Optional[int] = typer.Option(None, help="Enrichment processes (default: one per CPU)"),
+    unordered: bool = typer.Option(False, help="Let enriched batches be written out of order"),
+    sink: Optional[List[str]] = typer.Option(None, help="Output sink, repeatable: file:PATH, ndjson:PATH|-, sqlite:PATH, webhook:URL, valtown; append @block or @spill to override the overflow policy"),
+    sink_batch_size: int = typer.Option(100, help="Records per sink write"),
+    sink_flush_interval: float = typer.Option(2.0, help="Seconds before a partial batch is written"),
+    sink_max_pending: int = typer.Option(1000, help="Records each sink queues in memory before blocking or spilling"),
+):
     """Scrape Gemini conversations using Playwright"""
+    def output_sink():
+        """The fan-out over --sink specs, or None for the plain output file"""
+        if not sink:
+            return None
+        from sinks import FanOutSink, build_sink
+        return FanOutSink([
+            build_sink(spec, batch_size=sink_batch_size, flush_interval=sink_flush_interval,
+                       max_pending=sink_max_pending)
+            for spec in sink
+        ])
+
     try:
-        scraper = GeminiScraper()
-        asyncio.run(scraper.scrape(cookies_file=""))
+        since, until = parse_bound(since), parse_bound(until)
+        enricher = None
+        if enrich:
+            from enrich import Enricher
+            enricher = Enricher([name.strip() for name in enrich.split(',')], workers=enrich_workers,
+                                ordered=not unordered)
+        har_options = {'record_har': record_har, 'replay_har': replay_har, 'replay_latency': replay_latency,
+                       'snapshot_dir': snapshot_dir}
+        near_duplicates = None
+        if near_dedup:
+            from neardup import NearDuplicateFilter
+            near_duplicates = NearDuplicateFilter(neardup_index, threshold=similarity, policy=merge_policy)
+        if pipelined:
+            async def run():
+                scraper = await GeminiScraper.create(near_duplicates=near_duplicates, **har_options)
+                target = output_sink() or JsonFileSink(output)
+                if enricher:
+                    from enrich import EnrichingSink
+                    target = EnrichingSink(target, enricher)
+                await scraper.scrape_pipelined(
+                    target, cookies_file=cookies_file, prune=prune, since=since, until=until,
+                    timeout=timeout
+                )
+                return scraper
+            scraper = asyncio.run(run())
+        else:
+            scraper = GeminiScraper(output_file=output, near_duplicates=near_duplicates, enricher=enricher,
+                                    sink=output_sink(), **har_options)
+            asyncio.run(scraper.scrape(cookies_file="", since=since, until=until, timeout=timeout))
+        if scraper.truncated:
+            typer.echo("Warning: the run was cut short, output is partial", err=True)
     except Exception as e:
         logger.error(f"Scraping failed: {str(e)}", exc_info=True)
         raise typer.Exit(1)
 
 @app.command()
-def interactive():
+def reextract(
+    sources: List[str] = typer.Argument(..., help="Snapshot files, directories or glob patterns"),
+    output: str = "gemini_conversations.json",
+    workers: Optional[int] = typer.Option(None, help="Parser processes (default: one per CPU)"),
+    since: Optional[str] = typer.Option(None, help="Only conversations newer than this, e.g. 7d or 2024-02-01"),
+    until: Optional[str] = typer.Option(None, help="Only conversations older than this"),
+):
+    """Re-run extraction over archived DOM snapshots without a browser"""
+    import json
+    from reextract import reextract as reextract_snapshots, snapshot_paths
+    try:
+        paths = snapshot_paths(sources)
+        if not paths:
+            typer.echo("No snapshots found")
+            raise typer.Exit(1)
+        conversations = reextract_snapshots(paths, workers=workers, since=parse_bound(since), until=parse_bound(until))
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(conversations, f, ensure_ascii=False, indent=2)
+        typer.echo(f"{len(conversations)} conversations from {len(paths)} snapshots written to {output}")
+    except typer.Exit:
+        raise
+    except Exception as e:
+        logger.error(f"Re-extraction failed: {str(e)}", exc_info=True)
+        raise typer.Exit(1)
+
+@app.command()
+def transcripts(
+    cookies_file: str = "cookies.json",
+    concurrency: int = typer.Option(4, help="Number of pages fetching in parallel"),
+    output: str = "gemini_transcripts.json",
+    state_file: str = "transcripts_state.json",
+):
+    """Fetch full conversation transcripts, skipping unchanged ones"""
+    try:
+        async def run():
+            scraper = await GeminiScraper.create()
+            return await scrape_transcripts(
+                scraper, JsonFileSink(output, append=True), cookies_file=cookies_file,
+                concurrency=concurrency, state_file=state_file
+            )
+        stats = asyncio.run(run())
+        typer.echo(f"Fetched {stats['fetched']}, unchanged {stats['unchanged'] + stats['skipped']}, failed {stats['failed']}")
+    except Exception as e:
+        logger.error(f"Transcript fetch failed: {str(e)}", exc_info=True)
+        raise typer.Exit(1)
+
+@app.command()
+def export_parquet(
+    inputs: List[str] = typer.Argument(..., help="JSON or NDJSON result files"),
+    out_dir: str = "gemini_dataset",
+    partition: str = typer.Option("day", help="'day' or 'month'"),
+    file_format: str = typer.Option("parquet", "--format", help="'parquet' or 'arrow'"),
+    compression: str = "zstd",
+):
+    """Convert scraped JSON outputs into a partitioned columnar dataset"""
+    from export import export_conversations, read_json_conversations
+    try:
+        total = 0
+        for path in inputs:
+            total += export_conversations(
+                read_json_conversations(path), out_dir,
+                partition=partition, file_format=file_format, compression=compression
+            )
+        typer.echo(f"Exported {total} new conversations to {out_dir}")
+    except Exception as e:
+        logger.error(f"Export failed: {str(e)}", exc_info=True)
+        raise typer.Exit(1)
+
+@app.command()
+def coordinate(
+    manifest: str = typer.Argument(..., help="JSON list of accounts with name and cookies_file"),
+    workers: Optional[int] = typer.Option(None, help="Worker processes (default: CPU count)"),
+    slots: int = typer.Option(1, help="Concurrent shards per worker"),
+    db_path: str = "coordinator.db",
+    out_dir: str = "shards",
+    output: str = "gemini_conversations_merged.json",
+    max_attempts: int = 3,
+):
+    """Shard accounts across worker processes and merge the results"""
+    import os
+    from accounts import load_manifest
+    from coordinator import Coordinator
+    try:
+        coordinator = Coordinator(
+            db_path=db_path, out_dir=out_dir, workers=workers,
+            slots_per_worker=slots, max_attempts=max_attempts
+        )
+        added = coordinator.submit(
+            load_manifest(manifest), [os.getenv('GEMINI_URL'), os.getenv('ACTIVITY_URL')]
+        )
+        typer.echo(f"Queued {added} new shards")
+        counts = coordinator.run()
+        total = coordinator.merge(output)
+        typer.echo(f"Shards: {counts}; merged {total} conversations into {output}")
+    except Exception as e:
+        logger.error(f"Coordinated scrape failed: {str(e)}", exc_info=True)
+        raise typer.Exit(1)
+
+@app.command()
+def batch(
+    manifest: str = typer.Argument(..., help="JSON list of accounts with name, cookies_file, proxy, user_agent"),
+    concurrency: int = typer.Option(4, help="Accounts scraped at the same time (the upper bound with --adaptive)"),
+    out_dir: str = "batch_output",
+    adaptive: bool = typer.Option(False, help="Scale concurrency with CPU and memory headroom"),
+):
+    """Scrape many accounts in one browser with an isolated context each"""
+    from accounts import load_manifest
+    from batch import BatchRunner
+
+    async def run_batch():
+        if not adaptive:
+            return await BatchRunner(load_manifest(manifest), concurrency=concurrency, out_dir=out_dir).run()
+        use_core()
+        from core.admission import AdmissionController
+        admission = AdmissionController(max_slots=concurrency)
+        await admission.start()
+        try:
+            return await BatchRunner(load_manifest(manifest), out_dir=out_dir, admission=admission).run()
+        finally:
+            await admission.stop()
+
+    try:
+        results = asyncio.run(run_batch())
+        for result in results:
+            status = "ok" if not result['errors'] else f"{len(result['errors'])} errors"
+            typer.echo(f"{result['account']}: {result['count']} conversations ({status})")
+    except Exception as e:
+        logger.error(f"Batch scrape failed: {str(e)}", exc_info=True)
+        raise typer.Exit(1)
+
+@app.command()
+def schedule(
+    manifest: str = typer.Argument(..., help="JSON list of accounts with name, cookies_file and interval (e.g. 6h)"),
+    db_path: str = typer.Option("scheduler.db", help="Schedule state kept across restarts"),
+    out_dir: str = "scheduled",
+    max_concurrent: int = typer.Option(2, help="Accounts scraped at the same time"),
+    jitter: float = typer.Option(0.1, help="Random shift of each run as a fraction of its interval"),
+    overlap: str = typer.Option("skip", help="When a run is still going: 'skip' or 'coalesce'"),
+):
+    """Run periodic scrapes per account, spread out in time, until interrupted"""
+    use_core()
+    from core.scheduler import Scheduler, load_schedule
+    from accounts import account_slug, session_file_for
+
+    async def run_account(entry):
+        scraper = GeminiScraper(
+            urls=entry.get('urls'),
+            session_file=session_file_for(entry['name']),
+            output_file=str(Path(out_dir) / f"{account_slug(entry['name'])}.json")
+        )
+        records = await scraper.scrape(cookies_file=entry.get('cookies_file'), timeout=entry.get('timeout'))
+        # scrape() logs failures and returns what it got; the scheduler must not
+        # take a failed run for one that found nothing new
+        if scraper.errors:
+            url, error = scraper.errors[0]
+            raise RuntimeError(f"{len(scraper.errors)} failed, first at {url or 'setup'}: {str(error)}")
+        return records
+
+    try:
+        Path(out_dir).mkdir(parents=True, exist_ok=True)
+        scheduler = Scheduler(
+            load_schedule(manifest), run_account, db_path=db_path,
+            max_concurrent=max_concurrent, jitter=jitter, overlap=overlap
+        )
+        asyncio.run(scheduler.serve())
+    except KeyboardInterrupt:
+        typer.echo("Scheduler stopped")
+    except Exception as e:
+        logger.error(f"Scheduler failed: {str(e)}", exc_info=True)
+        raise typer.Exit(1)
+
+@app.command()
+def query(
+    path: str = typer.Argument("gemini_conversations.json", help="JSON or NDJSON results file"),
+    since: Optional[str] = typer.Option(None, help="Only conversations newer than this, e.g. 7d or 2024-02-01"),
+    until: Optional[str] = typer.Option(None, help="Only conversations older than this"),
+    title: Optional[str] = typer.Option(None, help="Title contains this (case-insensitive)"),
+    contains: Optional[str] = typer.Option(None, help="Content contains this"),
+    ignore_case: bool = typer.Option(False, "--ignore-case", "-i", help="Case-insensitive --contains"),
+    offset: int = typer.Option(0, help="Start at this record number"),
+    limit: Optional[int] = typer.Option(None, help="Stop after this many matches"),
+    as_json: bool = typer.Option(False, "--json", help="Print matching records as NDJSON"),
+    pager: bool = typer.Option(True, "--pager/--no-pager", help="Page the output"),
+):
+    """Filter a results file in constant memory, paging the matches.
+
+    The first full pass leaves a PATH.idx byte-offset index behind; later
+    runs use it to skip straight to --offset and to filter by time without
+    reading the records.
+    """
+    import itertools
+    import json
+    import shutil
+    import click
+    from query import RecordFilter, format_row, iter_records
+    try:
+        record_filter = RecordFilter(parse_bound(since), parse_bound(until), title, contains, ignore_case)
+        records = itertools.islice(iter_records(path, record_filter, start=offset), limit)
+        width = shutil.get_terminal_size().columns
+        lines = (json.dumps(record, ensure_ascii=False) + '\n' if as_json else format_row(record, width)
+                 for record in records)
+        if pager:
+            click.echo_via_pager(lines)
+        else:
+            for line in lines:
+                typer.echo(line, nl=False)
+    except (FileNotFoundError, ValueError) as e:
+        logger.error(f"Query failed: {str(e)}")
+        raise typer.Exit(1)
+
+@app.command()
+def head(
+    path: str = typer.Argument("gemini_conversations.json", help="JSON or NDJSON results file"),
+    lines: int = typer.Option(10, "-n", help="Number of records"),
+    offset: int = typer.Option(0, help="Start at this record number"),
+    as_json: bool = typer.Option(False, "--json", help="Print records as NDJSON"),
+):
+    """Show the first records of a results file, reading only as far as needed"""
+    import itertools
+    import json
+    import shutil
+    from query import format_row, iter_records
+    try:
+        width = shutil.get_terminal_size().columns
+        for record in itertools.islice(iter_records(path, start=offset, build_index=False), lines):
+            typer.echo(json.dumps(record, ensure_ascii=False) if as_json else format_row(record, width), nl=as_json)
+    except (FileNotFoundError, ValueError) as e:
+        logger.error(f"Head failed: {str(e)}")
+        raise typer.Exit(1)
+
+@app.command()
+def export(
+    path: str = typer.Argument(..., help="JSON or NDJSON results file"),
+    output: str = typer.Argument(..., help="File to write the matching records to"),
+    output_format: str = typer.Option("ndjson", "--format", help="'ndjson' or 'json'"),
+    since: Optional[str] = typer.Option(None, help="Only conversations newer than this, e.g. 7d or 2024-02-01"),
+    until: Optional[str] = typer.Option(None, help="Only conversations older than this"),
+    title: Optional[str] = typer.Option(None, help="Title contains this (case-insensitive)"),
+    contains: Optional[str] = typer.Option(None, help="Content contains this"),
+    ignore_case: bool = typer.Option(False, "--ignore-case", "-i", help="Case-insensitive --contains"),
+):
+    """Write the records matching the filters to a new file, streaming both ends"""
+    import json
+    from query import RecordFilter, iter_records
+    if output_format not in ('ndjson', 'json'):
+        raise typer.BadParameter(f"Unknown format: {output_format}")
+    try:
+        record_filter = RecordFilter(parse_bound(since), parse_bound(until), title, contains, ignore_case)
+        count = 0
+        with open(output, 'w', encoding='utf-8') as f:
+            if output_format == 'json':
+                f.write('[')
+            for record in iter_records(path, record_filter):
+                line = json.dumps(record, ensure_ascii=False)
+                if output_format == 'json':
+                    f.write(',\n  ' if count else '\n  ')
+                    f.write(line)
+                else:
+                    f.write(line + '\n')
+                count += 1
+            if output_format == 'json':
+                f.write('\n]\n' if count else ']\n')
+        typer.echo(f"Exported {count} conversations to {output}")
+    except (FileNotFoundError, ValueError) as e:
+        logger.error(f"Export failed: {str(e)}")
+        raise typer.Exit(1)
+
+archive_app = typer.Typer(help="Dictionary-compressed conversation archives")
+app.add_typer(archive_app, name="archive")
+
+def input_records(inputs: List[str]):
+    from query import iter_records
+    for path in inputs:
+        yield from iter_records(path, build_index=False)
+
+@archive_app.command("pack")
+def archive_pack(
+    inputs: List[str] = typer.Argument(..., help="JSON or NDJSON result files"),
+    archive: str = typer.Option(..., help="Archive directory, created if missing"),
+    sample: int = typer.Option(5000, help="Records sampled to train the first dictionary"),
+    dict_size: int = typer.Option(112640, help="Dictionary size in bytes"),
+    level: Optional[int] = typer.Option(None, help="zstd level for a new archive (default 9)"),
+):
+    """Add result files to an archive, training its first dictionary from them"""
+    from archive import Archive, NO_DICTIONARY, pack, reservoir_sample
+    try:
+        target = Archive(archive)
+        if level is not None and not len(target):
+            target.manifest['level'] = level
+        samples = None
+        if target.manifest['current'] == NO_DICTIONARY:
+            samples = reservoir_sample(input_records(inputs), sample)
+        added = pack(target, input_records(inputs), samples, dict_size)
+        typer.echo(f"Added {added} conversations to {archive} (dictionary v{target.manifest['current']})")
+    except (FileNotFoundError, ValueError) as e:
+        logger.error(f"Packing failed: {str(e)}")
+        raise typer.Exit(1)
+
+@archive_app.command("train")
+def archive_train(
+    inputs: List[str] = typer.Argument(..., help="JSON or NDJSON result files to sample"),
+    archive: str = typer.Option(..., help="Archive directory"),
+    sample: int = typer.Option(5000, help="Records sampled for training"),
+    dict_size: int = typer.Option(112640, help="Dictionary size in bytes"),
+):
+    """Train a new dictionary version from result files; later packs use it"""
+    from archive import Archive, reservoir_sample, train
+    target = Archive(archive)
+    samples = reservoir_sample(input_records(inputs), sample)
+    version = target.add_dictionary(train(samples, dict_size, target.manifest['level']), len(samples))
+    typer.echo(f"Current dictionary of {archive} is v{version}")
+
+@archive_app.command("retrain")
+def archive_retrain(
+    archive: str = typer.Argument(..., help="Archive directory"),
+    sample: int = typer.Option(5000, help="Records sampled for training"),
+    dict_size: int = typer.Option(112640, help="Dictionary size in bytes"),
+    migrate: bool = typer.Option(False, help="Recompress existing records with the new dictionary"),
+):
+    """Train a new dictionary version from the archive's own records"""
+    from archive import Archive
+    target = Archive(archive)
+    version = target.retrain(sample, dict_size)
+    typer.echo(f"Current dictionary of {archive} is v{version}")
+    if migrate:
+        typer.echo(f"Recompressed {target.migrate()} conversations")
+
+@archive_app.command("migrate")
+def archive_migrate(
+    archive: str = typer.Argument(..., help="Archive directory"),
+    level: Optional[int] = typer.Option(None, help="New zstd level"),
+    prune: bool = typer.Option(False, help="Delete dictionary versions no longer used"),
+):
+    """Recompress every record with the current dictionary"""
+    from archive import Archive
+    target = Archive(archive)
+    typer.echo(f"Recompressed {target.migrate(level, prune)} conversations")
+
+@archive_app.command("get")
+def archive_get(
+    archive: str = typer.Argument(..., help="Archive directory"),
+    numbers: List[int] = typer.Argument(..., help="Record numbers"),
+):
+    """Print records by number, decompressing only those"""
+    import json
+    from archive import Archive
+    target = Archive(archive)
+    try:
+        for number in numbers:
+            typer.echo(json.dumps(target.get(number), ensure_ascii=False))
+    except IndexError as e:
+        logger.error(str(e))
+        raise typer.Exit(1)
+    finally:
+        target.close()
+
+@archive_app.command("unpack")
+def archive_unpack(
+    archive: str = typer.Argument(..., help="Archive directory"),
+    output: str = typer.Argument(..., help="NDJSON file to write"),
+):
+    """Write every archived record back out as NDJSON"""
+    import json
+    from archive import Archive
+    target = Archive(archive)
+    count = 0
+    with open(output, 'w', encoding='utf-8') as f:
+        for record in target:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            count += 1
+    target.close()
+    typer.echo(f"Wrote {count} conversations to {output}")
+
+@archive_app.command("stats")
+def archive_stats(archive: str = typer.Argument(..., help="Archive directory")):
+    """Record count, compression ratio and dictionary versions in use"""
+    import json
+    from archive import Archive
+    target = Archive(archive)
+    typer.echo(json.dumps(target.stats(), indent=2))
+    target.close()
+
+@app.command()
+def interactive(
+    timeout: Optional[float] = typer.Option(None, help="Initial time budget in seconds; it can be changed in the TUI")
+):
     """Launch interactive TUI"""
     try:
-        app = GeminiTUI()
+        app = GeminiTUI(timeout=timeout)
         app.run()
     except Exception as e:
         logger.error(f"TUI failed to start: {str(e)}", exc_info=True)
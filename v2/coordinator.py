@@ -0,0 +1,334 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from accounts import account_slug, session_file_for
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shards (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    account TEXT NOT NULL,
+    cookies_file TEXT,
+    url TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    heartbeat REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    output TEXT,
+    UNIQUE (account, url)
+);
+CREATE INDEX IF NOT EXISTS shards_status ON shards (status, heartbeat);
+CREATE INDEX IF NOT EXISTS shards_account ON shards (account, status);
+CREATE TABLE IF NOT EXISTS account_leases (
+    account TEXT PRIMARY KEY,
+    worker TEXT NOT NULL,
+    heartbeat REAL NOT NULL
+);
+"""
+
+# A shard is claimable when no other shard of its account is running and its
+# account is not leased to another live worker. Shards of accounts this
+# worker already holds come first, so an account stays with one worker.
+CLAIM_SQL = """
+SELECT s.* FROM shards s
+LEFT JOIN account_leases a ON a.account = s.account
+WHERE (s.status = 'pending' OR (s.status = 'running' AND s.heartbeat < :stale))
+  AND NOT EXISTS (
+      SELECT 1 FROM shards r
+      WHERE r.account = s.account AND r.status = 'running' AND r.heartbeat >= :stale
+  )
+  AND (a.worker IS NULL OR a.worker = :worker OR a.heartbeat < :stale)
+ORDER BY COALESCE(a.worker = :worker AND a.heartbeat >= :stale, 0) DESC, s.attempts, s.id
+LIMIT 1
+"""
+
+class ShardQueue:
+    """Durable (account, url) work queue shared by worker processes through SQLite.
+
+    A shard is leased to a worker by stamping its ID and a heartbeat. Idle
+    workers pull the next pending shard, and steal running shards whose
+    heartbeat is older than the lease timeout, so work from a crashed or
+    stuck worker is picked up by the others.
+
+    Accounts are leased too: an account's shards run one at a time, in the
+    worker holding its lease, so they never share a session file with a
+    concurrent run and stay under that worker's rate limiter for the account.
+    """
+
+    def __init__(self, db_path: str, lease_timeout: float = 120, max_attempts: int = 3):
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        # Workers call in from a thread off their event loop
+        self.conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+
+    def submit(self, accounts: List[Dict], default_urls: List[str]) -> int:
+        """Add one shard per account and URL; already queued shards are kept"""
+        added = 0
+        for account in accounts:
+            for url in account.get('urls') or default_urls:
+                cursor = self.conn.execute(
+                    "INSERT OR IGNORE INTO shards (account, cookies_file, url) VALUES (?, ?, ?)",
+                    (account['name'], account.get('cookies_file'), url)
+                )
+                added += cursor.rowcount
+        return added
+
+    def claim(self, worker_id: str) -> Optional[Dict]:
+        now = time.time()
+        stale = now - self.lease_timeout
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Stale shards that already used up their attempts are given up on
+            self.conn.execute(
+                "UPDATE shards SET status = 'failed', error = 'lease expired' "
+                "WHERE status = 'running' AND heartbeat < ? AND attempts >= ?",
+                (stale, self.max_attempts)
+            )
+            row = self.conn.execute(CLAIM_SQL, {'stale': stale, 'worker': worker_id}).fetchone()
+            if row is None:
+                self.conn.execute('COMMIT')
+                return None
+            if row['status'] == 'running':
+                logger.warning(f"Stealing shard {row['id']} from {row['worker']}")
+            self.conn.execute(
+                "UPDATE shards SET status = 'running', worker = ?, heartbeat = ?, "
+                "attempts = attempts + 1 WHERE id = ?",
+                (worker_id, now, row['id'])
+            )
+            self.conn.execute(
+                "INSERT INTO account_leases (account, worker, heartbeat) VALUES (?, ?, ?) "
+                "ON CONFLICT (account) DO UPDATE SET worker = excluded.worker, heartbeat = excluded.heartbeat",
+                (row['account'], worker_id, now)
+            )
+            self.conn.execute('COMMIT')
+            return dict(row)
+        except Exception:
+            self.conn.execute('ROLLBACK')
+            raise
+
+    def heartbeat(self, shard_id: int, worker_id: str) -> bool:
+        """Renew a shard's lease and its account's; False means the shard was stolen by another worker"""
+        now = time.time()
+        cursor = self.conn.execute(
+            "UPDATE shards SET heartbeat = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (now, shard_id, worker_id)
+        )
+        self.conn.execute(
+            "UPDATE account_leases SET heartbeat = ? WHERE worker = ? "
+            "AND account = (SELECT account FROM shards WHERE id = ?)",
+            (now, worker_id, shard_id)
+        )
+        return cursor.rowcount == 1
+
+    def release(self, worker_id: str) -> None:
+        """Give up a worker's account leases, when it has nothing left to claim"""
+        self.conn.execute("DELETE FROM account_leases WHERE worker = ?", (worker_id,))
+
+    def complete(self, shard_id: int, worker_id: str, output: Optional[str]) -> None:
+        self.heartbeat(shard_id, worker_id)
+        self.conn.execute(
+            "UPDATE shards SET status = 'done', output = ?, error = NULL "
+            "WHERE id = ? AND worker = ?",
+            (output, shard_id, worker_id)
+        )
+
+    def fail(self, shard_id: int, worker_id: str, error: str) -> None:
+        self.heartbeat(shard_id, worker_id)
+        self.conn.execute(
+            "UPDATE shards SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "error = ?, worker = NULL WHERE id = ? AND worker = ?",
+            (self.max_attempts, error, shard_id, worker_id)
+        )
+
+    def counts(self) -> Dict[str, int]:
+        rows = self.conn.execute("SELECT status, COUNT(*) FROM shards GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def unfinished(self) -> int:
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM shards WHERE status IN ('pending', 'running')"
+        ).fetchone()[0]
+
+    def outputs(self) -> List[Dict]:
+        rows = self.conn.execute(
+            "SELECT account, url, output FROM shards WHERE status = 'done' ORDER BY id"
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+async def run_shard(shard: Dict, out_dir: str, limiter=None) -> Optional[str]:
+    """Scrape one (account, url) shard in its own browser; return the output file.
+
+    `limiter` is the account's rate limiter, shared by all of its shards in this worker.
+    """
+    from gemini_scraper import GeminiScraper
+
+    output_file = str(Path(out_dir) / f"{account_slug(shard['account'])}-{shard['id']}.json")
+    scraper = await GeminiScraper.create(
+        urls=[shard['url']],
+        session_file=session_file_for(shard['account']),
+        output_file=output_file
+    )
+    if limiter is not None:
+        scraper.limiter = limiter
+    conversations = await scraper.scrape(cookies_file=shard['cookies_file'])
+    if scraper.errors:
+        raise scraper.errors[0][1]
+    return output_file if conversations else None
+
+async def worker_loop(db_path: str, worker_id: str, out_dir: str, slots: int,
+                      lease_timeout: float, max_attempts: int, poll_interval: float = 5) -> None:
+    from aiolimiter import AsyncLimiter
+
+    queue = ShardQueue(db_path, lease_timeout=lease_timeout, max_attempts=max_attempts)
+    db_lock = asyncio.Lock()
+    # One limiter per account, kept across its shards; accounts stay with this worker
+    limiters: Dict[str, AsyncLimiter] = {}
+
+    async def db(method, *args):
+        """Run a queue call in a thread, one at a time, so SQLite never blocks the loop"""
+        async with db_lock:
+            return await asyncio.to_thread(method, *args)
+
+    def limiter_for(account: str) -> AsyncLimiter:
+        if account not in limiters:
+            limiters[account] = AsyncLimiter(
+                max_rate=int(os.getenv('RATE_LIMIT_REQUESTS', 30)),
+                time_period=int(os.getenv('RATE_LIMIT_SECONDS', 60))
+            )
+        return limiters[account]
+
+    async def keep_alive(shard: Dict) -> None:
+        while True:
+            await asyncio.sleep(lease_timeout / 4)
+            if not await db(queue.heartbeat, shard['id'], worker_id):
+                logger.warning(f"Lost lease on shard {shard['id']}")
+                return
+
+    async def slot() -> None:
+        while True:
+            shard = await db(queue.claim, worker_id)
+            if shard is None:
+                # Shards still running elsewhere may go stale and need stealing
+                if await db(queue.unfinished):
+                    await asyncio.sleep(poll_interval)
+                    continue
+                return
+
+            logger.info(f"{worker_id} scraping {shard['account']} {shard['url']}")
+            heartbeat = asyncio.create_task(keep_alive(shard))
+            try:
+                output = await run_shard(shard, out_dir, limiter_for(shard['account']))
+                await db(queue.complete, shard['id'], worker_id, output)
+            except Exception as e:
+                logger.error(f"Shard {shard['id']} failed: {str(e)}")
+                await db(queue.fail, shard['id'], worker_id, str(e))
+            finally:
+                heartbeat.cancel()
+
+    try:
+        await asyncio.gather(*(slot() for _ in range(slots)))
+    finally:
+        await db(queue.release, worker_id)
+
+def worker_main(db_path: str, worker_id: str, out_dir: str, slots: int,
+                lease_timeout: float, max_attempts: int) -> None:
+    """Process entry point: one event loop per worker process"""
+    # Spawned workers inherit the parent's sys.path, which includes the repo root
+    from core.logs import configure_logging
+    configure_logging()
+    asyncio.run(worker_loop(db_path, worker_id, out_dir, slots, lease_timeout, max_attempts))
+
+class Coordinator:
+    """Shards accounts and URLs across worker processes and merges their output.
+
+    Throughput grows with the number of workers until the per-account rate
+    limits are reached. Each account is worked by one worker at a time, so
+    adding workers helps only while there are more accounts than workers.
+    """
+
+    def __init__(self, db_path: str = 'coordinator.db', out_dir: str = 'shards',
+                 workers: Optional[int] = None, slots_per_worker: int = 1,
+                 lease_timeout: float = 120, max_attempts: int = 3):
+        self.db_path = db_path
+        self.out_dir = out_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.slots_per_worker = slots_per_worker
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.queue = ShardQueue(db_path, lease_timeout=lease_timeout, max_attempts=max_attempts)
+
+    def submit(self, accounts: List[Dict], urls: List[str]) -> int:
+        return self.queue.submit(accounts, urls)
+
+    def start_worker(self, ctx, index: int):
+        worker_id = f"worker-{index}-{uuid.uuid4().hex[:6]}"
+        process = ctx.Process(
+            target=worker_main,
+            args=(self.db_path, worker_id, self.out_dir, self.slots_per_worker,
+                  self.lease_timeout, self.max_attempts),
+            name=worker_id
+        )
+        process.start()
+        return process
+
+    def run(self, poll_interval: float = 2) -> Dict[str, int]:
+        """Run workers until every shard is done or failed; dead workers are replaced"""
+        Path(self.out_dir).mkdir(parents=True, exist_ok=True)
+        ctx = multiprocessing.get_context('spawn')
+        processes = [self.start_worker(ctx, i) for i in range(self.workers)]
+        try:
+            while True:
+                time.sleep(poll_interval)
+                unfinished = self.queue.unfinished()
+                for i, process in enumerate(processes):
+                    if not process.is_alive() and process.exitcode != 0 and unfinished:
+                        logger.warning(f"{process.name} exited with {process.exitcode}, restarting")
+                        processes[i] = self.start_worker(ctx, i)
+                if not unfinished and not any(p.is_alive() for p in processes):
+                    break
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                process.join()
+        counts = self.queue.counts()
+        logger.info(f"Shard status: {counts}")
+        return counts
+
+    def merge(self, output_file: str) -> int:
+        """Merge shard outputs into one file, tagging records with their account.
+
+        Records are copied whole, so fields added by later stages survive.
+        """
+        seen = set()
+        count = 0
+        with open(output_file, 'w', encoding='utf-8') as out:
+            out.write('[')
+            for shard in self.queue.outputs():
+                if not shard['output'] or not os.path.exists(shard['output']):
+                    continue
+                with open(shard['output'], 'r', encoding='utf-8') as f:
+                    for conv in json.load(f):
+                        key = (shard['account'], conv['content'])
+                        if key in seen:
+                            continue
+                        seen.add(key)
+                        out.write(',\n  ' if count else '\n  ')
+                        out.write(json.dumps({**conv, 'account': shard['account']}, ensure_ascii=False))
+                        count += 1
+            out.write('\n]\n' if count else ']\n')
+        logger.info(f"Merged {count} conversations into {output_file}")
+        return count
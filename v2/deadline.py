@@ -0,0 +1,104 @@
+import asyncio
+import time
+from typing import Awaitable, Dict, Optional, TypeVar
+
+T = TypeVar('T')
+
+# Share of a URL's budget given to each phase of scrape_url()
+PHASE_SHARES: Dict[str, float] = {
+    'navigate': 0.25,
+    'wait': 0.15,
+    'expand': 0.45,
+    'extract': 0.15,
+}
+
+class DeadlineExceeded(Exception):
+    """A phase ran out of time or the job was cancelled"""
+
+    def __init__(self, phase: str, cancelled: bool = False):
+        self.phase = phase
+        self.cancelled = cancelled
+        super().__init__(f"{phase} {'cancelled' if cancelled else 'ran out of time'}")
+
+class Deadline:
+    """Total time budget of one job, split into per-phase slices.
+
+    Each URL gets an even share of what is left when it starts, and each
+    phase a fixed share of that (PHASE_SHARES), never more than the total
+    remaining. cancel() ends every phase at its next check. Without a total
+    only cancellation applies.
+    """
+
+    def __init__(self, total: Optional[float] = None):
+        self.total = total
+        self.expires_at = time.monotonic() + total if total else None
+        self.url_budget = total
+        self.cancelled = asyncio.Event()
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+
+    def remaining(self) -> Optional[float]:
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.cancelled.is_set() or self.remaining() == 0.0
+
+    def begin_url(self, urls_left: int) -> None:
+        remaining = self.remaining()
+        if remaining is not None:
+            self.url_budget = remaining / max(1, urls_left)
+
+    def slice(self, phase: str) -> Optional[float]:
+        """Seconds the phase may take, or None when unbounded"""
+        remaining = self.remaining()
+        if remaining is None:
+            return None
+        return min(remaining, self.url_budget * PHASE_SHARES[phase])
+
+    def timeout_ms(self, phase: str, default: float) -> float:
+        """A Playwright timeout no longer than the phase's slice"""
+        budget = self.slice(phase)
+        return default if budget is None else max(1.0, min(default, budget * 1000))
+
+    def ends_at(self, phase: str) -> Optional[float]:
+        """Monotonic time at which a phase starting now runs out"""
+        budget = self.slice(phase)
+        return None if budget is None else time.monotonic() + budget
+
+    def check(self, phase: str, ends_at: Optional[float] = None) -> None:
+        """Raise DeadlineExceeded if cancelled, out of total time, or past `ends_at`"""
+        if self.cancelled.is_set():
+            raise DeadlineExceeded(phase, cancelled=True)
+        if self.remaining() == 0.0 or (ends_at is not None and time.monotonic() > ends_at):
+            raise DeadlineExceeded(phase)
+
+    async def run(self, phase: str, awaitable: Awaitable[T]) -> T:
+        """Await within the phase's slice; cancel() or timing out raises DeadlineExceeded"""
+        try:
+            self.check(phase)
+        except DeadlineExceeded:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise
+        task = asyncio.ensure_future(awaitable)
+        cancel_wait = asyncio.ensure_future(self.cancelled.wait())
+        try:
+            done, _ = await asyncio.wait({task, cancel_wait}, timeout=self.slice(phase),
+                                         return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        finally:
+            cancel_wait.cancel()
+        if task in done:
+            return task.result()
+        task.cancel()
+        try:
+            await task
+        except (asyncio.CancelledError, Exception):
+            pass
+        raise DeadlineExceeded(phase, cancelled=self.cancelled.is_set())
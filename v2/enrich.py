@@ -0,0 +1,224 @@
+import asyncio
+import logging
+import os
+import re
+import unicodedata
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from importlib import import_module
+from typing import Callable, Deque, Dict, List, Optional, Sequence, Tuple, Union
+
+from parsing import parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+Record = Dict[str, str]
+EnricherSpec = Union[str, Callable[[Record], Record]]
+
+WHITESPACE = re.compile(r'\s+')
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+# Dominant Unicode script -> language, for text that needs no statistical model
+SCRIPT_LANGUAGES = (
+    ('HIRAGANA', 'ja'), ('KATAKANA', 'ja'), ('HANGUL', 'ko'), ('CJK', 'zh'),
+    ('CYRILLIC', 'ru'), ('ARABIC', 'ar'), ('HEBREW', 'he'), ('GREEK', 'el'),
+    ('THAI', 'th'), ('DEVANAGARI', 'hi'),
+)
+
+try:
+    from langdetect import DetectorFactory, detect as _langdetect
+    DetectorFactory.seed = 0
+except ImportError:
+    _langdetect = None
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding('cl100k_base')
+except ImportError:
+    _encoding = None
+
+def normalize_whitespace(record: Record) -> Record:
+    """Collapse runs of whitespace in content and title"""
+    record['content'] = WHITESPACE.sub(' ', unicodedata.normalize('NFC', record['content'])).strip()
+    if record.get('title'):
+        record['title'] = WHITESPACE.sub(' ', record['title']).strip()
+    return record
+
+def normalize_timestamp(record: Record) -> Record:
+    """Rewrite the timestamp as UTC ISO 8601, whatever form it arrived in"""
+    parsed = parse_timestamp(record.get('timestamp'))
+    record['timestamp'] = parsed.isoformat() if parsed else None
+    return record
+
+def detect_language(record: Record) -> Record:
+    """ISO 639-1 code from langdetect when installed, else from the dominant script"""
+    text = record['content']
+    if _langdetect is not None:
+        try:
+            record['language'] = _langdetect(text)
+            return record
+        except Exception:
+            pass
+    counts: Dict[str, int] = {}
+    for char in text[:500]:
+        if char.isalpha():
+            name = unicodedata.name(char, '')
+            for script, language in SCRIPT_LANGUAGES:
+                if name.startswith(script):
+                    counts[language] = counts.get(language, 0) + 1
+                    break
+            else:
+                counts['latin'] = counts.get('latin', 0) + 1
+    best = max(counts, key=counts.get) if counts else None
+    # Latin script alone cannot tell English from other languages
+    record['language'] = None if best in (None, 'latin') else best
+    return record
+
+def count_tokens(record: Record) -> Record:
+    """Token count of the content: tiktoken's cl100k when installed, else words and punctuation"""
+    text = record['content']
+    record['tokens'] = len(_encoding.encode(text)) if _encoding else len(TOKEN_PATTERN.findall(text))
+    return record
+
+ENRICHERS: Dict[str, Callable[[Record], Record]] = {
+    'whitespace': normalize_whitespace,
+    'timestamp': normalize_timestamp,
+    'language': detect_language,
+    'tokens': count_tokens,
+}
+DEFAULT_ENRICHERS = ('whitespace', 'timestamp', 'language', 'tokens')
+
+def resolve_enricher(spec: EnricherSpec) -> Callable[[Record], Record]:
+    """A built-in name, a 'module:function' path, or a module-level function.
+
+    Enrichers run in worker processes, so they must be importable by name.
+    """
+    if callable(spec):
+        return spec
+    if spec in ENRICHERS:
+        return ENRICHERS[spec]
+    if ':' in spec:
+        module, name = spec.split(':', 1)
+        return getattr(import_module(module), name)
+    raise ValueError(f"Unknown enricher: {spec}")
+
+def enrich_batch(enrichers: Sequence[Callable[[Record], Record]],
+                 batch: List[Record]) -> Tuple[List[Record], Dict[str, Tuple[int, str]]]:
+    """Worker-side: apply every enricher to every record of a batch.
+
+    A record an enricher fails on is passed on as it was, so one bad record
+    or enricher costs only that field. Failures come back per enricher as
+    (count, first error) for the parent to log, since workers have no log
+    handler of their own.
+    """
+    failures: Dict[str, Tuple[int, str]] = {}
+    for enricher in enrichers:
+        enriched = []
+        for record in batch:
+            try:
+                record = enricher(record)
+            except Exception as e:
+                count, first = failures.get(enricher.__name__, (0, f"{type(e).__name__}: {e}"))
+                failures[enricher.__name__] = (count + 1, first)
+            enriched.append(record)
+        batch = enriched
+    return batch, failures
+
+class Enricher:
+    """CPU-bound post-processing of conversation records in a process pool.
+
+    Records are cut into batches of `batch_size` and dispatched to
+    `workers` processes. At most `max_pending` batches are in flight;
+    submit() waits for a free slot, which is what pushes back on the
+    scraper when enrichment falls behind.
+    """
+
+    def __init__(self, enrichers: Optional[Sequence[EnricherSpec]] = None, workers: Optional[int] = None,
+                 batch_size: int = 256, max_pending: Optional[int] = None, ordered: bool = True):
+        self.enrichers = tuple(resolve_enricher(spec) for spec in enrichers or DEFAULT_ENRICHERS)
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.ordered = ordered
+        self.slots = asyncio.Semaphore(max_pending or 2 * self.workers)
+        self.pool: Optional[ProcessPoolExecutor] = None
+
+    async def submit(self, batch: List[Record]) -> asyncio.Future:
+        """Dispatch one batch once a slot is free; the future resolves to the enriched batch"""
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        await self.slots.acquire()
+        future = asyncio.get_running_loop().run_in_executor(self.pool, enrich_batch, self.enrichers, batch)
+        future.add_done_callback(lambda _: self.slots.release())
+        return asyncio.ensure_future(self.collect(future))
+
+    @staticmethod
+    async def collect(future: asyncio.Future) -> List[Record]:
+        batch, failures = await future
+        for name, (count, first) in failures.items():
+            logger.warning(f"Enricher {name} failed on {count} of {len(batch)} records, first: {first}")
+        return batch
+
+    def chunks(self, records: List[Record]) -> List[List[Record]]:
+        return [records[i:i + self.batch_size] for i in range(0, len(records), self.batch_size)]
+
+    async def run(self, records: List[Record]) -> List[Record]:
+        """Enrich a whole list; the input order is kept unless `ordered` is False"""
+        futures = [await self.submit(chunk) for chunk in self.chunks(records)]
+        if self.ordered:
+            batches = await asyncio.gather(*futures)
+        else:
+            batches = [await future for future in asyncio.as_completed(futures)]
+        return [record for batch in batches for record in batch]
+
+    async def close(self) -> None:
+        """Shut the pool down off the event loop; it waits for running batches"""
+        if self.pool:
+            pool, self.pool = self.pool, None
+            await asyncio.to_thread(pool.shutdown)
+
+class EnrichingSink:
+    """Sink wrapper that enriches batches before passing them on.
+
+    write() returns once the batch is handed to the pool, so extraction
+    overlaps with enrichment, and blocks while `max_pending` batches are in
+    flight. Results reach the wrapped sink in arrival order when `ordered`,
+    otherwise as soon as each batch is done.
+    """
+
+    def __init__(self, sink, enricher: Enricher):
+        self.sink = sink
+        self.enricher = enricher
+        self.buffer: List[Record] = []
+        self.pending: Deque[asyncio.Future] = deque()
+
+    async def write(self, batch: List[Record]) -> None:
+        self.buffer.extend(batch)
+        while len(self.buffer) >= self.enricher.batch_size:
+            chunk = self.buffer[:self.enricher.batch_size]
+            del self.buffer[:self.enricher.batch_size]
+            self.pending.append(await self.enricher.submit(chunk))
+        await self.drain(wait=False)
+
+    async def drain(self, wait: bool) -> None:
+        if self.enricher.ordered:
+            while self.pending and (wait or self.pending[0].done()):
+                await self.sink.write(await self.pending.popleft())
+            return
+        if wait:
+            for future in asyncio.as_completed(list(self.pending)):
+                await self.sink.write(await future)
+            self.pending.clear()
+            return
+        for future in [future for future in self.pending if future.done()]:
+            self.pending.remove(future)
+            await self.sink.write(future.result())
+
+    async def close(self) -> None:
+        try:
+            if self.buffer:
+                self.pending.append(await self.enricher.submit(self.buffer))
+                self.buffer = []
+            await self.drain(wait=True)
+        finally:
+            await self.enricher.close()
+            await self.sink.close()
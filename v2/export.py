@@ -0,0 +1,106 @@
+import hashlib
+import json
+import logging
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ['timestamp', 'title', 'content', 'conversation_id', 'url']
+PARTITION_FORMATS = {
+    'day': ('date', '%Y-%m-%d'),
+    'month': ('month', '%Y-%m'),
+}
+FILE_SUFFIXES = {
+    'parquet': '.parquet',
+    'arrow': '.arrow',
+}
+
+def conversations_to_frame(conversations: Iterable[Dict[str, str]]) -> pd.DataFrame:
+    """Normalize conversation dicts into a typed frame.
+
+    Timestamps become UTC datetimes (unparseable values are NaT), titles
+    become a categorical column so they are dictionary-encoded on write, and
+    a content hash column lets incremental exports skip rows already written.
+    """
+    df = pd.DataFrame.from_records(list(conversations), columns=COLUMNS)
+    df['timestamp'] = pd.to_datetime(df['timestamp'], utc=True, errors='coerce', format='mixed')
+    df['title'] = df['title'].astype('category')
+    df['content_hash'] = [
+        hashlib.blake2b(str(content).encode(), digest_size=8).hexdigest()
+        for content in df['content']
+    ]
+    return df
+
+def read_json_conversations(path: str) -> List[Dict[str, str]]:
+    """Load a results file written as a JSON array or as NDJSON"""
+    with open(path, 'r', encoding='utf-8') as f:
+        first = f.read(1)
+        while first and first.isspace():
+            first = f.read(1)
+        f.seek(0)
+        if first == '[':
+            return json.load(f)
+        return [json.loads(line) for line in f if line.strip()]
+
+def existing_hashes(partition_dir: Path, file_format: str) -> set:
+    """Read only the content_hash column of a partition's existing files"""
+    if not partition_dir.exists():
+        return set()
+    dataset = ds.dataset(str(partition_dir), format='ipc' if file_format == 'arrow' else 'parquet')
+    return set(dataset.to_table(columns=['content_hash']).column('content_hash').to_pylist())
+
+def write_table(table: pa.Table, path: Path, file_format: str, compression: str) -> None:
+    if file_format == 'parquet':
+        pq.write_table(table, path, compression=compression, use_dictionary=True)
+    else:
+        options = pa.ipc.IpcWriteOptions(compression=compression)
+        with pa.OSFile(str(path), 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+                writer.write_table(table)
+
+def export_conversations(conversations: Iterable[Dict[str, str]], out_dir: str,
+                         partition: str = 'day', file_format: str = 'parquet',
+                         compression: str = 'zstd') -> int:
+    """Append conversations to a date-partitioned columnar dataset.
+
+    Each call adds a new part file to every touched partition, so earlier
+    files are never rewritten. Rows whose content is already present in the
+    partition are dropped. Returns the number of rows written.
+    """
+    if partition not in PARTITION_FORMATS:
+        raise ValueError(f"Unknown partitioning: {partition}")
+    if file_format not in FILE_SUFFIXES:
+        raise ValueError(f"Unknown format: {file_format}")
+
+    df = conversations_to_frame(conversations)
+    if df.empty:
+        return 0
+
+    key, date_format = PARTITION_FORMATS[partition]
+    partition_values = df['timestamp'].dt.strftime(date_format).fillna('unknown')
+    run_id = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+    written = 0
+
+    for value, group in df.groupby(partition_values, sort=True):
+        partition_dir = Path(out_dir) / f"{key}={value}"
+        group = group[~group['content_hash'].isin(existing_hashes(partition_dir, file_format))]
+        group = group.drop_duplicates('content_hash')
+        if group.empty:
+            continue
+        partition_dir.mkdir(parents=True, exist_ok=True)
+        table = pa.Table.from_pandas(group, preserve_index=False)
+        path = partition_dir / f"part-{run_id}{FILE_SUFFIXES[file_format]}"
+        write_table(table, path, file_format, compression)
+        written += len(group)
+        logger.debug("Wrote %d rows to %s", len(group), path)
+
+    logger.info(f"Exported {written} conversations to {out_dir}")
+    return written
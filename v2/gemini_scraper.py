@@ -1,41 +1,154 @@
 import asyncio
+import gzip
+import hashlib
+import itertools
 import json
 import logging
 import os
 import random
-from datetime import datetime
+import sys
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 from fake_useragent import UserAgent
 from pathlib import Path
 from cryptography.fernet import Fernet
-from playwright.async_api import async_playwright, Browser, Page
-from typing import List, Dict, Optional
+from playwright.async_api import async_playwright, Browser
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+from typing import List, Dict, Optional, Tuple
 from aiolimiter import AsyncLimiter
+from urllib.parse import urlparse
+from deadline import Deadline, DeadlineExceeded
+from parsing import (
+    CONVERSATION_SELECTOR, TITLE_SELECTOR, build_conversation, epoch_ms, in_window, jslog_timestamp,
+    parse_timestamp
+)
+from records import ConversationBatch
+from har import record_options, redact_har, replay_har
+from resilience import (
+    AuthRequiredError, CaptchaRequiredError, CircuitOpenError, RetryPolicy, ScrapeError,
+    SelectorNotFoundError
+)
 
 # Load environment variables
 load_dotenv()
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+SHOW_MORE_SELECTOR = "[data-test-id='show-more-button']"
+# Hard stop for show-more expansion even without a deadline
+MAX_SHOW_MORE_CLICKS = int(os.getenv('MAX_SHOW_MORE_CLICKS', 1000))
+
+# In-page twin of parse_timestamp(): epoch milliseconds of an item's jslog
+# timestamp, or null when it has none.
+ITEM_TIME_JS = """
+const itemTime = (el) => {
+    const match = (el.getAttribute('jslog') || '').match(/timestamp=([^;]+)/);
+    if (!match) return null;
+    const raw = match[1].replace(/"/g, '').trim();
+    if (/^\\d+$/.test(raw)) {
+        const n = Number(raw);
+        return n > 1e14 ? n / 1000 : n > 1e11 ? n : n * 1000;
+    }
+    const parsed = Date.parse(raw);
+    return isNaN(parsed) ? null : parsed;
+};
+"""
+
+# Collects every conversation item not seen by a previous call, tags it so the
+# next call skips it, and optionally hides or detaches it to keep the DOM small.
+# Items outside the [since, until] window are tagged but never read. Also
+# reports the oldest timestamp among the new items for early termination.
+EXTRACT_NEW_ITEMS_JS = """
+([selector, titleSelector, prune, since, until]) => {
+""" + ITEM_TIME_JS + """
+    const items = [];
+    let oldest = null;
+    for (const el of document.querySelectorAll(selector + ':not([data-scraped])')) {
+        el.setAttribute('data-scraped', '1');
+        const time = itemTime(el);
+        if (time !== null && (oldest === null || time < oldest)) {
+            oldest = time;
+        }
+        const inWindow = time === null || ((since === null || time >= since) && (until === null || time <= until));
+        if (inWindow) {
+            const titleEl = el.querySelector(titleSelector);
+            items.push({
+                title: titleEl ? titleEl.textContent : '',
+                content: el.textContent || '',
+                jslog: el.getAttribute('jslog'),
+                href: el.getAttribute('href') || (el.querySelector('a[href]') || {}).href || null,
+            });
+        }
+        if (prune === 'hide') {
+            el.style.display = 'none';
+        } else if (prune === 'detach') {
+            el.remove();
+        }
+    }
+    return {items, oldest};
+}
+"""
+
+# Oldest timestamp among the last few loaded items; the list is newest first,
+# so only the tail needs checking after each expansion.
+OLDEST_LOADED_JS = """
+(selector) => {
+""" + ITEM_TIME_JS + """
+    const times = Array.from(document.querySelectorAll(selector)).slice(-5)
+        .map(itemTime).filter(time => time !== null);
+    return times.length ? Math.min(...times) : null;
+}
+"""
+
+def write_snapshot(path: Path, html: str) -> None:
+    """Compress and write a snapshot; blocking, so it is called in a thread"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(gzip.compress(html.encode('utf-8'), 6))
+
 class GeminiScraper:
     @classmethod
-    async def create(cls):
-        instance = cls()
+    async def create(cls, **kwargs):
+        instance = cls(**kwargs)
         await instance.setup()
         return instance
 
-    def __init__(self):
+    def __init__(self, urls: Optional[List[str]] = None, session_file: str = '.session',
+                 output_file: str = 'gemini_conversations.json', near_duplicates=None,
+                 record_har: Optional[str] = None, replay_har: Optional[str] = None,
+                 replay_latency: float = 0.0, snapshot_dir: Optional[str] = None, enricher=None, sink=None):
         self.cipher = Fernet(os.getenv('ENCRYPTION_KEY'))
         self.ua = UserAgent()
         self.proxy_pool = json.loads(os.getenv('PROXY_POOL', '[]'))
         self.current_proxy = None
-        self.urls = [
+        self.urls = urls or [
             os.getenv('GEMINI_URL'),
             os.getenv('ACTIVITY_URL')
         ]
+        self.session_file = session_file
+        self.output_file = output_file
+        self.errors = []
+        self.since = None
+        self.until = None
+        self.retry_policy = RetryPolicy()
+        # Time budget and cancellation of the current job; truncated is set when
+        # a phase is cut short and the output is partial
+        self.deadline = Deadline()
+        self.truncated = False
+        # Optional neardup.NearDuplicateFilter applied after exact dedup
+        self.near_duplicates = near_duplicates
+        # Record network traffic to a HAR, or serve it from one instead of the network
+        self.record_har = record_har
+        self.replay_har = replay_har
+        self.replay_latency = replay_latency
+        # Directory for gzipped DOM snapshots that reextract.py can parse offline
+        self.snapshot_dir = snapshot_dir
+        # Optional enrich.Enricher run over the results before they are saved
+        self.enricher = enricher
+        # Optional sink (e.g. sinks.FanOutSink) that receives the results instead of output_file
+        self.sink = sink
+        self.playwright = None
         self.browser = None
+        self.owns_browser = True
         self.context = None
         self.page = None
         self.sid_cookie = None
@@ -53,14 +166,14 @@ class GeminiScraper:
         try:
             logger.debug("Starting Playwright browser...")
             await self.rotate_proxy()
-            playwright = await async_playwright().start()
+            self.playwright = await async_playwright().start()
             proxy = {
                 'server': self.current_proxy,
                 'username': os.getenv('PROXY_USER'),
                 'password': os.getenv('PROXY_PASS')
-            } if self.current_proxy else None
+            } if self.current_proxy and not self.replay_har else None
 
-            self.browser = await playwright.chromium.launch(
+            self.browser = await self.playwright.chromium.launch(
                 headless=True,  # Set to True for production
                 proxy=proxy,
                 args=[
@@ -69,45 +182,91 @@ class GeminiScraper:
                 ]
             )
             # Use existing browser context
-            self.context = await self.browser.new_context(
+            await self.new_context(
                 user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/121.0.0.0 Safari/537.36"
             )
-            self.page = await self.context.new_page()
+            await self.open_page()
             logger.info("Browser setup complete")
 
-            # Intercept network responses
-            async def handle_response(response):
-                headers = response.headers
-                set_cookie_header = headers.get('set-cookie')
-
-                if set_cookie_header:
-                    # Check if the Set-Cookie header contains the SID cookie
-                    if isinstance(set_cookie_header, list):
-                        sid_cookie = next((cookie for cookie in set_cookie_header if cookie.startswith('SID=')), None)
-                    else:
-                        sid_cookie = set_cookie_header if set_cookie_header.startswith('SID=') else None
-                    if sid_cookie:
-                        # Extract the SID value
-                        sid_value = sid_cookie.split(';')[0].split('=')[1]
-                        logger.info('Extracted SID: %s', sid_value)
-                        self.sid_cookie = sid_value
-                        # You can now store this value and use it later
-                        await self.store_cookie(sid_value)
-
-            self.page.on('response', handle_response)
-
         except Exception as e:
             logger.error(f"Failed to setup browser: {str(e)}", exc_info=True)
             raise
 
+    async def new_context(self, **options) -> None:
+        """Create the working context, recording or replaying a HAR when configured"""
+        if self.record_har:
+            options.update(record_options(self.record_har))
+        if self.replay_har:
+            options.pop('proxy', None)
+        self.context = await self.browser.new_context(**options)
+        if self.replay_har:
+            await replay_har(self.context, self.replay_har, self.replay_latency)
+
+    async def open_page(self) -> None:
+        """Open the working page and watch its responses for the SID cookie"""
+        self.page = await self.context.new_page()
+        self.page.on('response', self.handle_response)
+
+    async def handle_response(self, response):
+        headers = response.headers
+        set_cookie_header = headers.get('set-cookie')
+
+        if set_cookie_header:
+            # Check if the Set-Cookie header contains the SID cookie
+            if isinstance(set_cookie_header, list):
+                sid_cookie = next((cookie for cookie in set_cookie_header if cookie.startswith('SID=')), None)
+            else:
+                sid_cookie = set_cookie_header if set_cookie_header.startswith('SID=') else None
+            if sid_cookie:
+                # Extract the SID value
+                sid_value = sid_cookie.split(';')[0].split('=')[1]
+                logger.info('Extracted SID: %s', sid_value)
+                self.sid_cookie = sid_value
+                # You can now store this value and use it later
+                await self.store_cookie(sid_value)
+
+    async def attach(self, browser: Browser, proxy: Optional[Dict[str, str]] = None,
+                     user_agent: Optional[str] = None) -> None:
+        """Use an isolated context on a shared browser instead of launching one.
+
+        The shared browser is left running by close(); only this context is closed.
+        The context's proxy is what retries count proxy failures against, so
+        one account's bad proxy does not open the shared target breaker.
+        """
+        self.browser = browser
+        self.owns_browser = False
+        options = {'user_agent': user_agent or self.ua.random}
+        if proxy:
+            options['proxy'] = proxy
+        server = proxy.get('server') if proxy else None
+        self.current_proxy = server if server and server != 'direct://' else None
+        await self.new_context(**options)
+        await self.open_page()
+
+    async def close(self) -> None:
+        """Release the browser, or only this scraper's context when attached"""
+        if self.context:
+            # Closing the context is what writes a recorded HAR
+            await self.context.close()
+            self.context = None
+            if self.record_har:
+                redact_har(self.record_har)
+        if not self.owns_browser:
+            return
+        if self.browser:
+            await self.browser.close()
+        if self.playwright:
+            await self.playwright.stop()
+            self.playwright = None
+
     async def store_cookie(self, sid):
         encrypted = self.cipher.encrypt(sid.encode())
-        with open('.session', 'wb') as f:
+        with open(self.session_file, 'wb') as f:
             f.write(encrypted)
 
     async def load_cookie(self):
         try:
-            with open('.session', 'rb') as f:
+            with open(self.session_file, 'rb') as f:
                 return self.cipher.decrypt(f.read()).decode()
         except FileNotFoundError:
             return None
@@ -115,7 +274,7 @@ class GeminiScraper:
     async def inject_cookies(self, cookies_file: str) -> None:
         """Load and inject cookies from file"""
         try:
-            logger.debug(f"Loading cookies from {cookies_file}")
+            logger.debug("Loading cookies from %s", cookies_file)
             cookies_path = Path(cookies_file)
             if not cookies_path.exists():
                 raise FileNotFoundError(f"Cookies file not found: {cookies_file}")
@@ -160,27 +319,32 @@ class GeminiScraper:
             "[jslog]"
         ]
         
+        ends_at = self.deadline.ends_at('wait')
         for selector in selectors:
+            self.deadline.check('wait', ends_at)
             try:
-                logger.debug(f"Trying selector: {selector}")
-                await self.page.wait_for_selector(selector, timeout=5000)
+                logger.debug("Trying selector: %s", selector)
+                await self.page.wait_for_selector(selector, timeout=self.deadline.timeout_ms('wait', 5000))
                 logger.info(f"Found conversations using selector: {selector}")
                 return selector
             except Exception:
                 continue
                 
-        raise TimeoutError("Could not find conversation elements")
+        raise SelectorNotFoundError("Could not find conversation elements")
 
     async def extract_conversations(self) -> List[Dict[str, str]]:
-        """Extract conversations from the page"""
+        """Extract conversations from the page.
+
+        Raises SelectorNotFoundError when the page never shows a conversation
+        element, so the caller can classify and retry it.
+        """
+        logger.debug("Starting conversation extraction")
+        selector = await self.wait_for_conversations()
         try:
-            logger.debug("Starting conversation extraction")
-            selector = await self.wait_for_conversations()
-            
             conversations = []
             
             # Try to find conversation list items
-            elements = await self.page.query_selector_all(".mat-mdc-tooltip-trigger.conversation")
+            elements = await self.page.query_selector_all(CONVERSATION_SELECTOR)
             
             if not elements:
                 logger.warning(f"No elements found with selector: {selector}")
@@ -188,40 +352,54 @@ class GeminiScraper:
                 
             logger.info(f"Found {len(elements)} potential conversation elements")
             
+            # Per-item outcomes are counted and logged once; per-item debug lines
+            # are only built when DEBUG is on
+            debug = logger.isEnabledFor(logging.DEBUG)
+            skipped = short = failed = 0
+            first_error = None
+            ends_at = self.deadline.ends_at('extract')
             for element in elements:
                 try:
+                    self.deadline.check('extract', ends_at)
+                except DeadlineExceeded as e:
+                    self.mark_truncated(e)
+                    break
+                try:
+                    # Skip items outside the time window before reading them
+                    jslog = await element.get_attribute("jslog")
+                    if not in_window(jslog_timestamp(jslog), self.since, self.until):
+                        skipped += 1
+                        continue
+
                     # Get conversation title from label span
                     title = ""
-                    title_element = await element.query_selector(".mdc-button__label")
+                    title_element = await element.query_selector(TITLE_SELECTOR)
                     if title_element:
                         title = await title_element.text_content()
                     
                     # Get conversation content
                     content = await element.text_content()
+                    href = await element.get_attribute("href")
                     
-                    # Try to find timestamp from jslog attribute
-                    timestamp = None
-                    jslog = await element.get_attribute("jslog")
-                    if jslog and "timestamp" in jslog:
-                        timestamp = jslog.split("timestamp=")[1].split(";")[0]
-                    else:
-                        timestamp = datetime.now().isoformat()
-                    
-                    # Skip empty or very short content
-                    if len(content.strip()) > 10:  # Minimum content length
-                        conversation = {
-                            'timestamp': timestamp,
-                            'content': content.strip()
-                        }
-                        if title:
-                            conversation['title'] = title.strip()
+                    conversation = build_conversation(title, content, jslog, href)
+                    if conversation:
                         conversations.append(conversation)
-                        logger.debug(f"Extracted conversation: {title or 'Untitled'}")
+                        if debug:
+                            logger.debug("Extracted conversation: %s", conversation.get('title', 'Untitled'))
+                    else:
+                        short += 1
                 except Exception as e:
-                    logger.warning(f"Failed to extract conversation: {str(e)}")
+                    failed += 1
+                    first_error = first_error or e
                     continue
             
-            logger.info(f"Successfully extracted {len(conversations)} conversations")
+            if failed:
+                logger.warning("Failed to extract %d conversations, first error: %s", failed, first_error)
+            logger.info(
+                "Extracted %d conversations", len(conversations),
+                extra={'extracted': len(conversations), 'elements': len(elements),
+                       'out_of_window': skipped, 'too_short': short, 'failed': failed}
+            )
             return conversations
             
         except Exception as e:
@@ -235,75 +413,196 @@ class GeminiScraper:
             await self.page.wait_for_timeout(1000)  # Default delay
             return response
 
-    async def scrape(self, cookies_file: Optional[str] = None) -> List[Dict[str, str]]:
-        """Main scraping method"""
+    async def prepare(self, cookies_file: Optional[str] = None) -> None:
+        """Restore the stored session, start a browser unless one is open, and inject cookies"""
+        sid_cookie = await self.load_cookie()
+        if sid_cookie:
+            self.sid_cookie = sid_cookie
+            logger.info("Loaded SID cookie from storage")
+        
+        if not self.page:
+            await self.setup()
+        
+        if cookies_file:
+            await self.inject_cookies(cookies_file)
+
+    async def open_url(self, url: str) -> None:
+        """Navigate to a URL and wait for dynamic content to settle"""
+        logger.debug("Trying URL: %s", url)
+        await self.safe_request(url)
+        
+        # Wait for authentication and content to load
+        await self.page.wait_for_load_state('networkidle')
+        if 'accounts.google.com' in self.page.url:
+            raise AuthRequiredError(f"Redirected to login: {self.page.url}")
+        if '/sorry/' in self.page.url:
+            raise CaptchaRequiredError(f"Bot check page: {self.page.url}")
+        await asyncio.sleep(2)  # Give dynamic content time to load
+
+    async def click_show_more(self) -> bool:
+        """Click the show-more button once; return False when it is gone"""
         try:
-            sid_cookie = await self.load_cookie()
-            if sid_cookie:
-                self.sid_cookie = sid_cookie
-                logger.info("Loaded SID cookie from storage")
-            
-            if not self.sid_cookie:
-                await self.setup()
-            
-            if cookies_file:
-                await self.inject_cookies(cookies_file)
+            show_more = await self.page.wait_for_selector(SHOW_MORE_SELECTOR, timeout=2000)
+        except PlaywrightTimeoutError:
+            return False
+        if not show_more:
+            return False
+        await show_more.click()
+        return True
+
+    async def oldest_loaded(self) -> Optional[datetime]:
+        """Timestamp of the oldest item currently loaded in the list"""
+        oldest = await self.page.evaluate(OLDEST_LOADED_JS, CONVERSATION_SELECTOR)
+        return parse_timestamp(int(oldest)) if oldest is not None else None
+
+    def past_window(self, oldest: Optional[datetime]) -> bool:
+        """True once loaded items are older than `since`, so expanding further is pointless"""
+        return self.since is not None and oldest is not None and oldest < self.since
+
+    async def expand(self) -> None:
+        """Click show-more until the list is exhausted or has left the time window"""
+        for _ in range(MAX_SHOW_MORE_CLICKS):
+            if self.past_window(await self.oldest_loaded()) or not await self.click_show_more():
+                return
+            await asyncio.sleep(1)  # Wait for new items to load
+        logger.warning(f"Stopped expanding after {MAX_SHOW_MORE_CLICKS} clicks")
+        self.truncated = True
+
+    def cancel(self) -> None:
+        """Stop the running job at its next check; what was collected is kept"""
+        self.deadline.cancel()
+
+    def mark_truncated(self, error: DeadlineExceeded) -> None:
+        self.truncated = True
+        logger.warning(f"Output truncated: {str(error)}")
+
+    def start_job(self, timeout: Optional[float]) -> None:
+        self.deadline = Deadline(timeout)
+        self.truncated = False
+
+    async def extract_new_items(self, prune: Optional[str] = None) -> Tuple[List[Dict[str, str]], Optional[datetime]]:
+        """Extract only the items appended since the previous call in one round trip.
+
+        Returns the in-window conversations and the oldest timestamp seen among
+        the new items.
+        """
+        result = await self.page.evaluate(
+            EXTRACT_NEW_ITEMS_JS,
+            [CONVERSATION_SELECTOR, TITLE_SELECTOR, prune, epoch_ms(self.since), epoch_ms(self.until)]
+        )
+        oldest = parse_timestamp(int(result['oldest'])) if result['oldest'] is not None else None
+        conversations = []
+        for item in result['items']:
+            conversation = build_conversation(item['title'], item['content'], item['jslog'], item['href'])
+            if conversation:
+                conversations.append(conversation)
+        return conversations, oldest
+
+    async def scrape_url(self, url: str) -> List[Dict[str, str]]:
+        """Open one URL, expand it if it is the PWA, and extract its conversations.
+
+        Each phase runs within its slice of the deadline. Running out of time
+        while expanding still extracts what has loaded; other phases return
+        what they have.
+        """
+        try:
+            await self.deadline.run('navigate', self.open_url(url))
+        except DeadlineExceeded as e:
+            self.mark_truncated(e)
+            return []
+        
+        # For PWA, try to expand the conversation list
+        if "gemini.google.com" in url:
+            try:
+                await self.deadline.run('expand', self.expand())
+            except DeadlineExceeded as e:
+                self.mark_truncated(e)
+                if e.cancelled:
+                    return []
+        
+        try:
+            conversations = await self.extract_conversations()
+        except DeadlineExceeded as e:
+            self.mark_truncated(e)
+            return []
+        if self.snapshot_dir:
+            await self.archive_snapshot(url)
+        return conversations
+
+    async def archive_snapshot(self, url: str) -> Optional[str]:
+        """Save the expanded page's DOM as <netloc>-<UTC time>.html.gz"""
+        try:
+            html = await self.page.content()
+            captured = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+            path = Path(self.snapshot_dir) / f"{urlparse(url).netloc}-{captured}.html.gz"
+            await asyncio.to_thread(write_snapshot, path, html)
+            logger.info(f"Archived snapshot of {url} to {path}")
+            return str(path)
+        except Exception as e:
+            logger.warning(f"Failed to archive snapshot of {url}: {str(e)}")
+            return None
+
+    async def scrape(self, cookies_file: Optional[str] = None, since: Optional[datetime] = None,
+                     until: Optional[datetime] = None, timeout: Optional[float] = None) -> List[Dict[str, str]]:
+        """Main scraping method.
+
+        With `since`/`until`, expansion stops as soon as the oldest loaded item
+        is older than `since`, and items outside the window are not extracted.
+        With `timeout`, the job gets that many seconds in total and returns
+        partial results with `truncated` set when it runs out, as after cancel().
+        """
+        self.since, self.until = since, until
+        self.start_job(timeout)
+        try:
+            await self.prepare(cookies_file)
             
-            all_conversations = []
+            # Held column-wise until dedup; only unique records become dicts
+            all_conversations = ConversationBatch()
             
-            # Try each URL
-            for url in self.urls:
+            # Try each URL, retrying classified failures within one budget
+            budget = self.retry_policy.budget(len(self.urls))
+            for i, url in enumerate(self.urls):
+                if self.deadline.expired:
+                    self.mark_truncated(DeadlineExceeded('navigate', cancelled=self.deadline.cancelled.is_set()))
+                    break
+                self.deadline.begin_url(len(self.urls) - i)
                 try:
-                    logger.debug(f"Trying URL: {url}")
-                    await self.safe_request(url)
-                    
-                    # Wait for authentication and content to load
-                    await self.page.wait_for_load_state('networkidle')
-                    await asyncio.sleep(2)  # Give dynamic content time to load
-                    
-                    # For PWA, try to expand the conversation list
-                    if "gemini.google.com" in url:
-                        try:
-                            # Click show more button while it exists
-                            show_more_selector = "[data-test-id='show-more-button']"
-                            while True:
-                                try:
-                                    show_more = await self.page.wait_for_selector(show_more_selector, timeout=2000)
-                                    if show_more:
-                                        await show_more.click()
-                                        await asyncio.sleep(1)  # Wait for new items to load
-                                except:
-                                    break
-                                    
-                        except Exception as e:
-                            logger.debug(f"No more items to load: {str(e)}")
-                    
-                    conversations = await self.extract_conversations()
+                    conversations = await self.retry_policy.run(
+                        lambda: self.scrape_url(url), target=urlparse(url).netloc,
+                        proxy=self.current_proxy, budget=budget
+                    )
                     if conversations:
                         all_conversations.extend(conversations)
                         logger.info(f"Found {len(conversations)} conversations at {url}")
                     else:
                         logger.warning(f"No conversations found at {url}")
                         
-                except Exception as e:
+                except (ScrapeError, CircuitOpenError) as e:
                     logger.error(f"Failed to scrape {url}: {str(e)}")
+                    self.errors.append((url, e))
                     continue
             
             if all_conversations:
                 # Remove duplicates based on content
-                seen = set()
-                unique_conversations = []
-                for conv in all_conversations:
-                    content = conv['content']
-                    if content not in seen:
-                        seen.add(content)
-                        unique_conversations.append(conv)
+                unique_conversations = all_conversations.unique_by_content().to_dicts()
+                
+                if self.near_duplicates:
+                    unique_conversations = self.near_duplicates.filter(unique_conversations)
                 
-                # Save to file
-                output_file = 'gemini_conversations.json'
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    json.dump(unique_conversations, f, ensure_ascii=False, indent=2)
-                logger.info(f"Saved {len(unique_conversations)} unique conversations to {output_file}")
+                if self.enricher:
+                    try:
+                        unique_conversations = await self.enricher.run(unique_conversations)
+                    finally:
+                        await self.enricher.close()
+                
+                if self.sink:
+                    await self.sink.write(unique_conversations)
+                else:
+                    # Save to file
+                    output_file = self.output_file
+                    with open(output_file, 'w', encoding='utf-8') as f:
+                        json.dump(unique_conversations, f, ensure_ascii=False, indent=2)
+                    logger.info(f"Saved {len(unique_conversations)} unique conversations to {output_file}")
                 
                 return unique_conversations
             else:
@@ -312,14 +611,108 @@ class GeminiScraper:
             
         except Exception as e:
             logger.error(f"Scraping failed: {str(e)}", exc_info=True)
+            self.errors.append((None, e))
             return []
         finally:
-            if self.browser:
-                await self.browser.close()
+            if self.sink:
+                await self.sink.close()
+            await self.close()
+
+    async def scrape_pipelined(self, sink, cookies_file: Optional[str] = None,
+                               prune: Optional[str] = None, since: Optional[datetime] = None,
+                               until: Optional[datetime] = None, timeout: Optional[float] = None) -> int:
+        """Extract while expanding: hand each newly loaded batch to the sink.
+
+        Only items appended since the last click are read, so per-click cost
+        stays flat. With prune='hide' processed items are hidden; with
+        prune='detach' they are removed from the DOM to bound renderer memory.
+        Duplicates are dropped by content digest rather than the full content
+        string. `since`/`until` and `timeout` bound the scrape as in scrape().
+        Returns the number of conversations written to the sink.
+        """
+        if prune not in (None, 'hide', 'detach'):
+            raise ValueError(f"Unknown prune mode: {prune}")
+
+        self.since, self.until = since, until
+        self.start_job(timeout)
+        seen = set()
+        written = 0
+        try:
+            await self.prepare(cookies_file)
+
+            async def stream_url(url: str) -> None:
+                nonlocal written
+                try:
+                    await self.deadline.run('navigate', self.open_url(url))
+                    await self.wait_for_conversations()
+                except DeadlineExceeded as e:
+                    self.mark_truncated(e)
+                    return
+                expand = "gemini.google.com" in url
+                # Expansion and extraction are interleaved here, so they share one slice
+                ends_at = self.deadline.ends_at('expand')
+
+                for clicks in itertools.count():
+                    batch = []
+                    conversations, oldest = await self.extract_new_items(prune)
+                    for conv in conversations:
+                        digest = hashlib.blake2b(conv['content'].encode(), digest_size=16).digest()
+                        if digest not in seen:
+                            seen.add(digest)
+                            batch.append(conv)
+                    if self.near_duplicates:
+                        batch = self.near_duplicates.filter(batch, persist=False)
+                    if batch:
+                        await sink.write(batch)
+                        written += len(batch)
+                        logger.debug("Streamed %d conversations from %s", len(batch), url)
+
+                    if not expand or self.past_window(oldest):
+                        break
+                    try:
+                        self.deadline.check('expand', ends_at)
+                    except DeadlineExceeded as e:
+                        self.mark_truncated(e)
+                        break
+                    if clicks >= MAX_SHOW_MORE_CLICKS:
+                        logger.warning(f"Stopped expanding {url} after {MAX_SHOW_MORE_CLICKS} clicks")
+                        self.truncated = True
+                        break
+                    if not await self.click_show_more():
+                        break
+                    await asyncio.sleep(1)  # Wait for new items to load
+
+            # A retried URL starts over; already streamed items are dropped by digest
+            budget = self.retry_policy.budget(len(self.urls))
+            for i, url in enumerate(self.urls):
+                if self.deadline.expired:
+                    self.mark_truncated(DeadlineExceeded('navigate', cancelled=self.deadline.cancelled.is_set()))
+                    break
+                self.deadline.begin_url(len(self.urls) - i)
+                try:
+                    await self.retry_policy.run(
+                        lambda: stream_url(url), target=urlparse(url).netloc,
+                        proxy=self.current_proxy, budget=budget
+                    )
+                except (ScrapeError, CircuitOpenError) as e:
+                    logger.error(f"Failed to scrape {url}: {str(e)}")
+                    self.errors.append((url, e))
+                    continue
+
+            if self.near_duplicates:
+                self.near_duplicates.save()
+            logger.info(f"Streamed {written} unique conversations")
+            return written
+        finally:
+            await sink.close()
+            await self.close()
 
 async def main():
     scraper = await GeminiScraper.create()
     await scraper.scrape(cookies_file="cookies.json")
 
 if __name__ == "__main__":
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from core.logs import configure_logging
+    configure_logging()
     asyncio.run(main())
@@ -1,19 +1,15 @@
 from textual.app import App, ComposeResult
 from textual.containers import Container
-from textual.widgets import Header, Footer, Button, Static, DataTable, Label, LoadingIndicator, Log
+from textual.widgets import Header, Footer, Button, Static, DataTable, Input, Label, LoadingIndicator, Log
 from textual.binding import Binding
 from textual.reactive import reactive
 from textual import work
 from rich.console import Console
-import asyncio
 import json
 import logging
-from datetime import datetime
-from pathlib import Path
+from typing import Optional
 from gemini_scraper import GeminiScraper
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 class StatusLog(Log):
@@ -58,6 +54,11 @@ class GeminiTUI(App):
         margin: 1;
     }
 
+    #timeout {
+        width: 30;
+        margin: 1;
+    }
+
     #controls {
         height: auto;
         align: center middle;
@@ -84,10 +85,12 @@ class GeminiTUI(App):
     BINDINGS = [
         Binding("q", "quit", "Quit", show=True),
         Binding("r", "refresh", "Refresh", show=True),
+        Binding("c", "cancel", "Cancel scrape", show=True),
     ]
 
-    def __init__(self):
+    def __init__(self, timeout: Optional[float] = None):
         super().__init__()
+        self.timeout = timeout
         self.scraper = GeminiScraper()
         self.status_widget = ScraperStatus()
         self.console = Console()
@@ -99,6 +102,8 @@ class GeminiTUI(App):
             with Container(id="controls"):
                 yield Button("Start Scraping", id="scrape", variant="success")
                 yield Button("View Results", id="view", variant="warning")
+                yield Input(value=f"{self.timeout:g}" if self.timeout else "",
+                            placeholder="Time budget (s), blank for none", id="timeout")
             yield self.status_widget
             yield self.status_log
             yield DataTable(id="results")
@@ -109,14 +114,31 @@ class GeminiTUI(App):
         table.add_columns("Timestamp", "Content")
         self.status_log.write("[blue]System initialized and ready")
 
+    def time_budget(self) -> Optional[float]:
+        """Seconds entered in the time budget field, or None when it is blank"""
+        value = self.query_one("#timeout", Input).value.strip()
+        if not value:
+            return None
+        try:
+            budget = float(value)
+        except ValueError:
+            raise ValueError(f"Time budget must be a number of seconds, not {value!r}")
+        if budget <= 0:
+            raise ValueError("Time budget must be more than 0 seconds")
+        return budget
+
     @work
     async def start_scraping(self):
         """Start the scraping process"""
         self.status_widget.status = "Scraping..."
-        self.status_log.write("[blue]Starting conversation scraping...")
         
         try:
-            conversations = await self.scraper.scrape(cookies_file="cookies.json")
+            timeout = self.time_budget()
+            budget = f" with a {timeout:g}s budget" if timeout else ""
+            self.status_log.write(f"[blue]Starting conversation scraping{budget}...")
+            conversations = await self.scraper.scrape(cookies_file="cookies.json", timeout=timeout)
+            if self.scraper.truncated:
+                self.status_log.write("[yellow]! Scrape stopped early, results are partial")
             
             if conversations:
                 # Update table with results
@@ -162,3 +184,9 @@ class GeminiTUI(App):
 
     def action_refresh(self):
         self.view_results()
+
+    def action_cancel(self):
+        """Stop a running scrape; conversations found so far are still saved"""
+        self.scraper.cancel()
+        self.status_widget.status = "Cancelling..."
+        self.status_log.write("[yellow]Cancelling scrape...")
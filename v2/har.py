@@ -0,0 +1,123 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import zipfile
+from typing import TYPE_CHECKING, Dict, Optional
+
+if TYPE_CHECKING:
+    from playwright.async_api import BrowserContext, Route
+
+logger = logging.getLogger(__name__)
+
+REDACTED = '[REDACTED]'
+SECRET_HEADERS = {'cookie', 'set-cookie', 'authorization', 'proxy-authorization', 'x-goog-authuser'}
+# Query and form fields carrying tokens; `at` is batchexecute's XSRF token, `f.sid` its session
+SECRET_PARAMS = ('at', 'f.sid', 'key', 'access_token', 'token', 'sig', 'signature')
+SECRET_PARAM = re.compile(r'((?:^|[?&])(?:' + '|'.join(map(re.escape, SECRET_PARAMS)) + r'))=[^&#]*')
+REDACTED_PARAM = r'\1=REDACTED'
+HAR_ENTRY = 'har.har'
+
+def record_options(har_path: str) -> Dict[str, str]:
+    """new_context() options that record a HAR.
+
+    A .zip path keeps response bodies as separate entries next to the HAR,
+    which is also the layout route_from_har() replays fastest.
+    """
+    return {
+        'record_har_path': har_path,
+        'record_har_content': 'attach' if har_path.endswith('.zip') else 'embed',
+        'record_har_mode': 'full'
+    }
+
+def redact_params(text: Optional[str]) -> Optional[str]:
+    """Blank secret fields of a URL or form body, leaving everything else byte for byte"""
+    return SECRET_PARAM.sub(REDACTED_PARAM, text) if text else text
+
+def redact_entry(message: Dict) -> None:
+    for header in message.get('headers', []):
+        if header['name'].lower() in SECRET_HEADERS:
+            header['value'] = REDACTED
+    for cookie in message.get('cookies', []):
+        cookie['value'] = REDACTED
+
+def redact_request(request: Dict, members: Optional[Dict[str, bytes]] = None) -> None:
+    """Blank secret headers, cookies, query fields and form fields of a HAR request"""
+    redact_entry(request)
+    request['url'] = redact_params(request['url'])
+    for param in request.get('queryString', []) + request.get('postData', {}).get('params', []):
+        if param['name'] in SECRET_PARAMS:
+            param['value'] = 'REDACTED'
+    post_data = request.get('postData')
+    if not post_data:
+        return
+    if 'text' in post_data:
+        post_data['text'] = redact_params(post_data['text'])
+    elif members is not None and post_data.get('_file') in members:
+        # Bodies of zipped recordings are separate members
+        name = post_data['_file']
+        members[name] = redact_params(members[name].decode('utf-8', 'surrogateescape')).encode('utf-8', 'surrogateescape')
+
+def redact_har(har_path: str) -> int:
+    """Blank cookies, auth headers and token fields of requests in a recorded HAR in place.
+
+    Returns the entry count. Replay applies the same redaction to live
+    requests before looking them up, so redacted recordings still match.
+    """
+    members = None
+    if har_path.endswith('.zip'):
+        with zipfile.ZipFile(har_path) as archive:
+            members = {name: archive.read(name) for name in archive.namelist()}
+        har = json.loads(members[HAR_ENTRY])
+    else:
+        with open(har_path, 'r', encoding='utf-8') as f:
+            har = json.load(f)
+
+    entries = har['log']['entries']
+    for entry in entries:
+        redact_request(entry['request'], members)
+        redact_entry(entry['response'])
+
+    tmp_path = f"{har_path}.tmp"
+    if members is not None:
+        members[HAR_ENTRY] = json.dumps(har).encode()
+        with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for name, data in members.items():
+                archive.writestr(name, data)
+    else:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(har, f)
+    os.replace(tmp_path, har_path)
+    logger.info(f"Redacted {len(entries)} requests in {har_path}")
+    return len(entries)
+
+async def replay_har(context: 'BrowserContext', har_path: str, latency: float = 0.0) -> None:
+    """Serve every request of the context from a recorded HAR.
+
+    Requests missing from the recording are aborted, so a replayed run never
+    reaches the network. With `latency` each request is delayed by that many
+    seconds before the HAR route answers it.
+    """
+    await context.route_from_har(har_path, not_found='abort')
+
+    async def redact(route: 'Route') -> None:
+        # Look requests up by their redacted form, the way they were saved
+        if latency > 0:
+            await asyncio.sleep(latency)
+        request = route.request
+        url = redact_params(request.url)
+        try:
+            post_data = request.post_data
+        except UnicodeDecodeError:
+            # Binary bodies have no form fields to redact
+            post_data = None
+        redacted = redact_params(post_data)
+        if url != request.url or redacted != post_data:
+            await route.fallback(url=url, post_data=redacted)
+        else:
+            await route.fallback()
+
+    # Routes registered later run first and fall back to the HAR route
+    await context.route('**/*', redact)
+    logger.info(f"Replaying {har_path}" + (f" with {latency * 1000:.0f}ms latency" if latency else ""))
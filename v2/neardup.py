@@ -0,0 +1,282 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import zlib
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+WORD_PATTERN = re.compile(r'\w+', re.UNICODE)
+MERGE_POLICIES = ('keep_first', 'keep_latest', 'keep_longest', 'merge')
+
+# Fixed seed: signatures must stay comparable with the index from earlier runs
+_rng = np.random.default_rng(20240209)
+PERM_A = _rng.integers(1, 2**63, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+PERM_B = _rng.integers(0, 2**63, NUM_PERM, dtype=np.uint64)
+
+def shingles(text: str) -> List[str]:
+    """Words and word bigrams; previews are too short for longer n-grams"""
+    words = WORD_PATTERN.findall(text.lower())
+    if not words:
+        return [text]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+def minhash(texts: List[str], chunk_size: int = 4096) -> np.ndarray:
+    """MinHash signatures (len(texts) x NUM_PERM) computed chunk by chunk.
+
+    Shingles of a chunk are hashed into one flat array; every permutation is
+    applied to all of them at once with a multiply-shift hash, and the
+    per-text minimum is taken with a single minimum.reduceat.
+    """
+    signatures = np.empty((len(texts), NUM_PERM), dtype=np.uint32)
+    for start in range(0, len(texts), chunk_size):
+        hashes, offsets = [], []
+        for text in texts[start:start + chunk_size]:
+            offsets.append(len(hashes))
+            hashes.extend(map(zlib.crc32, map(str.encode, shingles(text))))
+        values = PERM_A[:, None] * np.array(hashes, dtype=np.uint64)[None, :]
+        values += PERM_B[:, None]
+        values >>= np.uint64(32)
+        signatures[start:start + len(offsets)] = np.minimum.reduceat(
+            values.astype(np.uint32), np.array(offsets), axis=1
+        ).T
+    return signatures
+
+def band_keys(signatures: np.ndarray) -> List[List[bytes]]:
+    """Per-signature list of hashable band keys, computed for the whole batch at once"""
+    return np.ascontiguousarray(signatures).view(f'V{ROWS * 4}').reshape(len(signatures), BANDS).tolist()
+
+class LSHIndex:
+    """Banded LSH over MinHash signatures, persisted as an .npz file.
+
+    Each entry keeps the record it stands for, so a record matched in a
+    later run can be emitted again instead of being lost with the earlier
+    run's output.
+
+    With 16 bands of 4 rows, pairs with Jaccard similarity 0.8 become
+    candidates with ~99.9% probability and pairs at 0.3 with ~12%; candidates
+    are then checked against the threshold with their estimated similarity.
+    """
+
+    def __init__(self):
+        self.signatures = np.empty((0, NUM_PERM), dtype=np.uint32)
+        self.lengths: List[int] = []
+        self.keys: List[str] = []
+        # Kept record per entry; None for entries from indexes saved without records
+        self.records: List[Optional[Dict[str, str]]] = []
+        # Content key -> entry, for exact re-scrapes
+        self.positions: Dict[str, int] = {}
+        self.size = 0
+        self.bands: List[Dict[bytes, List[int]]] = [defaultdict(list) for _ in range(BANDS)]
+
+    def _grow(self, extra: int) -> None:
+        needed = self.size + extra
+        if needed > len(self.signatures):
+            grown = np.empty((max(needed, 2 * len(self.signatures), 1024), NUM_PERM), dtype=np.uint32)
+            grown[:self.size] = self.signatures[:self.size]
+            self.signatures = grown
+
+    def add_many(self, signatures: np.ndarray, keys: List[str], lengths: List[int],
+                 records: List[Optional[Dict[str, str]]]) -> None:
+        self._grow(len(signatures))
+        start = self.size
+        self.signatures[start:start + len(signatures)] = signatures
+        self.keys.extend(keys)
+        self.lengths.extend(lengths)
+        self.records.extend(records)
+        self.positions.update((key, position) for position, key in enumerate(keys, start))
+        self.size += len(signatures)
+        for row, row_keys in enumerate(band_keys(signatures), start):
+            for band, band_key in enumerate(row_keys):
+                self.bands[band][band_key].append(row)
+
+    def add(self, signature: np.ndarray, row_keys: List[bytes], key: str, length: int,
+            record: Dict[str, str]) -> int:
+        self._grow(1)
+        position = self.size
+        self.signatures[position] = signature
+        self.keys.append(key)
+        self.lengths.append(length)
+        self.records.append(record)
+        self.positions[key] = position
+        self.size += 1
+        for band, band_key in enumerate(row_keys):
+            self.bands[band][band_key].append(position)
+        return position
+
+    def replace(self, position: int, signature: np.ndarray, row_keys: List[bytes],
+                key: str, length: int, record: Dict[str, str]) -> None:
+        """Point an entry at a newer record; its old band slots stay as harmless extra candidates"""
+        self.signatures[position] = signature
+        self.keys[position] = key
+        self.lengths[position] = length
+        self.records[position] = record
+        self.positions[key] = position
+        for band, band_key in enumerate(row_keys):
+            self.bands[band][band_key].append(position)
+
+    def nearest(self, signature: np.ndarray, row_keys: List[bytes],
+                threshold: float) -> Optional[Tuple[int, float]]:
+        """Most similar indexed entry at or above threshold as (position, similarity)"""
+        candidates = set()
+        for band, band_key in enumerate(row_keys):
+            found = self.bands[band].get(band_key)
+            if found:
+                candidates.update(found)
+        if not candidates:
+            return None
+        positions = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        similarity = (self.signatures[positions] == signature).mean(axis=1)
+        best = int(np.argmax(similarity))
+        if similarity[best] < threshold:
+            return None
+        return int(positions[best]), float(similarity[best])
+
+    def save(self, path: str) -> None:
+        tmp_path = f"{path}.tmp.npz"
+        # Records are stored as one UTF-8 blob with end offsets; an empty
+        # string stands for a missing record
+        encoded = [json.dumps(record, ensure_ascii=False).encode() if record is not None else b''
+                   for record in self.records]
+        np.savez_compressed(
+            tmp_path,
+            signatures=self.signatures[:self.size],
+            lengths=np.array(self.lengths, dtype=np.int64),
+            keys=np.array(self.keys, dtype=str),
+            records=np.frombuffer(b''.join(encoded), dtype=np.uint8),
+            record_ends=np.cumsum([len(data) for data in encoded], dtype=np.int64)
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Optional[str]) -> 'LSHIndex':
+        index = cls()
+        if path and os.path.exists(path):
+            data = np.load(path)
+            keys = data['keys'].tolist()
+            records: List[Optional[Dict[str, str]]] = [None] * len(keys)
+            if 'records' in data:
+                blob = data['records'].tobytes()
+                start = 0
+                for i, end in enumerate(data['record_ends'].tolist()):
+                    if end > start:
+                        records[i] = json.loads(blob[start:end])
+                    start = end
+            index.add_many(data['signatures'], keys, data['lengths'].tolist(), records)
+        return index
+
+def content_key(conversation: Dict[str, str]) -> str:
+    return hashlib.blake2b(conversation['content'].encode(), digest_size=16).hexdigest()
+
+class NearDuplicateFilter:
+    """Drops or merges records whose estimated Jaccard similarity to one already
+    seen, in this run or an earlier run through the persisted index, is at
+    least `threshold`.
+
+    Policies for a near-duplicate pair:
+      keep_first   keep the record seen first
+      keep_latest  keep the newer record
+      keep_longest keep the record with more content
+      merge        keep the first record and fill its missing fields from the newer one
+    Exact re-scrapes of a record from an earlier run are not near-duplicates
+    and pass through unchanged. A record that near-matches one from an
+    earlier run is not dropped: the record the policy keeps is emitted in
+    its place, since the earlier run's output may no longer exist.
+    """
+
+    def __init__(self, index_path: Optional[str] = None, threshold: float = 0.8,
+                 policy: str = 'keep_first'):
+        if policy not in MERGE_POLICIES:
+            raise ValueError(f"Unknown merge policy: {policy}")
+        self.index_path = index_path
+        self.threshold = threshold
+        self.policy = policy
+        self.index = LSHIndex.load(index_path)
+        # Index entries emitted by this filter, across batches
+        self.emitted: Set[int] = set()
+
+    def text(self, conversation: Dict[str, str]) -> str:
+        return f"{conversation.get('title') or ''} {conversation['content']}"
+
+    def resolve(self, kept: Dict[str, str], new: Dict[str, str]) -> Dict[str, str]:
+        if self.policy == 'keep_latest':
+            return new
+        if self.policy == 'keep_longest':
+            return new if len(new['content']) > len(kept['content']) else kept
+        if self.policy == 'merge':
+            return {**new, **{k: v for k, v in kept.items() if v is not None}}
+        return kept
+
+    def save(self) -> None:
+        if self.index_path:
+            self.index.save(self.index_path)
+
+    def filter(self, conversations: List[Dict[str, str]], persist: bool = True) -> List[Dict[str, str]]:
+        """Filter one batch. Records from earlier batches of this filter count as
+        already emitted, so a stream can be filtered batch by batch with
+        persist=False and saved once at the end."""
+        if not conversations:
+            return []
+        signatures = minhash([self.text(conv) for conv in conversations])
+        output: List[Dict[str, str]] = []
+        # Index position -> slot in output for records accepted in this run
+        slots: Dict[int, int] = {}
+        dropped = 0
+        debug = logger.isEnabledFor(logging.DEBUG)
+
+        for conv, signature, row_keys in zip(conversations, signatures, band_keys(signatures)):
+            key = content_key(conv)
+            length = len(conv['content'])
+            position = self.index.positions.get(key)
+            if position is not None and position not in slots and position not in self.emitted:
+                slots[position] = len(output)
+                output.append(conv)
+                continue
+            if position is None:
+                match = self.index.nearest(signature, row_keys, self.threshold)
+                if match is None:
+                    slots[self.index.add(signature, row_keys, key, length, conv)] = len(output)
+                    output.append(conv)
+                    continue
+                position, similarity = match
+                if debug:
+                    logger.debug("Near duplicate (%.2f): %s", similarity, conv.get('title', 'Untitled'))
+
+            earlier = self.index.records[position]
+            if position in slots:
+                dropped += 1
+                winner = self.resolve(output[slots[position]], conv)
+                output[slots[position]] = winner
+            elif position in self.emitted:
+                # Emitted by an earlier batch of this stream; only a record that
+                # replaces it outright is emitted too
+                winner = conv if earlier is None else self.resolve(earlier, conv)
+                if winner is conv:
+                    slots[position] = len(output)
+                    output.append(conv)
+                else:
+                    dropped += 1
+            else:
+                # The earlier copy is in a previous run's output, which may be
+                # gone; emit the kept record again
+                winner = conv if earlier is None else self.resolve(earlier, conv)
+                slots[position] = len(output)
+                output.append(winner)
+            if winner is conv:
+                self.index.replace(position, signature, row_keys, key, length, conv)
+            elif winner is not earlier:
+                self.index.records[position] = winner
+
+        self.emitted.update(slots)
+        if persist:
+            self.save()
+        logger.info(f"Near-duplicate stage removed {dropped} of {len(conversations)} records")
+        return output
@@ -0,0 +1,100 @@
+import re
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+# Record building shared by the scraper, enrichment workers and offline
+# tools; no browser or network imports, so worker processes stay light
+
+CONVERSATION_SELECTOR = ".mat-mdc-tooltip-trigger.conversation"
+TITLE_SELECTOR = ".mdc-button__label"
+MIN_CONTENT_LENGTH = 10
+CONVERSATION_ID_PATTERN = re.compile(r'c_([0-9a-f]{8,})')
+CONVERSATION_URL = 'https://gemini.google.com/app/{}'
+
+TIMESTAMP_FORMATS = (
+    "%b %d, %Y %I:%M %p",
+    "%b %d, %Y, %I:%M %p",
+    "%B %d, %Y %I:%M %p",
+    "%b %d, %Y",
+    "%B %d, %Y",
+)
+
+def parse_timestamp(value) -> Optional[datetime]:
+    """Parse an epoch (s, ms or us) or date string into an aware UTC datetime"""
+    if value is None:
+        return None
+    value = str(value).strip().strip('"')
+    if not value:
+        return None
+    if value.isdigit():
+        number = int(value)
+        if number > 1e14:
+            number /= 1_000_000
+        elif number > 1e11:
+            number /= 1000
+        return datetime.fromtimestamp(number, tz=timezone.utc)
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        parsed = None
+        for fmt in TIMESTAMP_FORMATS:
+            try:
+                parsed = datetime.strptime(value, fmt)
+                break
+            except ValueError:
+                continue
+    if parsed is None:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+def jslog_timestamp(jslog: Optional[str]) -> Optional[datetime]:
+    """Parse the timestamp carried in an item's jslog attribute"""
+    if jslog and "timestamp=" in jslog:
+        return parse_timestamp(jslog.split("timestamp=")[1].split(";")[0])
+    return None
+
+def in_window(timestamp: Optional[datetime], since: Optional[datetime] = None,
+              until: Optional[datetime] = None) -> bool:
+    """Items without a timestamp are kept, since they cannot be placed"""
+    if timestamp is None:
+        return True
+    return (since is None or timestamp >= since) and (until is None or timestamp <= until)
+
+def epoch_ms(value: Optional[datetime]) -> Optional[float]:
+    return value.timestamp() * 1000 if value else None
+
+def parse_conversation_id(jslog: Optional[str], href: Optional[str] = None) -> Optional[str]:
+    """Find the conversation ID in an item's link or jslog metadata"""
+    if href:
+        conversation_id = href.split('?')[0].rstrip('/').split('/')[-1]
+        if conversation_id and conversation_id != 'app':
+            return conversation_id
+    if jslog:
+        match = CONVERSATION_ID_PATTERN.search(jslog)
+        if match:
+            return match.group(1)
+    return None
+
+def build_conversation(title: Optional[str], content: Optional[str], jslog: Optional[str],
+                       href: Optional[str] = None) -> Optional[Dict[str, str]]:
+    """Turn raw item fields into a conversation record, or None if too short"""
+    content = (content or "").strip()
+    if len(content) <= MIN_CONTENT_LENGTH:
+        return None
+
+    # Timestamp from the jslog attribute, normalized to UTC ISO 8601
+    timestamp = jslog_timestamp(jslog)
+
+    conversation = {
+        'timestamp': timestamp.isoformat() if timestamp else None,
+        'content': content
+    }
+    if title and title.strip():
+        conversation['title'] = title.strip()
+    conversation_id = parse_conversation_id(jslog, href)
+    if conversation_id:
+        conversation['conversation_id'] = conversation_id
+        conversation['url'] = CONVERSATION_URL.format(conversation_id)
+    return conversation
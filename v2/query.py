@@ -0,0 +1,314 @@
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+from datetime import datetime, timezone
+from typing import Dict, Iterator, Optional, Tuple
+
+from parsing import in_window, parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+INDEX_SUFFIX = '.idx'
+INDEX_MAGIC = b'GQIDX\x00\x00\x01'
+# magic, source size, source mtime_ns, record count
+INDEX_HEADER = struct.Struct('<8sQQQ')
+# byte offset, byte length, epoch seconds (NaN when the record has none)
+INDEX_ENTRY = struct.Struct('<QQd')
+CHUNK_SIZE = 1 << 20
+# A record's timestamp read straight from its raw JSON, for records the
+# prefilter rejects before decoding
+RAW_TIMESTAMP = re.compile(rb'"timestamp"\s*:\s*"([^"\\]*)"')
+WHITESPACE = ' \t\r\n'
+
+# (offset, length, record)
+Entry = Tuple[int, int, Dict]
+
+def detect_format(path: str) -> str:
+    """'json' for a JSON array, 'ndjson' for one record per line"""
+    with open(path, 'rb') as f:
+        while True:
+            char = f.read(1)
+            if not char or not char.isspace():
+                return 'json' if char == b'[' else 'ndjson'
+
+def scan_ndjson(path: str) -> Iterator[Tuple[int, bytes]]:
+    offset = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.strip():
+                yield offset, line
+            offset += len(line)
+
+def scan_json_array(path: str) -> Iterator[Entry]:
+    """Decode a JSON array one element at a time from a bounded buffer.
+
+    Offsets are in bytes: each consumed stretch of text is encoded once to
+    count them, so the cost stays linear in the file size.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = f.read(CHUNK_SIZE)
+        base = 0  # byte offset of buffer[0]
+        pos = buffer.index('[') + 1
+        chunk = CHUNK_SIZE
+        eof = False
+        while True:
+            while pos < len(buffer) and (buffer[pos] in WHITESPACE or buffer[pos] == ','):
+                pos += 1
+            if pos < len(buffer) and buffer[pos] == ']':
+                return
+            try:
+                if pos >= len(buffer):
+                    raise ValueError("buffer exhausted")
+                record, end = decoder.raw_decode(buffer, pos)
+            except ValueError:
+                if eof:
+                    if buffer[pos:].strip():
+                        raise ValueError(f"Truncated JSON array in {path}")
+                    return
+                # Drop what has been consumed and read on; the chunk grows so
+                # one huge record is not re-decoded once per megabyte
+                base += len(buffer[:pos].encode('utf-8'))
+                more = f.read(chunk)
+                eof = not more
+                buffer = buffer[pos:] + more
+                pos = 0
+                chunk *= 2
+                continue
+            chunk = CHUNK_SIZE
+            start = base + len(buffer[:pos].encode('utf-8'))
+            length = len(buffer[pos:end].encode('utf-8'))
+            yield start, length, record
+            base = start + length
+            buffer = buffer[end:]
+            pos = 0
+
+class RecordFilter:
+    """Time window, title and substring conditions on records.
+
+    prefilter() is a necessary condition checked on a record's raw JSON bytes,
+    so non-matching records are skipped without being decoded. It only looks
+    for needles whose JSON encoding is certain: ASCII without quotes,
+    backslashes or control characters.
+    """
+
+    def __init__(self, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                 title: Optional[str] = None, contains: Optional[str] = None, ignore_case: bool = False):
+        self.since = since
+        self.until = until
+        self.title = title.lower() if title else None
+        self.ignore_case = ignore_case
+        self.contains = contains.lower() if contains and ignore_case else contains
+        self.raw_needles = []
+        for needle, folded in ((self.title, True), (self.contains, ignore_case)):
+            if needle and needle.isascii() and needle.isprintable() and not any(c in needle for c in '"\\'):
+                self.raw_needles.append((needle.encode('ascii'), folded))
+
+    @property
+    def windowed(self) -> bool:
+        return self.since is not None or self.until is not None
+
+    def prefilter(self, raw: bytes) -> bool:
+        for needle, folded in self.raw_needles:
+            if needle not in (raw.lower() if folded else raw):
+                return False
+        return True
+
+    def time_ok(self, timestamp: Optional[datetime]) -> bool:
+        return in_window(timestamp, self.since, self.until)
+
+    def matches(self, record: Dict) -> bool:
+        if self.windowed and not self.time_ok(parse_timestamp(record.get('timestamp'))):
+            return False
+        if self.title and self.title not in (record.get('title') or '').lower():
+            return False
+        if self.contains:
+            content = record.get('content') or ''
+            if self.contains not in (content.lower() if self.ignore_case else content):
+                return False
+        return True
+
+def epoch_seconds(value) -> float:
+    parsed = parse_timestamp(value)
+    return parsed.timestamp() if parsed else math.nan
+
+def record_seconds(record: Optional[Dict], raw: Optional[bytes]) -> float:
+    if record is not None:
+        return epoch_seconds(record.get('timestamp'))
+    match = RAW_TIMESTAMP.search(raw)
+    return epoch_seconds(match.group(1).decode('utf-8')) if match else math.nan
+
+class OffsetIndex:
+    """Sidecar index of a results file: the byte range and time of every record.
+
+    Both files are memory-mapped, so record i is found with one fixed-size
+    read of the index and one slice of the data, without parsing anything
+    before it. The index is ignored once the results file's size or
+    modification time no longer match.
+    """
+
+    def __init__(self, path: str, index_file, data_file):
+        self.path = path
+        self._index_file = index_file
+        self._data_file = data_file
+        self.index = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.data = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.count = INDEX_HEADER.unpack_from(self.index, 0)[3]
+
+    @staticmethod
+    def index_path(path: str) -> str:
+        return path + INDEX_SUFFIX
+
+    @classmethod
+    def open(cls, path: str) -> Optional['OffsetIndex']:
+        index_path = cls.index_path(path)
+        try:
+            stat = os.stat(path)
+            index_file = open(index_path, 'rb')
+        except FileNotFoundError:
+            return None
+        header = index_file.read(INDEX_HEADER.size)
+        if len(header) < INDEX_HEADER.size or stat.st_size == 0:
+            index_file.close()
+            return None
+        magic, size, mtime_ns, count = INDEX_HEADER.unpack(header)
+        expected = INDEX_HEADER.size + count * INDEX_ENTRY.size
+        if (magic, size, mtime_ns) != (INDEX_MAGIC, stat.st_size, stat.st_mtime_ns) \
+                or os.fstat(index_file.fileno()).st_size != expected:
+            logger.info(f"Index {index_path} is stale, ignoring it")
+            index_file.close()
+            return None
+        return cls(path, index_file, open(path, 'rb'))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def entry(self, i: int) -> Tuple[int, int, float]:
+        return INDEX_ENTRY.unpack_from(self.index, INDEX_HEADER.size + i * INDEX_ENTRY.size)
+
+    def raw(self, offset: int, length: int) -> bytes:
+        return self.data[offset:offset + length]
+
+    def close(self) -> None:
+        self.index.close()
+        self.data.close()
+        self._index_file.close()
+        self._data_file.close()
+
+class IndexWriter:
+    """Writes an index next to the results file while it is being scanned.
+
+    Entries go to a temporary file that replaces the index only in commit(),
+    so a scan that stops early leaves no partial index behind.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.stat = os.stat(path)
+        self.tmp_path = OffsetIndex.index_path(path) + '.tmp'
+        self.file = open(self.tmp_path, 'wb')
+        self.file.write(INDEX_HEADER.pack(INDEX_MAGIC, 0, 0, 0))
+        self.count = 0
+
+    def add(self, offset: int, length: int, seconds: float) -> None:
+        self.file.write(INDEX_ENTRY.pack(offset, length, seconds))
+        self.count += 1
+
+    def commit(self) -> None:
+        self.file.seek(0)
+        self.file.write(INDEX_HEADER.pack(INDEX_MAGIC, self.stat.st_size, self.stat.st_mtime_ns, self.count))
+        self.file.close()
+        os.replace(self.tmp_path, OffsetIndex.index_path(self.path))
+        logger.info(f"Indexed {self.count} records of {self.path}")
+
+    def discard(self) -> None:
+        self.file.close()
+        os.remove(self.tmp_path)
+
+def scan(path: str, record_filter: RecordFilter) -> Iterator[Tuple[int, int, Optional[Dict], Optional[bytes]]]:
+    """Every record of the file as (offset, length, record, raw).
+
+    NDJSON lines that fail the raw-byte prefilter are not decoded: they come
+    back with record None and their raw bytes, which is all the index needs.
+    Everything is yielded, since the index covers every record; filtering
+    what the caller sees is up to iter_records().
+    """
+    if detect_format(path) == 'json':
+        for offset, length, record in scan_json_array(path):
+            yield offset, length, record, None
+        return
+    for offset, line in scan_ndjson(path):
+        if record_filter.prefilter(line):
+            yield offset, len(line), json.loads(line), None
+        else:
+            yield offset, len(line), None, line
+
+def iter_indexed(index: OffsetIndex, record_filter: RecordFilter, start: int) -> Iterator[Dict]:
+    for i in range(start, len(index)):
+        offset, length, seconds = index.entry(i)
+        if record_filter.windowed:
+            timestamp = None if math.isnan(seconds) else datetime.fromtimestamp(seconds, timezone.utc)
+            if not record_filter.time_ok(timestamp):
+                continue
+        raw = index.raw(offset, length)
+        if not record_filter.prefilter(raw):
+            continue
+        record = json.loads(raw)
+        if record_filter.matches(record):
+            yield record
+
+def iter_records(path: str, record_filter: Optional[RecordFilter] = None, start: int = 0,
+                 build_index: bool = True) -> Iterator[Dict]:
+    """Stream the records of a JSON array or NDJSON file that pass the filter.
+
+    Uses the sidecar index when it is current, starting directly at record
+    `start`. Otherwise parses the file incrementally and, when `build_index`
+    is set and the scan runs to the end, leaves a fresh index behind. Memory
+    use does not grow with the file either way.
+    """
+    record_filter = record_filter or RecordFilter()
+    index = OffsetIndex.open(path)
+    if index is not None:
+        try:
+            yield from iter_indexed(index, record_filter, start)
+        finally:
+            index.close()
+        return
+
+    writer = IndexWriter(path) if build_index else None
+    committed = False
+    try:
+        for i, (offset, length, record, raw) in enumerate(scan(path, record_filter)):
+            if writer:
+                writer.add(offset, length, record_seconds(record, raw))
+            if i < start or record is None or not record_filter.matches(record):
+                continue
+            yield record
+        if writer:
+            writer.commit()
+            committed = True
+    finally:
+        if writer and not committed:
+            writer.discard()
+
+def count_records(path: str) -> Optional[int]:
+    """Number of records according to the index, or None without a current one"""
+    index = OffsetIndex.open(path)
+    if index is None:
+        return None
+    try:
+        return len(index)
+    finally:
+        index.close()
+
+def format_row(record: Dict, width: int) -> str:
+    """One terminal line: timestamp, title and as much content as fits"""
+    timestamp = (record.get('timestamp') or '-')[:25]
+    title = ' '.join((record.get('title') or '').split())[:40]
+    content = ' '.join((record.get('content') or '').split())
+    line = f"{timestamp:<25}  {title:<40}  {content}"
+    return line[:max(width, 80)] + '\n'
@@ -0,0 +1,192 @@
+import json
+from array import array
+from sys import intern
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+from parsing import CONVERSATION_URL
+
+# Optional keys are omitted from the dict form when unset, matching the
+# records produced by build_conversation()
+OPTIONAL_FIELDS = ('title', 'conversation_id', 'account', 'source')
+KNOWN_FIELDS = ('timestamp', 'content') + OPTIONAL_FIELDS
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    return intern(value) if value is not None else None
+
+def extra_fields(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Keys of a record dict that have no slot, such as enricher output.
+
+    `url` is left out when it is the one derived from `conversation_id`.
+    """
+    extra = {key: value for key, value in data.items() if key not in KNOWN_FIELDS}
+    conversation_id = data.get('conversation_id')
+    if conversation_id and extra.get('url') == CONVERSATION_URL.format(conversation_id):
+        del extra['url']
+    return extra or None
+
+class Conversation:
+    """Compact conversation record.
+
+    Slots instead of a per-record dict, and interned timestamp, title,
+    account and source strings, so repeated values are stored once. The
+    `url` key is derived from `conversation_id` instead of stored. Any
+    other keys are kept in `extra` and come back out of to_dict().
+    """
+
+    __slots__ = ('timestamp', 'content', 'title', 'conversation_id', 'account', 'source', 'extra')
+
+    def __init__(self, content: str, timestamp: Optional[str] = None, title: Optional[str] = None,
+                 conversation_id: Optional[str] = None, account: Optional[str] = None,
+                 source: Optional[str] = None, extra: Optional[Dict[str, Any]] = None):
+        self.content = content
+        self.timestamp = _intern(timestamp)
+        self.title = _intern(title)
+        self.conversation_id = conversation_id
+        self.account = _intern(account)
+        self.source = _intern(source)
+        self.extra = extra or None
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Conversation':
+        return cls(
+            data['content'],
+            timestamp=data.get('timestamp'),
+            title=data.get('title'),
+            conversation_id=data.get('conversation_id'),
+            account=data.get('account'),
+            source=data.get('source'),
+            extra=extra_fields(data)
+        )
+
+    @property
+    def url(self) -> Optional[str]:
+        return CONVERSATION_URL.format(self.conversation_id) if self.conversation_id else None
+
+    def to_dict(self) -> Dict[str, str]:
+        """Dict in the scraper's output shape; the string objects are shared, not copied"""
+        data = {'timestamp': self.timestamp, 'content': self.content}
+        for field in OPTIONAL_FIELDS:
+            value = getattr(self, field)
+            if value is not None:
+                data[field] = value
+        if self.conversation_id:
+            data['url'] = self.url
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Conversation):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    def __repr__(self) -> str:
+        return f"Conversation(title={self.title!r}, timestamp={self.timestamp!r})"
+
+class StringTable:
+    """Dictionary encoding: each distinct string is stored once and referenced by index"""
+
+    __slots__ = ('values', 'index')
+
+    def __init__(self):
+        self.values: List[str] = []
+        self.index: Dict[str, int] = {}
+
+    def encode(self, value: Optional[str]) -> int:
+        if value is None:
+            return -1
+        code = self.index.get(value)
+        if code is None:
+            code = len(self.values)
+            self.index[value] = code
+            self.values.append(value)
+        return code
+
+    def decode(self, code: int) -> Optional[str]:
+        return self.values[code] if code >= 0 else None
+
+class ConversationBatch:
+    """Struct-of-arrays container for large conversation sets.
+
+    Content and conversation IDs are kept in plain lists; timestamps,
+    titles, accounts and sources are dictionary-encoded into typed int
+    arrays, so a batch costs a few bytes per record beyond the content
+    strings themselves. Keys without a column are kept per record, as
+    in Conversation.extra.
+    """
+
+    ENCODED_FIELDS = ('timestamp', 'title', 'account', 'source')
+
+    def __init__(self, records: Iterable[Union[Dict[str, str], Conversation]] = ()):
+        self.contents: List[str] = []
+        self.conversation_ids: List[Optional[str]] = []
+        self.extras: List[Optional[Dict[str, Any]]] = []
+        self.tables = {field: StringTable() for field in self.ENCODED_FIELDS}
+        self.codes = {field: array('l') for field in self.ENCODED_FIELDS}
+        self.extend(records)
+
+    def append(self, record: Union[Dict[str, str], Conversation]) -> None:
+        if isinstance(record, dict):
+            get = record.get
+            self.extras.append(extra_fields(record))
+        else:
+            get = lambda key: getattr(record, key)  # noqa: E731
+            self.extras.append(record.extra)
+        self.contents.append(get('content'))
+        self.conversation_ids.append(get('conversation_id'))
+        for field in self.ENCODED_FIELDS:
+            self.codes[field].append(self.tables[field].encode(get(field)))
+
+    def extend(self, records: Iterable[Union[Dict[str, str], Conversation]]) -> None:
+        for record in records:
+            self.append(record)
+
+    def __len__(self) -> int:
+        return len(self.contents)
+
+    def __getitem__(self, i: int) -> Conversation:
+        decoded = {
+            field: self.tables[field].decode(self.codes[field][i])
+            for field in self.ENCODED_FIELDS
+        }
+        return Conversation(self.contents[i], conversation_id=self.conversation_ids[i],
+                            extra=self.extras[i], **decoded)
+
+    def __iter__(self) -> Iterator[Conversation]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def unique_by_content(self) -> 'ConversationBatch':
+        """A new batch with the first record of each distinct content, in order"""
+        seen = set()
+        unique = ConversationBatch()
+        for i, content in enumerate(self.contents):
+            if content not in seen:
+                seen.add(content)
+                unique.append(self[i])
+        return unique
+
+    def iter_dicts(self) -> Iterator[Dict[str, str]]:
+        for conversation in self:
+            yield conversation.to_dict()
+
+    def to_dicts(self) -> List[Dict[str, str]]:
+        return list(self.iter_dicts())
+
+    def write_json(self, f, indent: Optional[int] = 2) -> None:
+        """Write the batch as a JSON array one record at a time"""
+        separator = ',\n' if indent else ','
+        f.write('[\n' if indent else '[')
+        for i, data in enumerate(self.iter_dicts()):
+            if i:
+                f.write(separator)
+            f.write(json.dumps(data, ensure_ascii=False, indent=indent))
+        f.write('\n]\n' if indent else ']\n')
+
+    def write_ndjson(self, f) -> None:
+        for data in self.iter_dicts():
+            f.write(json.dumps(data, ensure_ascii=False, separators=(',', ':')))
+            f.write('\n')
@@ -0,0 +1,76 @@
+import glob
+import gzip
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from bs4 import BeautifulSoup
+
+from parsing import (
+    CONVERSATION_SELECTOR, TITLE_SELECTOR, build_conversation, in_window, jslog_timestamp
+)
+
+logger = logging.getLogger(__name__)
+
+try:
+    import lxml  # noqa: F401
+    PARSER = 'lxml'
+except ImportError:
+    PARSER = 'html.parser'
+
+def extract_html(html: str, since: Optional[datetime] = None,
+                 until: Optional[datetime] = None) -> List[Dict[str, str]]:
+    """Apply extract_conversations()'s rules to a saved page instead of a live one"""
+    soup = BeautifulSoup(html, PARSER)
+    conversations = []
+    for element in soup.select(CONVERSATION_SELECTOR):
+        jslog = element.get('jslog')
+        if not in_window(jslog_timestamp(jslog), since, until):
+            continue
+        title_element = element.select_one(TITLE_SELECTOR)
+        title = title_element.get_text() if title_element else ""
+        conversation = build_conversation(title, element.get_text(), jslog, element.get('href'))
+        if conversation:
+            conversations.append(conversation)
+    return conversations
+
+def extract_snapshot(path: str, since: Optional[datetime] = None,
+                     until: Optional[datetime] = None) -> Tuple[str, List[Dict[str, str]]]:
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        return path, extract_html(f.read(), since, until)
+
+def snapshot_paths(sources: List[str]) -> List[str]:
+    """Expand directories and glob patterns into a sorted list of snapshot files"""
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            paths.extend(glob.glob(os.path.join(source, '*.html.gz')))
+        else:
+            paths.extend(glob.glob(source))
+    return sorted(set(paths))
+
+def reextract(paths: List[str], workers: Optional[int] = None,
+              since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[Dict[str, str]]:
+    """Parse snapshots across a process pool and merge them like scrape() does.
+
+    Results are merged in path order, so reruns over the same archive give
+    the same output, and duplicate content across snapshots is kept once.
+    """
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(paths) // (workers * 4))
+    seen = set()
+    conversations = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(extract_snapshot, paths, [since] * len(paths), [until] * len(paths),
+                           chunksize=chunksize)
+        for path, extracted in results:
+            logger.debug("%s: %d conversations", path, len(extracted))
+            for conv in extracted:
+                if conv['content'] not in seen:
+                    seen.add(conv['content'])
+                    conversations.append(conv)
+    logger.info(f"Re-extracted {len(conversations)} conversations from {len(paths)} snapshots")
+    return conversations
@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+import backoff
+
+try:
+    from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+except ImportError:
+    PlaywrightTimeoutError = None
+
+logger = logging.getLogger(__name__)
+
+TIMEOUT = 'timeout'
+AUTH = 'auth'
+CAPTCHA = 'captcha'
+PROXY = 'proxy'
+SELECTOR = 'selector'
+UNKNOWN = 'unknown'
+
+# Retrying cannot fix a missing login or an unsolved captcha
+RETRYABLE = {TIMEOUT, PROXY, SELECTOR, UNKNOWN}
+
+PROXY_MARKERS = ('ERR_PROXY', 'ERR_TUNNEL', 'ERR_SOCKS', '407 Proxy', 'proxy authentication')
+CAPTCHA_MARKERS = ('captcha', 'unusual traffic', '/sorry/')
+AUTH_MARKERS = ('accounts.google.com', 'ServiceLogin', 'signin')
+TIMEOUT_ERRORS = (asyncio.TimeoutError, TimeoutError) + ((PlaywrightTimeoutError,) if PlaywrightTimeoutError else ())
+
+class AuthRequiredError(Exception):
+    """The target redirected to a login page"""
+
+class CaptchaRequiredError(Exception):
+    """The target is showing a captcha or bot-check page"""
+
+class SelectorNotFoundError(TimeoutError):
+    """None of the expected page elements appeared"""
+
+class CircuitOpenError(Exception):
+    """A breaker is open, so the call was not attempted"""
+
+class ScrapeError(Exception):
+    """A classified failure that exhausted its retries"""
+
+    def __init__(self, kind: str, error: Exception):
+        super().__init__(f"{kind}: {error}")
+        self.kind = kind
+        self.error = error
+
+def classify_error(error: Exception) -> str:
+    if isinstance(error, ScrapeError):
+        return error.kind
+    if isinstance(error, AuthRequiredError):
+        return AUTH
+    if isinstance(error, CaptchaRequiredError):
+        return CAPTCHA
+    if isinstance(error, SelectorNotFoundError):
+        return SELECTOR
+    message = str(error)
+    if any(marker.lower() in message.lower() for marker in PROXY_MARKERS):
+        return PROXY
+    if any(marker in message for marker in CAPTCHA_MARKERS):
+        return CAPTCHA
+    if isinstance(error, TIMEOUT_ERRORS):
+        return SELECTOR if 'waiting for selector' in message or 'locator' in message else TIMEOUT
+    if any(marker in message for marker in AUTH_MARKERS):
+        return AUTH
+    return UNKNOWN
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures and fails fast until
+    `reset_timeout` has passed; then lets `half_open_probes` trial calls
+    through at a time (half-open) and fails the rest fast until one of them
+    closes or reopens the circuit."""
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 300,
+                 half_open_probes: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self.failures = 0
+        self.opened_at = None
+        self.probes = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def check(self) -> bool:
+        """Raise CircuitOpenError unless the call may go ahead.
+
+        Returns True for a half-open trial call, which must end in
+        record_success(), record_failure() or release().
+        """
+        state = self.state
+        if state == 'open':
+            raise CircuitOpenError(f"Circuit for {self.name} is open")
+        if state == 'half-open':
+            if self.probes >= self.half_open_probes:
+                raise CircuitOpenError(f"Circuit for {self.name} is half-open, waiting on a trial call")
+            self.probes += 1
+            return True
+        return False
+
+    def release(self) -> None:
+        """End a trial call whose outcome says nothing about this circuit"""
+        self.probes = max(0, self.probes - 1)
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.probes = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        state = self.state
+        if state == 'half-open' or (state == 'closed' and self.failures >= self.failure_threshold):
+            logger.warning(f"Opening circuit for {self.name} after {self.failures} failures")
+            self.opened_at = time.monotonic()
+            self.probes = 0
+
+class BreakerRegistry:
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 300):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, name: str) -> CircuitBreaker:
+        if name not in self.breakers:
+            self.breakers[name] = CircuitBreaker(name, self.failure_threshold, self.reset_timeout)
+        return self.breakers[name]
+
+# Shared by every scraper in the process, so a target known to be down is
+# skipped by all of them
+breakers = BreakerRegistry()
+
+class RetryBudget:
+    """Total number of retries a job may spend across all of its calls"""
+
+    def __init__(self, retries: int):
+        self.remaining = retries
+
+    def take(self) -> bool:
+        if self.remaining <= 0:
+            return False
+        self.remaining -= 1
+        return True
+
+class RetryPolicy:
+    """Retries classified failures with exponential backoff and full jitter.
+
+    Proxy failures count against the proxy's breaker, or against the
+    target's when there is no proxy; target breakers count every other
+    failure except auth. An open breaker fails the call without trying it,
+    and a half-open one lets only its trial calls through.
+    """
+
+    def __init__(self, max_attempts: Optional[int] = None, base_delay: float = 1,
+                 max_delay: float = 30, registry: BreakerRegistry = breakers):
+        self.max_attempts = max_attempts or int(os.getenv('RETRY_ATTEMPTS', 3))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.registry = registry
+
+    def budget(self, calls: int = 1) -> RetryBudget:
+        return RetryBudget((self.max_attempts - 1) * calls)
+
+    async def run(self, func: Callable[[], Awaitable], target: str,
+                  proxy: Optional[str] = None, budget: Optional[RetryBudget] = None):
+        budget = budget or self.budget()
+        target_breaker = self.registry.get(f"target:{target}")
+        proxy_breaker = self.registry.get(f"proxy:{proxy}") if proxy else None
+        delays = backoff.expo(base=2, factor=self.base_delay, max_value=self.max_delay)
+        next(delays)  # The first value of backoff's generators is a priming None
+
+        for attempt in range(1, self.max_attempts + 1):
+            target_probe = target_breaker.check()
+            try:
+                proxy_probe = proxy_breaker.check() if proxy_breaker else False
+            except CircuitOpenError:
+                if target_probe:
+                    target_breaker.release()
+                raise
+            try:
+                result = await func()
+            except asyncio.CancelledError:
+                if target_probe:
+                    target_breaker.release()
+                if proxy_probe:
+                    proxy_breaker.release()
+                raise
+            except Exception as e:
+                kind = classify_error(e)
+                if kind == PROXY and proxy_breaker:
+                    proxy_breaker.record_failure()
+                    if target_probe:
+                        target_breaker.release()
+                else:
+                    if kind != AUTH:
+                        target_breaker.record_failure()
+                    elif target_probe:
+                        target_breaker.release()
+                    if proxy_probe:
+                        proxy_breaker.release()
+
+                if kind not in RETRYABLE or attempt == self.max_attempts or not budget.take():
+                    raise ScrapeError(kind, e) from e
+                delay = backoff.full_jitter(next(delays))
+                logger.warning(f"{kind} error on {target} (attempt {attempt}), retrying in {delay:.1f}s: {str(e)}")
+                await asyncio.sleep(delay)
+            else:
+                target_breaker.record_success()
+                if proxy_breaker:
+                    proxy_breaker.record_success()
+                return result
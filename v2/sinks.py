@@ -0,0 +1,495 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import sys
+import time
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Tuple
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+Record = Dict[str, str]
+
+BLOCK = 'block'
+SPILL = 'spill'
+
+class JsonFileSink:
+    """Streams conversation batches into a JSON array file as they arrive.
+
+    With `append`, records are added to the array already in the file
+    instead of replacing it, so resumed runs keep earlier output. File I/O
+    runs in a thread, off the event loop. A batch that fails part way is
+    cut back off the file, so SinkWorker can retry it without duplicates.
+    """
+
+    def __init__(self, output_file: str = 'gemini_conversations.json', append: bool = False):
+        self.output_file = output_file
+        self.append = append
+        self.count = 0
+        self._nonempty = False
+        self._file = None
+
+    def open(self) -> None:
+        if self.append and os.path.exists(self.output_file) and os.path.getsize(self.output_file):
+            self._nonempty = reopen_array(self.output_file)
+            self._file = open(self.output_file, 'ab')
+        else:
+            self._file = open(self.output_file, 'wb')
+            self._file.write(b'[')
+            self._file.flush()
+
+    def _write(self, batch: List[Dict[str, str]]) -> None:
+        if self._file is None:
+            self.open()
+        nonempty = self._nonempty
+        parts = []
+        for conv in batch:
+            parts.append(',\n  ' if nonempty else '\n  ')
+            parts.append(json.dumps(conv, ensure_ascii=False))
+            nonempty = True
+        write_or_rollback(self, ''.join(parts).encode('utf-8'))
+        self._nonempty = nonempty
+        self.count += len(batch)
+
+    def _close(self) -> None:
+        if self._file is None:
+            # Nothing was written, still leave a valid (empty) array behind
+            self.open()
+        self._file.write(b'\n]\n' if self._nonempty else b']\n')
+        self._file.close()
+        self._file = None
+
+    async def write(self, batch: List[Dict[str, str]]) -> None:
+        await asyncio.to_thread(self._write, batch)
+
+    async def close(self) -> None:
+        await asyncio.to_thread(self._close)
+        logger.info(f"Saved {self.count} conversations to {self.output_file}")
+
+def write_or_rollback(sink, data: bytes) -> None:
+    """Write and flush `data` to a file sink's `_file`, a binary file appended at its end.
+
+    If that fails, the file is truncated back to where it was, whatever part
+    of `data` reached it, and reopened for the sink before the error is
+    re-raised.
+    """
+    offset = sink._file.tell()
+    try:
+        sink._file.write(data)
+        sink._file.flush()
+    except Exception:
+        try:
+            # Also drops what is left in the write buffer
+            sink._file.close()
+        except OSError:
+            pass
+        os.truncate(sink.output_file, offset)
+        sink._file = open(sink.output_file, 'ab')
+        raise
+
+def reopen_array(path: str) -> bool:
+    """Cut the closing bracket off a JSON array file so records can be appended.
+
+    Accepts arrays left unterminated by an interrupted run. Returns whether
+    the array already has elements.
+    """
+    with open(path, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        # Only the tail is inspected, for the last element or the opening bracket
+        f.seek(max(0, end - 4096))
+        tail = f.read().rstrip()
+        if tail.endswith(b']'):
+            tail = tail[:-1].rstrip()
+        if not tail.endswith((b'}', b'[')):
+            raise ValueError(f"{path} does not end in a complete JSON array, cannot append to it")
+        f.truncate(max(0, end - 4096) + len(tail))
+        return tail.endswith(b'}')
+
+class NdjsonSink:
+    """One JSON record per line to a file, or to stdout for piping; written from a thread.
+
+    As with JsonFileSink, a batch that fails part way is cut back off a file;
+    stdout cannot be, so a retried batch may repeat lines there.
+    """
+
+    def __init__(self, output_file: str = '-'):
+        self.output_file = output_file
+        self._file = None
+
+    def _write(self, batch: List[Record]) -> None:
+        data = ''.join(json.dumps(conv, ensure_ascii=False) + '\n' for conv in batch)
+        if self.output_file == '-':
+            self._file = sys.stdout
+            self._file.write(data)
+            self._file.flush()
+            return
+        if self._file is None:
+            self._file = open(self.output_file, 'ab')
+        write_or_rollback(self, data.encode('utf-8'))
+
+    async def write(self, batch: List[Record]) -> None:
+        await asyncio.to_thread(self._write, batch)
+
+    async def close(self) -> None:
+        if self._file is not None and self._file is not sys.stdout:
+            await asyncio.to_thread(self._file.close)
+        self._file = None
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    content_hash TEXT PRIMARY KEY,
+    timestamp TEXT,
+    title TEXT,
+    content TEXT NOT NULL,
+    conversation_id TEXT,
+    account TEXT,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS conversations_timestamp ON conversations (timestamp);
+"""
+
+class SqliteSink:
+    """Upserts conversations into SQLite, keyed by content hash so reruns add no duplicates"""
+
+    def __init__(self, db_path: str = 'gemini_conversations.db'):
+        self.db_path = db_path
+        self.conn = None
+
+    def _write(self, batch: List[Record]) -> None:
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.executescript(SQLITE_SCHEMA)
+        rows = [(
+            hashlib.sha256(conv['content'].encode('utf-8')).hexdigest(), conv.get('timestamp'), conv.get('title'),
+            conv['content'], conv.get('conversation_id'), conv.get('account'), json.dumps(conv, ensure_ascii=False)
+        ) for conv in batch]
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO conversations VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    async def write(self, batch: List[Record]) -> None:
+        await asyncio.to_thread(self._write, batch)
+
+    async def close(self) -> None:
+        if self.conn is not None:
+            await asyncio.to_thread(self.conn.close)
+            self.conn = None
+
+class WebhookSink:
+    """POSTs each batch as {"conversations": [...]}; any non-2xx status is a failure"""
+
+    def __init__(self, url: str, headers: Optional[Dict[str, str]] = None, timeout: float = 30.0):
+        self.url = url
+        self.headers = headers or {}
+        token = os.getenv('WEBHOOK_TOKEN')
+        if token and 'Authorization' not in self.headers:
+            self.headers['Authorization'] = f"Bearer {token}"
+        self.timeout = timeout
+        self._session = None
+
+    async def write(self, batch: List[Record]) -> None:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                headers=self.headers, timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        async with self._session.post(self.url, json={'conversations': batch}) as response:
+            response.raise_for_status()
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+class ValTownSink:
+    """Delta-syncs batches to Val.Town through the v1 ValTownService"""
+
+    def __init__(self, service=None):
+        if service is None:
+            # ValTownService lives with the v1 TUI that introduced it
+            sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'v1'))
+            from valtown_service import ValTownService
+            service = ValTownService()
+        self.service = service
+
+    async def write(self, batch: List[Record]) -> None:
+        await self.service.sync_conversations(batch)
+
+    async def close(self) -> None:
+        await self.service.close()
+
+class SinkWorker:
+    """Delivers records to one sink in batches, with its own queue and retries.
+
+    A batch goes out when it reaches `batch_size` records or when its oldest
+    record has waited `flush_interval` seconds. Failed writes are retried
+    with jittered exponential backoff, up to `max_retries` times; after that
+    the batch is counted as failed and the worker moves on.
+
+    At most `max_pending` records wait in memory. When that is full, the
+    `overflow` policy decides:
+      - 'block': put() waits, which slows the scraper down (backpressure),
+        and raises if the worker task stops, since nothing would drain it;
+      - 'spill': records go to an NDJSON file in `spill_dir` and are
+        delivered from there in order, so a slow downstream costs disk
+        instead of memory or scrape time.
+    """
+
+    def __init__(self, name: str, sink, batch_size: int = 100, flush_interval: float = 2.0,
+                 max_pending: int = 1000, overflow: str = BLOCK, max_retries: int = 5,
+                 retry_backoff: float = 1.0, spill_dir: str = '.sink_spill'):
+        if overflow not in (BLOCK, SPILL):
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.name = name
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.overflow = overflow
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        slug = re.sub(r'[^\w.-]+', '_', name)[:60]
+        self.spill_path = Path(spill_dir) / f"{slug}-{os.getpid()}-{id(self)}.ndjson"
+        self.buffer: Deque[Tuple[float, Record]] = deque()
+        self.spilled = 0
+        self._spill_writer = None
+        self._spill_reader = None
+        self._spill_head = None
+        self._inflight_since: Optional[float] = None
+        self.data = asyncio.Event()
+        self.space = asyncio.Event()
+        self.closed = False
+        self.task: Optional[asyncio.Task] = None
+        self.accepted = 0
+        self.written = 0
+        self.failed = 0
+        self.retries = 0
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.run())
+
+    @property
+    def pending(self) -> int:
+        return len(self.buffer) + self.spilled
+
+    def lag(self) -> float:
+        """Seconds the oldest undelivered record has been waiting"""
+        oldest = self._inflight_since
+        if oldest is None and self.buffer:
+            oldest = self.buffer[0][0]
+        if oldest is None and self.spilled:
+            oldest = self._spill_head
+        return time.monotonic() - oldest if oldest is not None else 0.0
+
+    def stats(self) -> Dict:
+        return {
+            'sink': self.name, 'accepted': self.accepted, 'written': self.written, 'failed': self.failed,
+            'retries': self.retries, 'pending': self.pending, 'spilled': self.spilled,
+            'lag': round(self.lag(), 3),
+        }
+
+    def check_running(self) -> None:
+        """Raise rather than queue records for a worker that is not draining them"""
+        if self.task is None:
+            raise RuntimeError(f"Sink {self.name} worker was not started")
+        if self.task.done():
+            error = None if self.task.cancelled() else self.task.exception()
+            raise RuntimeError(f"Sink {self.name} worker has stopped") from error
+
+    async def wait_for_space(self) -> None:
+        # The worker has to see what is already queued, or nothing frees space
+        self.data.set()
+        while len(self.buffer) >= self.max_pending:
+            self.check_running()
+            self.space.clear()
+            waiter = asyncio.ensure_future(self.space.wait())
+            try:
+                await asyncio.wait({waiter, self.task}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                waiter.cancel()
+
+    async def put(self, batch: List[Record]) -> None:
+        self.check_running()
+        now = time.monotonic()
+        for record in batch:
+            # Once spilling, everything goes to disk until it is drained, to keep the order
+            if self.spilled or len(self.buffer) >= self.max_pending:
+                if self.overflow == SPILL:
+                    self.spill(now, record)
+                    continue
+                await self.wait_for_space()
+            self.buffer.append((now, record))
+            self.accepted += 1
+        self.data.set()
+
+    def spill(self, now: float, record: Record) -> None:
+        if self._spill_writer is None:
+            self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+            self._spill_writer = open(self.spill_path, 'w', encoding='utf-8')
+            self._spill_reader = open(self.spill_path, 'r', encoding='utf-8')
+            self._spill_head = now
+            logger.warning(f"Sink {self.name} is behind, spilling to {self.spill_path}")
+        self._spill_writer.write(json.dumps([now, record], ensure_ascii=False) + '\n')
+        self.spilled += 1
+        self.accepted += 1
+
+    def unspill(self, limit: int) -> List[Tuple[float, Record]]:
+        self._spill_writer.flush()
+        items = []
+        while len(items) < limit and self.spilled:
+            enqueued, record = json.loads(self._spill_reader.readline())
+            items.append((enqueued, record))
+            self.spilled -= 1
+            # The next spilled record is no older than this one
+            self._spill_head = enqueued
+        if not self.spilled:
+            self._spill_writer.close()
+            self._spill_reader.close()
+            self._spill_writer = self._spill_reader = None
+            self.spill_path.unlink(missing_ok=True)
+        return items
+
+    async def next_batch(self) -> List[Tuple[float, Record]]:
+        """Up to batch_size records, waiting at most flush_interval after the first"""
+        items: List[Tuple[float, Record]] = []
+        while len(items) < self.batch_size:
+            if self.buffer:
+                items.append(self.buffer.popleft())
+                self.space.set()
+                continue
+            if self.spilled:
+                items.extend(self.unspill(self.batch_size - len(items)))
+                continue
+            if self.closed:
+                break
+            self.data.clear()
+            if not items:
+                await self.data.wait()
+                continue
+            remaining = items[0][0] + self.flush_interval - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(self.data.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+        return items
+
+    async def deliver(self, items: List[Tuple[float, Record]]) -> None:
+        self._inflight_since = items[0][0]
+        batch = [record for _, record in items]
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    await self.sink.write(batch)
+                    self.written += len(batch)
+                    return
+                except Exception as e:
+                    if attempt >= self.max_retries:
+                        self.failed += len(batch)
+                        logger.error(f"Sink {self.name} dropped {len(batch)} records after "
+                                     f"{attempt + 1} attempts: {str(e)}")
+                        return
+                    self.retries += 1
+                    delay = random.uniform(0, self.retry_backoff * 2 ** attempt)
+                    logger.warning(f"Sink {self.name} write failed, retrying in {delay:.1f}s: {str(e)}")
+                    await asyncio.sleep(delay)
+        finally:
+            self._inflight_since = None
+
+    async def run(self) -> None:
+        while True:
+            items = await self.next_batch()
+            if not items:
+                return
+            await self.deliver(items)
+
+    async def close(self) -> None:
+        """Deliver everything still queued or spilled, then close the sink"""
+        self.closed = True
+        self.data.set()
+        try:
+            if self.task:
+                await self.task
+        finally:
+            await self.sink.close()
+
+class FanOutSink:
+    """Sends every batch to several sinks, each through its own SinkWorker.
+
+    Usable wherever a single sink is: write() returns once every worker has
+    accepted the batch, so only 'block' workers that are full hold up the
+    scraper. Per-sink progress and lag are logged every `report_interval`
+    seconds and once more on close.
+    """
+
+    def __init__(self, workers: List[SinkWorker], report_interval: float = 10.0):
+        self.workers = workers
+        self.report_interval = report_interval
+        self._reporter: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        for worker in self.workers:
+            worker.start()
+        self._reporter = asyncio.create_task(self.report_loop())
+
+    async def write(self, batch: List[Record]) -> None:
+        if self._reporter is None:
+            self.start()
+        await asyncio.gather(*(worker.put(batch) for worker in self.workers))
+
+    def stats(self) -> List[Dict]:
+        return [worker.stats() for worker in self.workers]
+
+    def report(self) -> None:
+        for stats in self.stats():
+            logger.info(f"Sink {stats['sink']}: {stats['written']} written, {stats['pending']} pending, "
+                        f"lag {stats['lag']}s", extra=stats)
+
+    async def report_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.report_interval)
+            self.report()
+
+    async def close(self) -> None:
+        if self._reporter is None:
+            self.start()
+        try:
+            results = await asyncio.gather(*(worker.close() for worker in self.workers), return_exceptions=True)
+        finally:
+            self._reporter.cancel()
+        self.report()
+        for worker, result in zip(self.workers, results):
+            if isinstance(result, Exception):
+                logger.error(f"Sink {worker.name} failed to close: {str(result)}")
+
+# Sinks that are local and fast wait for space; remote ones spill to disk
+SINK_TYPES = {
+    'file': (JsonFileSink, BLOCK),
+    'ndjson': (NdjsonSink, BLOCK),
+    'sqlite': (SqliteSink, BLOCK),
+    'webhook': (WebhookSink, SPILL),
+    'valtown': (ValTownSink, SPILL),
+}
+
+def build_sink(spec: str, **options) -> SinkWorker:
+    """A worker from a 'type:target' spec, e.g. file:out.json, ndjson:-, sqlite:out.db,
+    webhook:https://example.com/hook or valtown. An '@block' or '@spill' suffix
+    overrides the type's default overflow policy."""
+    overflow = None
+    if spec.endswith('@' + BLOCK) or spec.endswith('@' + SPILL):
+        spec, overflow = spec.rsplit('@', 1)
+    kind, _, target = spec.partition(':')
+    if kind not in SINK_TYPES:
+        raise ValueError(f"Unknown sink type: {kind}")
+    sink_class, default_overflow = SINK_TYPES[kind]
+    sink = sink_class(target) if target else sink_class()
+    return SinkWorker(spec, sink, overflow=overflow or default_overflow, **options)
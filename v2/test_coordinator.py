@@ -0,0 +1,142 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from coordinator import Coordinator, ShardQueue
+
+ACCOUNTS = [{'name': 'work', 'cookies_file': 'work.json'}, {'name': 'home'}]
+URLS = ['https://gemini.google.com/app', 'https://gemini.google.com/app?hl=fr']
+
+class Clock:
+    """Stands in for time.time so leases expire without waiting"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+class ShardQueueTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+        self.clock = Clock()
+        # Only the module's view of time
+        patcher = mock.patch('coordinator.time', mock.Mock(time=self.clock))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.queue = ShardQueue(str(self.dir / 'queue.db'), lease_timeout=60, max_attempts=2)
+        self.queue.submit(ACCOUNTS, URLS)
+
+    def test_submit_is_idempotent(self):
+        self.assertEqual(self.queue.submit(ACCOUNTS, URLS), 0)
+        self.assertEqual(self.queue.submit([{'name': 'work', 'urls': ['https://gemini.google.com/gem/x']}], URLS), 1)
+        self.assertEqual(self.queue.counts(), {'pending': 5})
+
+    def test_an_account_runs_one_shard_at_a_time(self):
+        a = self.queue.claim('a')
+        b = self.queue.claim('b')
+        self.assertNotEqual(a['account'], b['account'])
+        # Both accounts are busy
+        self.assertIsNone(self.queue.claim('c'))
+        self.assertIsNone(self.queue.claim('a'))
+
+    def test_account_stays_with_its_worker(self):
+        held = {}
+        for _ in range(2):
+            for worker in ('a', 'b'):
+                shard = self.queue.claim(worker)
+                held.setdefault(worker, shard['account'])
+                self.assertEqual(shard['account'], held[worker])
+                self.queue.complete(shard['id'], worker, None)
+        self.assertNotEqual(held['a'], held['b'])
+        self.assertEqual(self.queue.counts(), {'done': 4})
+        # An idle worker gets nothing while the accounts are leased
+        self.assertIsNone(self.queue.claim('c'))
+
+    def test_released_account_can_move(self):
+        a = self.queue.claim('a')
+        self.queue.complete(a['id'], 'a', None)
+        self.queue.release('a')
+        claimed = {self.queue.claim('b')['account'], self.queue.claim('c')['account']}
+        self.assertEqual(claimed, {'work', 'home'})
+
+    def single(self, max_attempts: int = 3) -> ShardQueue:
+        """A queue holding one shard"""
+        queue = ShardQueue(str(self.dir / 'single.db'), lease_timeout=60, max_attempts=max_attempts)
+        queue.submit(ACCOUNTS[:1], URLS[:1])
+        return queue
+
+    def test_expired_lease_is_stolen(self):
+        queue = self.single()
+        shard = queue.claim('a')
+        self.clock.now += 30
+        self.assertTrue(queue.heartbeat(shard['id'], 'a'))
+        self.assertIsNone(queue.claim('b'))
+        self.clock.now += 61
+        stolen = queue.claim('b')
+        self.assertEqual((stolen['id'], stolen['status'], stolen['worker']), (shard['id'], 'running', 'a'))
+        self.assertFalse(queue.heartbeat(shard['id'], 'a'))
+        # The old holder's late completion does not overwrite the new lease
+        queue.complete(shard['id'], 'a', 'late.json')
+        queue.complete(shard['id'], 'b', 'out.json')
+        self.assertEqual(queue.outputs(), [{'account': 'work', 'url': URLS[0], 'output': 'out.json'}])
+        row = queue.conn.execute("SELECT attempts FROM shards WHERE id = ?", (shard['id'],)).fetchone()
+        self.assertEqual(row['attempts'], 2)
+
+    def test_live_heartbeat_prevents_stealing(self):
+        a = self.queue.claim('a')
+        self.queue.claim('b')
+        for _ in range(3):
+            self.clock.now += 40
+            self.queue.heartbeat(a['id'], 'a')
+        shard = self.queue.claim('c')
+        self.assertNotEqual(shard['account'], a['account'])
+
+    def test_stale_shard_out_of_attempts_is_failed(self):
+        queue = self.single(max_attempts=2)
+        shard = queue.claim('a')
+        queue.fail(shard['id'], 'a', 'timeout')
+        self.assertEqual(queue.claim('a')['id'], shard['id'])
+        self.clock.now += 61
+        self.assertIsNone(queue.claim('b'))
+        row = queue.conn.execute("SELECT status, error FROM shards WHERE id = ?", (shard['id'],)).fetchone()
+        self.assertEqual(tuple(row), ('failed', 'lease expired'))
+
+    def test_failed_shard_is_retried_until_max_attempts(self):
+        queue = self.single(max_attempts=2)
+        shard = queue.claim('a')
+        queue.fail(shard['id'], 'a', 'captcha')
+        self.assertEqual(queue.counts(), {'pending': 1})
+        # The failed worker still holds the account, so the retry is its own
+        self.assertIsNone(queue.claim('b'))
+        self.assertEqual(queue.claim('a')['id'], shard['id'])
+        queue.fail(shard['id'], 'a', 'captcha')
+        self.assertIsNone(queue.claim('a'))
+        self.assertEqual(queue.counts(), {'failed': 1})
+        self.assertEqual(queue.unfinished(), 0)
+
+class MergeTest(unittest.TestCase):
+    def test_merge_tags_accounts_and_keeps_extra_fields(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            coordinator = Coordinator(db_path=str(tmp / 'queue.db'), out_dir=str(tmp))
+            coordinator.submit(ACCOUNTS, URLS[:1])
+            for worker in ('a', 'b'):
+                shard = coordinator.queue.claim(worker)
+                output = tmp / f"{shard['id']}.json"
+                output.write_text(json.dumps([
+                    {'timestamp': None, 'content': 'same question', 'language': 'en'},
+                    {'timestamp': None, 'content': 'same question', 'language': 'en'},
+                ]))
+                coordinator.queue.complete(shard['id'], worker, str(output))
+            self.assertEqual(coordinator.merge(str(tmp / 'merged.json')), 2)
+            merged = json.loads((tmp / 'merged.json').read_text())
+        self.assertEqual(sorted(record['account'] for record in merged), ['home', 'work'])
+        self.assertTrue(all(record['language'] == 'en' for record in merged))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from deadline import PHASE_SHARES, Deadline, DeadlineExceeded
+
+class Clock:
+    """Stands in for time.monotonic so budgets run out without waiting"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+class DeadlineTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch('deadline.time.monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_phase_shares_cover_the_url_budget(self):
+        self.assertAlmostEqual(sum(PHASE_SHARES.values()), 1.0)
+        deadline = Deadline(100)
+        deadline.begin_url(4)
+        for phase, share in PHASE_SHARES.items():
+            with self.subTest(phase=phase):
+                self.assertAlmostEqual(deadline.slice(phase), 25 * share)
+
+    def test_each_url_splits_what_is_left(self):
+        deadline = Deadline(100)
+        deadline.begin_url(2)
+        self.clock.now += 70
+        deadline.begin_url(1)
+        self.assertAlmostEqual(deadline.url_budget, 30)
+        self.assertAlmostEqual(deadline.slice('expand'), 30 * PHASE_SHARES['expand'])
+
+    def test_slice_never_exceeds_the_total_remaining(self):
+        deadline = Deadline(100)
+        deadline.begin_url(1)
+        self.clock.now += 95
+        self.assertAlmostEqual(deadline.slice('expand'), 5)
+        self.assertAlmostEqual(deadline.timeout_ms('expand', 30000), 5000)
+        self.assertEqual(deadline.timeout_ms('wait', 1000), 1000)
+
+    def test_unbounded_without_a_total(self):
+        deadline = Deadline()
+        deadline.begin_url(3)
+        self.assertIsNone(deadline.slice('navigate'))
+        self.assertIsNone(deadline.ends_at('navigate'))
+        self.assertEqual(deadline.timeout_ms('navigate', 30000), 30000)
+        self.assertFalse(deadline.expired)
+        deadline.check('navigate')
+
+    def test_check_raises_past_the_phase_end(self):
+        deadline = Deadline(100)
+        deadline.begin_url(1)
+        ends_at = deadline.ends_at('expand')
+        self.clock.now += 45
+        deadline.check('expand', ends_at)
+        self.clock.now += 1
+        with self.assertRaises(DeadlineExceeded) as raised:
+            deadline.check('expand', ends_at)
+        self.assertEqual(raised.exception.phase, 'expand')
+        self.assertFalse(raised.exception.cancelled)
+
+    def test_check_raises_once_the_total_is_spent(self):
+        deadline = Deadline(10)
+        self.clock.now += 10
+        self.assertTrue(deadline.expired)
+        with self.assertRaises(DeadlineExceeded):
+            deadline.check('extract')
+
+    def test_cancel_ends_every_phase(self):
+        deadline = Deadline()
+        deadline.cancel()
+        self.assertTrue(deadline.expired)
+        for phase in PHASE_SHARES:
+            with self.subTest(phase=phase), self.assertRaises(DeadlineExceeded) as raised:
+                deadline.check(phase)
+            self.assertTrue(raised.exception.cancelled)
+
+class DeadlineRunTest(unittest.IsolatedAsyncioTestCase):
+    async def test_returns_the_result_within_the_slice(self):
+        deadline = Deadline(5)
+        self.assertEqual(await deadline.run('navigate', asyncio.sleep(0, 'page')), 'page')
+
+    async def test_times_out_after_the_slice(self):
+        deadline = Deadline(0.2)
+        deadline.begin_url(1)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        with self.assertRaises(DeadlineExceeded) as raised:
+            await deadline.run('navigate', asyncio.sleep(10))
+        self.assertFalse(raised.exception.cancelled)
+        self.assertLess(loop.time() - started, 1)
+
+    async def test_cancel_interrupts_a_running_phase(self):
+        deadline = Deadline()
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.01, deadline.cancel)
+        with self.assertRaises(DeadlineExceeded) as raised:
+            await deadline.run('expand', asyncio.sleep(10))
+        self.assertTrue(raised.exception.cancelled)
+
+    async def test_expired_deadline_does_not_start_the_phase(self):
+        deadline = Deadline()
+        deadline.cancel()
+        coroutine = asyncio.sleep(0)
+        with self.assertRaises(DeadlineExceeded):
+            await deadline.run('navigate', coroutine)
+        self.assertIsNone(coroutine.cr_frame)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+import random
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from neardup import LSHIndex, NearDuplicateFilter, band_keys, minhash, shingles
+
+def text(words):
+    return ' '.join(words)
+
+def jaccard(a: str, b: str) -> float:
+    a, b = set(shingles(a)), set(shingles(b))
+    return len(a & b) / len(a | b)
+
+def variant(words, changes: int, rng: random.Random):
+    """A copy of `words` with `changes` words replaced by new ones"""
+    words = list(words)
+    for i in rng.sample(range(len(words)), changes):
+        words[i] = f"new{rng.randrange(10**9)}"
+    return words
+
+def record(content: str, **fields):
+    return {'timestamp': None, 'content': content, **fields}
+
+class MinHashTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(7)
+
+    def test_estimate_tracks_jaccard(self):
+        base = [f"w{i}" for i in range(200)]
+        for changes in (0, 10, 40, 100):
+            other = text(variant(base, changes, self.rng))
+            signatures = minhash([text(base), other])
+            estimate = (signatures[0] == signatures[1]).mean()
+            with self.subTest(changes=changes):
+                self.assertAlmostEqual(estimate, jaccard(text(base), other), delta=0.15)
+
+    def test_signatures_do_not_depend_on_the_batch(self):
+        texts = [f"conversation number {i}" for i in range(10)]
+        np.testing.assert_array_equal(minhash(texts)[3:5], minhash(texts[3:5]))
+        np.testing.assert_array_equal(minhash(texts, chunk_size=3), minhash(texts))
+
+class LSHIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(11)
+        self.index = LSHIndex()
+
+    def add(self, texts):
+        signatures = minhash(texts)
+        records = [record(t) for t in texts]
+        self.index.add_many(signatures, [f"k{self.index.size + i}" for i in range(len(texts))],
+                            [len(t) for t in texts], records)
+
+    def query(self, texts, threshold):
+        signatures = minhash(texts)
+        return [self.index.nearest(s, keys, threshold) for s, keys in zip(signatures, band_keys(signatures))]
+
+    def test_recall_of_near_duplicates(self):
+        originals = [[f"d{doc}w{i}" for i in range(60)] for doc in range(100)]
+        self.add([text(words) for words in originals])
+        # One word in sixty changed: Jaccard about 0.95
+        copies = [text(variant(words, 1, self.rng)) for words in originals]
+        found = [match[0] if match else None for match in self.query(copies, 0.8)]
+        self.assertGreaterEqual(sum(pos == doc for doc, pos in enumerate(found)), 98)
+
+    def test_unrelated_texts_do_not_match(self):
+        self.add([text(f"d{doc}w{i}" for i in range(60)) for doc in range(100)])
+        others = [text(f"x{doc}w{i}" for i in range(60)) for doc in range(100)]
+        self.assertEqual(self.query(others, 0.5), [None] * 100)
+
+    def test_threshold_is_applied_to_candidates(self):
+        base = [f"w{i}" for i in range(100)]
+        self.add([text(base)])
+        # Half the words replaced: Jaccard well below 0.8
+        halfway = text(variant(base, 50, self.rng))
+        self.assertIsNone(self.query([halfway], 0.8)[0])
+        match = self.query([text(base)], 0.8)[0]
+        self.assertEqual(match, (0, 1.0))
+
+    def test_npz_round_trip(self):
+        texts = [f"conversation {i} about topic {i % 7}" for i in range(50)]
+        self.add(texts)
+        self.index.records[3] = None
+        with tempfile.TemporaryDirectory() as tmp:
+            path = str(Path(tmp) / 'index.npz')
+            self.index.save(path)
+            loaded = LSHIndex.load(path)
+        self.assertEqual(loaded.size, 50)
+        np.testing.assert_array_equal(loaded.signatures[:50], self.index.signatures[:50])
+        self.assertEqual(loaded.keys, self.index.keys)
+        self.assertEqual(loaded.lengths, self.index.lengths)
+        self.assertEqual(loaded.records, self.index.records)
+        self.assertEqual(loaded.positions['k7'], 7)
+        signatures = minhash([texts[20]])
+        self.assertEqual(loaded.nearest(signatures[0], band_keys(signatures)[0], 0.9), (20, 1.0))
+
+    def test_missing_index_file_gives_an_empty_index(self):
+        self.assertEqual(LSHIndex.load('/nonexistent/index.npz').size, 0)
+        self.assertEqual(LSHIndex.load(None).size, 0)
+
+class NearDuplicateFilterTest(unittest.TestCase):
+    LONG = "how do I plan a three day trip from Lyon to Turin by train with a bike"
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.index_path = str(Path(tmp.name) / 'index.npz')
+
+    def near_pair(self):
+        return record(self.LONG, title='Trip'), record(self.LONG + " please", title=None, account='work')
+
+    def test_policies(self):
+        first, second = self.near_pair()
+        expected = {
+            'keep_first': first,
+            'keep_latest': second,
+            'keep_longest': second,
+            'merge': {**first, 'account': 'work'},
+        }
+        for policy, kept in expected.items():
+            with self.subTest(policy=policy):
+                self.assertEqual(NearDuplicateFilter(threshold=0.7, policy=policy).filter([first, second]), [kept])
+
+    def test_exact_rescrape_from_an_earlier_run_passes_through(self):
+        first, _ = self.near_pair()
+        NearDuplicateFilter(self.index_path).filter([first])
+        self.assertEqual(NearDuplicateFilter(self.index_path).filter([first]), [first])
+
+    def test_near_match_of_an_earlier_run_emits_the_kept_record(self):
+        first, second = self.near_pair()
+        NearDuplicateFilter(self.index_path, threshold=0.7).filter([first])
+        later = NearDuplicateFilter(self.index_path, threshold=0.7, policy='keep_first')
+        self.assertEqual(later.filter([second]), [first])
+
+    def test_batches_of_one_stream_are_not_emitted_twice(self):
+        first, second = self.near_pair()
+        stream = NearDuplicateFilter(threshold=0.7, policy='keep_first')
+        self.assertEqual(stream.filter([first], persist=False), [first])
+        self.assertEqual(stream.filter([second, dict(first)], persist=False), [])
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            NearDuplicateFilter(policy='keep_shortest')
+
+if __name__ == "__main__":
+    unittest.main()
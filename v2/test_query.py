@@ -0,0 +1,174 @@
+import json
+import math
+import os
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from pathlib import Path
+
+import query
+from query import OffsetIndex, RecordFilter, count_records, iter_records
+
+# Multi-byte text, so byte offsets and character offsets differ
+RECORDS = [
+    {'timestamp': '2024-01-01T10:00:00+00:00', 'title': 'Café', 'content': 'où est la gare — près du pont'},
+    {'timestamp': '2024-02-01T10:00:00+00:00', 'title': 'Trip', 'content': 'train from Lyon to Turin'},
+    {'timestamp': None, 'title': None, 'content': '日本語の質問 about trains'},
+    {'timestamp': '2024-03-01T10:00:00+00:00', 'title': 'Bikes', 'content': 'which bike for gravel'},
+]
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+class QueryTestCase(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+
+    def write_json(self, records, name='out.json') -> str:
+        path = self.dir / name
+        path.write_text(json.dumps(records, ensure_ascii=False, indent=2), encoding='utf-8')
+        return str(path)
+
+    def write_ndjson(self, records, name='out.ndjson') -> str:
+        path = self.dir / name
+        path.write_text(''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records),
+                        encoding='utf-8')
+        return str(path)
+
+    def paths(self):
+        return {'json': self.write_json(RECORDS), 'ndjson': self.write_ndjson(RECORDS)}
+
+    def entries(self, path):
+        index = OffsetIndex.open(path)
+        self.assertIsNotNone(index)
+        try:
+            return [index.entry(i) for i in range(len(index))]
+        finally:
+            index.close()
+
+class OffsetsTest(QueryTestCase):
+    def test_offsets_are_byte_ranges_of_each_record(self):
+        for fmt, path in self.paths().items():
+            with self.subTest(format=fmt):
+                self.assertEqual(list(iter_records(path)), RECORDS)
+                data = Path(path).read_bytes()
+                entries = self.entries(path)
+                self.assertEqual(len(entries), len(RECORDS))
+                for (offset, length, _), record in zip(entries, RECORDS):
+                    self.assertEqual(json.loads(data[offset:offset + length]), record)
+
+    def test_json_array_across_chunk_boundaries(self):
+        original = query.CHUNK_SIZE
+        query.CHUNK_SIZE = 64
+        self.addCleanup(setattr, query, 'CHUNK_SIZE', original)
+        records = RECORDS * 5 + [{'timestamp': None, 'content': 'é' * 500}]
+        path = self.write_json(records)
+        self.assertEqual(list(iter_records(path)), records)
+        data = Path(path).read_bytes()
+        for (offset, length, _), record in zip(self.entries(path), records):
+            self.assertEqual(json.loads(data[offset:offset + length]), record)
+
+    def test_index_keeps_times(self):
+        for fmt, path in self.paths().items():
+            with self.subTest(format=fmt):
+                # Lines the prefilter skips are timed from their raw bytes
+                list(iter_records(path, RecordFilter(contains='gravel')))
+                seconds = [entry[2] for entry in self.entries(path)]
+                self.assertEqual(seconds[1], utc(2024, 2, 1, 10).timestamp())
+                self.assertTrue(math.isnan(seconds[2]))
+
+    def test_truncated_json_array(self):
+        path = self.dir / 'out.json'
+        path.write_text(json.dumps(RECORDS)[:-30], encoding='utf-8')
+        with self.assertRaises(ValueError):
+            list(iter_records(str(path)))
+        self.assertFalse(Path(OffsetIndex.index_path(str(path))).exists())
+
+class FilterTest(QueryTestCase):
+    def test_filters_with_and_without_index(self):
+        cases = {
+            # Records without a timestamp cannot be placed, so they are kept
+            'window': (RecordFilter(since=utc(2024, 1, 15), until=utc(2024, 2, 15)), RECORDS[1:3]),
+            'title': (RecordFilter(title='café'), [RECORDS[0]]),
+            'contains': (RecordFilter(contains='TRAIN', ignore_case=True), [RECORDS[1], RECORDS[2]]),
+            'case sensitive': (RecordFilter(contains='TRAIN'), []),
+            'non-ascii': (RecordFilter(contains='près'), [RECORDS[0]]),
+        }
+        for fmt, path in self.paths().items():
+            for run in ('scan', 'index'):
+                for name, (record_filter, expected) in cases.items():
+                    with self.subTest(format=fmt, run=run, case=name):
+                        self.assertEqual(list(iter_records(path, record_filter, build_index=False)), expected)
+                list(iter_records(path))
+                self.assertEqual(count_records(path), len(RECORDS))
+
+    def test_prefiltered_lines_are_still_indexed(self):
+        path = self.paths()['ndjson']
+        self.assertEqual(list(iter_records(path, RecordFilter(contains='gravel'))), [RECORDS[3]])
+        self.assertEqual(count_records(path), len(RECORDS))
+
+class StartTest(QueryTestCase):
+    def test_start_skips_records_with_and_without_index(self):
+        for fmt, path in self.paths().items():
+            with self.subTest(format=fmt, run='scan'):
+                self.assertIsNone(count_records(path))
+                self.assertEqual(list(iter_records(path, start=2)), RECORDS[2:])
+                self.assertEqual(count_records(path), len(RECORDS))
+            with self.subTest(format=fmt, run='index'):
+                self.assertEqual(list(iter_records(path, start=2)), RECORDS[2:])
+                self.assertEqual(list(iter_records(path, start=len(RECORDS))), [])
+
+    def test_start_counts_records_before_filtering(self):
+        for fmt, path in self.paths().items():
+            for run in ('scan', 'index'):
+                with self.subTest(format=fmt, run=run):
+                    records = iter_records(path, RecordFilter(contains='train'), start=2)
+                    self.assertEqual(list(records), [RECORDS[2]])
+                    self.assertEqual(count_records(path), len(RECORDS))
+
+class StalenessTest(QueryTestCase):
+    def test_no_index_without_a_full_scan(self):
+        path = self.paths()['ndjson']
+        records = iter_records(path)
+        next(records)
+        records.close()
+        self.assertIsNone(count_records(path))
+        self.assertFalse(Path(OffsetIndex.index_path(path) + '.tmp').exists())
+        list(iter_records(path, build_index=False))
+        self.assertIsNone(count_records(path))
+
+    def test_appended_file_is_rescanned(self):
+        path = self.write_ndjson(RECORDS[:2])
+        list(iter_records(path))
+        self.assertEqual(count_records(path), 2)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(RECORDS[2], ensure_ascii=False) + '\n')
+        with self.assertLogs('query', 'INFO') as logs:
+            self.assertIsNone(count_records(path))
+        self.assertIn('stale', logs.output[0])
+        self.assertEqual(list(iter_records(path)), RECORDS[:3])
+        self.assertEqual(count_records(path), 3)
+
+    def test_rewrite_of_the_same_size_is_detected(self):
+        path = self.write_ndjson(RECORDS[:2])
+        list(iter_records(path))
+        stat = os.stat(path)
+        swapped = Path(path).read_text(encoding='utf-8').replace('Lyon', 'Nice')
+        Path(path).write_text(swapped, encoding='utf-8')
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+        self.assertIsNone(count_records(path))
+        self.assertIn('Nice', list(iter_records(path))[1]['content'])
+
+    def test_damaged_index_is_ignored(self):
+        path = self.paths()['json']
+        list(iter_records(path))
+        index_path = Path(OffsetIndex.index_path(path))
+        index_path.write_bytes(index_path.read_bytes()[:-8])
+        with self.assertLogs('query', 'INFO'):
+            self.assertIsNone(count_records(path))
+        self.assertEqual(list(iter_records(path)), RECORDS)
+
+if __name__ == "__main__":
+    unittest.main()
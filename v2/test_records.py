@@ -0,0 +1,71 @@
+import io
+import json
+import unittest
+
+from parsing import build_conversation
+from records import Conversation, ConversationBatch
+
+JSLOG = 'timestamp=2024-06-10T06:13:20Z;c_3f2a9b1e7d'
+
+def scraped(title='Trip plans', content='How long is the drive from Lyon to Turin?'):
+    return build_conversation(title, content, JSLOG)
+
+class ConversationTest(unittest.TestCase):
+    def test_round_trips_scraper_records(self):
+        record = scraped()
+        self.assertIn('url', record)
+        self.assertEqual(Conversation.from_dict(record).to_dict(), record)
+
+    def test_keeps_unknown_fields(self):
+        record = dict(scraped(), language='en', tokens=9, account='work')
+        conversation = Conversation.from_dict(record)
+        self.assertEqual(conversation.extra, {'language': 'en', 'tokens': 9})
+        self.assertEqual(conversation.to_dict(), record)
+
+    def test_keeps_url_that_is_not_derived(self):
+        record = {'timestamp': None, 'content': 'no id here', 'url': 'https://example.test/1'}
+        self.assertEqual(Conversation.from_dict(record).to_dict(), record)
+
+    def test_interns_repeated_values(self):
+        a = Conversation.from_dict(scraped(title=''.join(['Trip ', 'plans'])))
+        b = Conversation.from_dict(scraped(title=''.join(['Trip', ' plans'])))
+        self.assertIs(a.title, b.title)
+        self.assertIs(a.timestamp, b.timestamp)
+
+class ConversationBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.records = [
+            dict(scraped(content='first question, long enough'), language='en'),
+            scraped(title='Other', content='second question, long enough'),
+            {'timestamp': None, 'content': 'third, untitled and without an id'},
+        ]
+
+    def test_round_trips_records(self):
+        batch = ConversationBatch(self.records)
+        self.assertEqual(len(batch), 3)
+        self.assertEqual(batch.to_dicts(), self.records)
+        self.assertEqual(ConversationBatch(batch).to_dicts(), self.records)
+
+    def test_encodes_repeated_values_once(self):
+        batch = ConversationBatch(self.records * 100)
+        self.assertEqual(batch.tables['timestamp'].values, [self.records[0]['timestamp']])
+        self.assertEqual(len(batch.tables['title'].values), 2)
+
+    def test_unique_by_content_keeps_first_in_order(self):
+        later = dict(self.records[0], language='fr')
+        batch = ConversationBatch(self.records + [later, self.records[1]])
+        self.assertEqual(batch.unique_by_content().to_dicts(), self.records)
+
+    def test_write_json_and_ndjson(self):
+        batch = ConversationBatch(self.records)
+        for indent in (2, None):
+            with self.subTest(indent=indent):
+                out = io.StringIO()
+                batch.write_json(out, indent=indent)
+                self.assertEqual(json.loads(out.getvalue()), self.records)
+        out = io.StringIO()
+        batch.write_ndjson(out)
+        self.assertEqual([json.loads(line) for line in out.getvalue().splitlines()], self.records)
+
+if __name__ == "__main__":
+    unittest.main()
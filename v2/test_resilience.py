@@ -0,0 +1,171 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from resilience import (
+    AUTH, CAPTCHA, PROXY, SELECTOR, TIMEOUT, UNKNOWN, AuthRequiredError, BreakerRegistry,
+    CaptchaRequiredError, CircuitBreaker, CircuitOpenError, RetryPolicy, ScrapeError,
+    SelectorNotFoundError, classify_error
+)
+
+class Clock:
+    """Stands in for time.monotonic so breaker cool-downs pass instantly"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch('resilience.time.monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker('target:test', failure_threshold=3, reset_timeout=60)
+
+    def open_breaker(self):
+        for _ in range(3):
+            self.breaker.check()
+            self.breaker.record_failure()
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, 'closed')
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, 'open')
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.check()
+
+    def test_success_resets_the_failure_count(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, 'closed')
+
+    def test_half_open_lets_one_trial_call_through(self):
+        self.open_breaker()
+        self.clock.now += 60
+        self.assertEqual(self.breaker.state, 'half-open')
+        self.assertTrue(self.breaker.check())
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.check()
+
+    def test_successful_trial_closes(self):
+        self.open_breaker()
+        self.clock.now += 60
+        self.breaker.check()
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, 'closed')
+        self.assertFalse(self.breaker.check())
+
+    def test_failed_trial_reopens_for_a_full_cool_down(self):
+        self.open_breaker()
+        self.clock.now += 60
+        self.breaker.check()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, 'open')
+        self.clock.now += 59
+        self.assertEqual(self.breaker.state, 'open')
+        self.clock.now += 1
+        self.assertTrue(self.breaker.check())
+
+    def test_released_trial_frees_the_probe(self):
+        self.open_breaker()
+        self.clock.now += 60
+        self.breaker.check()
+        self.breaker.release()
+        self.assertEqual(self.breaker.state, 'half-open')
+        self.assertTrue(self.breaker.check())
+
+class ClassifyErrorTest(unittest.TestCase):
+    def test_kinds(self):
+        cases = [
+            (AuthRequiredError('login'), AUTH),
+            (CaptchaRequiredError('captcha'), CAPTCHA),
+            (SelectorNotFoundError('no items'), SELECTOR),
+            (Exception('net::ERR_PROXY_CONNECTION_FAILED'), PROXY),
+            (Exception('407 Proxy Authentication Required'), PROXY),
+            (Exception('redirected to /sorry/index'), CAPTCHA),
+            (asyncio.TimeoutError(), TIMEOUT),
+            (TimeoutError('waiting for selector ".item"'), SELECTOR),
+            (Exception('redirected to accounts.google.com'), AUTH),
+            (ValueError('something else'), UNKNOWN),
+            (ScrapeError(PROXY, Exception('wrapped')), PROXY),
+        ]
+        for error, kind in cases:
+            with self.subTest(error=error):
+                self.assertEqual(classify_error(error), kind)
+
+class RetryPolicyTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.registry = BreakerRegistry(failure_threshold=5, reset_timeout=60)
+        self.policy = RetryPolicy(max_attempts=3, base_delay=0, registry=self.registry)
+
+    def failing(self, *errors):
+        calls = []
+
+        async def func():
+            calls.append(len(calls))
+            if len(calls) <= len(errors):
+                raise errors[len(calls) - 1]
+            return 'ok'
+        return func, calls
+
+    async def test_retryable_failure_is_retried(self):
+        func, calls = self.failing(asyncio.TimeoutError())
+        self.assertEqual(await self.policy.run(func, target='example.test'), 'ok')
+        self.assertEqual(len(calls), 2)
+
+    async def test_auth_failure_is_not_retried_or_counted(self):
+        func, calls = self.failing(AuthRequiredError('login'))
+        with self.assertRaises(ScrapeError) as raised:
+            await self.policy.run(func, target='example.test')
+        self.assertEqual(raised.exception.kind, AUTH)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.registry.get('target:example.test').failures, 0)
+
+    async def test_gives_up_after_max_attempts(self):
+        errors = [ValueError(str(i)) for i in range(3)]
+        func, calls = self.failing(*errors)
+        with self.assertRaises(ScrapeError) as raised:
+            await self.policy.run(func, target='example.test')
+        self.assertEqual(raised.exception.kind, UNKNOWN)
+        self.assertEqual(len(calls), 3)
+
+    async def test_retry_budget_is_shared(self):
+        budget = self.policy.budget(1)
+        func, calls = self.failing(*[ValueError()] * 3)
+        with self.assertRaises(ScrapeError):
+            await self.policy.run(func, target='a.test', budget=budget)
+        func, calls = self.failing(ValueError())
+        with self.assertRaises(ScrapeError):
+            await self.policy.run(func, target='b.test', budget=budget)
+        self.assertEqual(len(calls), 1)
+
+    async def test_proxy_failures_count_against_the_proxy_only(self):
+        registry = BreakerRegistry(failure_threshold=2, reset_timeout=60)
+        policy = RetryPolicy(max_attempts=2, base_delay=0, registry=registry)
+        func, _ = self.failing(*[Exception('net::ERR_PROXY_CONNECTION_FAILED')] * 2)
+        with self.assertRaises(ScrapeError):
+            await policy.run(func, target='example.test', proxy='http://bad:8080')
+        self.assertEqual(registry.get('proxy:http://bad:8080').state, 'open')
+        self.assertEqual(registry.get('target:example.test').failures, 0)
+        # Another account on a different proxy still reaches the target
+        func, _ = self.failing()
+        self.assertEqual(await policy.run(func, target='example.test', proxy='http://good:8080'), 'ok')
+
+    async def test_open_breaker_fails_fast(self):
+        breaker = self.registry.get('target:example.test')
+        for _ in range(5):
+            breaker.record_failure()
+        func, calls = self.failing()
+        with self.assertRaises(CircuitOpenError):
+            await self.policy.run(func, target='example.test')
+        self.assertEqual(calls, [])
+
+if __name__ == "__main__":
+    unittest.main()
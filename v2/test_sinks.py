@@ -0,0 +1,182 @@
+import asyncio
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from sinks import SPILL, JsonFileSink, NdjsonSink, SinkWorker, SqliteSink
+
+def records(start: int, count: int):
+    return [{'timestamp': None, 'content': f'conversation {i}'} for i in range(start, start + count)]
+
+class GatedSink:
+    """Keeps written batches; each write waits until the test opens the gate"""
+
+    def __init__(self):
+        self.batches = []
+        self.gate = asyncio.Event()
+        self.closed = False
+
+    async def write(self, batch):
+        await self.gate.wait()
+        self.batches.append(batch)
+
+    async def close(self):
+        self.closed = True
+
+    @property
+    def records(self):
+        return [record for batch in self.batches for record in batch]
+
+class FlakySink(GatedSink):
+    """Fails its first `failures` writes"""
+
+    def __init__(self, failures: int):
+        super().__init__()
+        self.gate.set()
+        self.failures = failures
+
+    async def write(self, batch):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('webhook returned 503')
+        await super().write(batch)
+
+class PartialFile:
+    """Binary file whose next write lands half its data on disk, then fails"""
+
+    def __init__(self, f):
+        self.f = f
+
+    def tell(self):
+        return self.f.tell()
+
+    def write(self, data):
+        self.f.write(data[:len(data) // 2])
+        self.f.flush()
+        raise OSError(28, 'No space left on device')
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+class TempDirTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+
+class SinkWorkerTest(TempDirTestCase):
+    def worker(self, sink, **options) -> SinkWorker:
+        options = {'batch_size': 2, 'flush_interval': 0.01, 'retry_backoff': 0,
+                   'spill_dir': str(self.dir / 'spill'), **options}
+        worker = SinkWorker('test', sink, **options)
+        worker.start()
+        return worker
+
+    async def test_block_waits_for_space(self):
+        sink = GatedSink()
+        worker = self.worker(sink, max_pending=3)
+        put = asyncio.create_task(worker.put(records(0, 8)))
+        await asyncio.sleep(0.05)
+        self.assertFalse(put.done())
+        self.assertLessEqual(len(worker.buffer), 3)
+        sink.gate.set()
+        await asyncio.wait_for(put, 1)
+        await worker.close()
+        self.assertEqual(sink.records, records(0, 8))
+        self.assertTrue(sink.closed)
+
+    async def test_block_raises_once_the_worker_stops(self):
+        worker = self.worker(GatedSink(), max_pending=1)
+        put = asyncio.create_task(worker.put(records(0, 5)))
+        await asyncio.sleep(0.01)
+        worker.task.cancel()
+        with self.assertRaises(RuntimeError):
+            await asyncio.wait_for(put, 1)
+        with self.assertRaises(RuntimeError):
+            await worker.put(records(5, 1))
+
+    async def test_spill_keeps_put_fast_and_order_intact(self):
+        sink = GatedSink()
+        worker = self.worker(sink, max_pending=3, overflow=SPILL)
+        await asyncio.wait_for(worker.put(records(0, 10)), 1)
+        self.assertGreater(worker.spilled, 0)
+        self.assertTrue(worker.spill_path.exists())
+        await worker.put(records(10, 2))
+        sink.gate.set()
+        await worker.close()
+        self.assertEqual(sink.records, records(0, 12))
+        self.assertEqual((worker.written, worker.pending), (12, 0))
+        self.assertFalse(worker.spill_path.exists())
+
+    async def test_failed_writes_are_retried(self):
+        sink = FlakySink(failures=2)
+        worker = self.worker(sink, max_retries=3)
+        await worker.put(records(0, 2))
+        await worker.close()
+        self.assertEqual(sink.records, records(0, 2))
+        self.assertEqual((worker.written, worker.retries, worker.failed), (2, 2, 0))
+
+    async def test_batch_is_dropped_after_max_retries(self):
+        sink = FlakySink(failures=3)
+        worker = self.worker(sink, max_retries=2)
+        with self.assertLogs('sinks', 'ERROR'):
+            await worker.put(records(0, 2))
+            await worker.put(records(2, 2))
+            await worker.close()
+        self.assertEqual(sink.records, records(2, 2))
+        self.assertEqual((worker.written, worker.failed), (2, 2))
+
+    async def test_retried_file_batch_is_not_duplicated(self):
+        path = self.dir / 'out.json'
+        sink = JsonFileSink(str(path))
+        worker = self.worker(sink, batch_size=3)
+        await worker.put(records(0, 3))
+        while worker.written < 3:
+            await asyncio.sleep(0.01)
+        sink._file = PartialFile(sink._file)
+        await worker.put(records(3, 3))
+        await worker.close()
+        self.assertEqual(worker.retries, 1)
+        self.assertEqual(json.loads(path.read_text()), records(0, 6))
+
+class FileSinkTest(TempDirTestCase):
+    async def test_json_file_append_keeps_earlier_records(self):
+        path = str(self.dir / 'out.json')
+        for start in (0, 2):
+            sink = JsonFileSink(path, append=True)
+            await sink.write(records(start, 2))
+            await sink.close()
+        with open(path, encoding='utf-8') as f:
+            self.assertEqual(json.load(f), records(0, 4))
+
+    async def test_empty_json_file_is_a_valid_array(self):
+        path = self.dir / 'out.json'
+        await JsonFileSink(str(path)).close()
+        self.assertEqual(json.loads(path.read_text()), [])
+
+    async def test_ndjson_partial_write_is_rolled_back(self):
+        path = self.dir / 'out.ndjson'
+        sink = NdjsonSink(str(path))
+        await sink.write(records(0, 2))
+        sink._file = PartialFile(sink._file)
+        with self.assertRaises(OSError):
+            await sink.write(records(2, 2))
+        await sink.write(records(2, 2))
+        await sink.close()
+        self.assertEqual([json.loads(line) for line in path.read_text().splitlines()], records(0, 4))
+
+    async def test_sqlite_upserts_by_content(self):
+        sink = SqliteSink(str(self.dir / 'out.db'))
+        await sink.write(records(0, 3))
+        await sink.write(records(1, 3))
+        count = sink.conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+        await sink.close()
+        self.assertEqual(count, 4)
+        self.assertIsNone(sink.conn)
+
+if __name__ == "__main__":
+    unittest.main()
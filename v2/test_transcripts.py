@@ -0,0 +1,78 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from transcripts import TranscriptFetcher
+
+class FakePage:
+    def __init__(self):
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+class MemorySink:
+    def __init__(self):
+        self.records = []
+
+    async def write(self, batch):
+        self.records.extend(batch)
+
+class FakeFetcher(TranscriptFetcher):
+    """Pages that need no browser; the first `broken` pages fail to open"""
+
+    def __init__(self, state_file: str, broken: int = 0, concurrency: int = 3):
+        super().__init__(scraper=None, concurrency=concurrency, state_file=state_file)
+        self.broken = broken
+        self.pages = []
+
+    async def new_page(self):
+        if self.broken:
+            self.broken -= 1
+            raise RuntimeError('browser context refused')
+        page = FakePage()
+        self.pages.append(page)
+        return page
+
+    async def fetch_turns(self, page, url):
+        if url.endswith('/bad'):
+            raise RuntimeError('no turns')
+        return [{'role': 'user', 'content': f'question at {url}'}, {'role': 'model', 'content': 'answer'}]
+
+def listing(*ids):
+    return [{'conversation_id': i, 'url': f'https://example.test/app/{i}', 'content': f'listing {i}'}
+            for i in ids]
+
+class FetchAllTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.state_file = str(Path(tmp.name) / 'state.json')
+
+    async def test_fetches_every_transcript_and_closes_pages(self):
+        fetcher, sink = FakeFetcher(self.state_file), MemorySink()
+        stats = await fetcher.fetch_all(listing('a', 'b', 'c', 'bad'), sink)
+        self.assertEqual((stats['fetched'], stats['failed']), (3, 1))
+        self.assertEqual(len(sink.records), 6)
+        self.assertTrue(all(page.closed for page in fetcher.pages))
+
+    async def test_unchanged_listings_are_skipped_next_run(self):
+        await FakeFetcher(self.state_file).fetch_all(listing('a', 'b'), MemorySink())
+        stats = await FakeFetcher(self.state_file).fetch_all(listing('a', 'b', 'c'), MemorySink())
+        self.assertEqual((stats['skipped'], stats['fetched']), (2, 1))
+
+    async def test_other_workers_take_over_from_one_that_cannot_open_a_page(self):
+        fetcher, sink = FakeFetcher(self.state_file, broken=1), MemorySink()
+        with self.assertLogs('transcripts', 'ERROR'):
+            stats = await fetcher.fetch_all(listing('a', 'b', 'c', 'd'), sink)
+        self.assertEqual(stats['fetched'], 4)
+        self.assertEqual(len(fetcher.pages), 2)
+        self.assertTrue(all(page.closed for page in fetcher.pages))
+
+    async def test_raises_when_no_worker_can_open_a_page(self):
+        fetcher = FakeFetcher(self.state_file, broken=3)
+        with self.assertLogs('transcripts', 'ERROR'), self.assertRaises(RuntimeError):
+            await fetcher.fetch_all(listing('a', 'b', 'c'), MemorySink())
+
+if __name__ == "__main__":
+    unittest.main()
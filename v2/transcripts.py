@@ -0,0 +1,230 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+from typing import Dict, List, Optional, Tuple
+
+from har import replay_har
+
+logger = logging.getLogger(__name__)
+
+TURN_SELECTOR = "user-query, model-response"
+JOURNAL_SUFFIX = '.journal'
+# State entries are appended to the journal in batches of this size
+JOURNAL_BATCH = 20
+
+# Reads every turn of an open conversation in document order in one round trip
+EXTRACT_TURNS_JS = """
+(selector) => Array.from(document.querySelectorAll(selector)).map(el => ({
+    role: el.tagName.toLowerCase() === 'user-query' ? 'user' : 'model',
+    content: (el.textContent || '').trim(),
+}))
+"""
+
+def listing_hash(conversation: Dict[str, str]) -> str:
+    """Hash of the sidebar entry, used to skip conversations that have not changed"""
+    key = json.dumps(
+        [conversation.get('title'), conversation.get('content'), conversation.get('timestamp')],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(key.encode()).hexdigest()
+
+class TranscriptFetcher:
+    """Fetches full transcripts concurrently through a bounded pool of browser contexts.
+
+    Every navigation goes through the scraper's rate limiter, and each pooled
+    context gets its own proxy from the scraper's pool. Progress is kept in a
+    state file keyed by conversation ID, so an interrupted run resumes where
+    it stopped and unchanged conversations are not fetched again.
+
+    Progress is appended to a journal next to the state file in small
+    batches, off the event loop, and folded into the state file at the end
+    of the run; loading replays the journal over the state file.
+    """
+
+    def __init__(self, scraper, concurrency: int = 4,
+                 state_file: str = 'transcripts_state.json'):
+        self.scraper = scraper
+        self.concurrency = max(1, concurrency)
+        self.state_file = state_file
+        self.journal_file = state_file + JOURNAL_SUFFIX
+        self.state = self.load_state()
+        self.pending: List[Tuple[str, Dict[str, str]]] = []
+        self.journal_lock = asyncio.Lock()
+        self.contexts = []
+
+    def load_state(self) -> Dict[str, Dict[str, str]]:
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            state = {}
+        try:
+            with open(self.journal_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        conversation_id, entry = json.loads(line)
+                    except ValueError:
+                        # A line cut short by an interrupted run
+                        continue
+                    state[conversation_id] = entry
+        except FileNotFoundError:
+            pass
+        return state
+
+    def append_journal(self, entries: List[Tuple[str, Dict[str, str]]]) -> None:
+        with open(self.journal_file, 'a', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(entry) + '\n' for entry in entries))
+
+    def write_state(self, state: Dict[str, Dict[str, str]]) -> None:
+        tmp_file = f"{self.state_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_file, self.state_file)
+        # The journal is only dropped once the state file holds everything in it
+        if os.path.exists(self.journal_file):
+            os.remove(self.journal_file)
+
+    async def record(self, conversation_id: str, entry: Dict[str, str]) -> None:
+        self.state[conversation_id] = entry
+        self.pending.append((conversation_id, entry))
+        if len(self.pending) >= JOURNAL_BATCH:
+            await self.flush_journal()
+
+    async def flush_journal(self) -> None:
+        async with self.journal_lock:
+            entries, self.pending = self.pending, []
+            if entries:
+                await asyncio.to_thread(self.append_journal, entries)
+
+    async def save_state(self) -> None:
+        """Fold the journal into the state file"""
+        async with self.journal_lock:
+            self.pending = []
+            await asyncio.to_thread(self.write_state, dict(self.state))
+
+    async def new_page(self):
+        """Open a pooled page in its own context, sharing the scraper's cookies"""
+        options = {'user_agent': self.scraper.ua.random}
+        if self.scraper.proxy_pool and not self.scraper.replay_har:
+            options['proxy'] = {
+                'server': random.choice(self.scraper.proxy_pool),
+                'username': os.getenv('PROXY_USER'),
+                'password': os.getenv('PROXY_PASS')
+            }
+        context = await self.scraper.browser.new_context(**options)
+        if self.scraper.replay_har:
+            await replay_har(context, self.scraper.replay_har, self.scraper.replay_latency)
+        await context.add_cookies(await self.scraper.context.cookies())
+        self.contexts.append(context)
+        return await context.new_page()
+
+    async def fetch_turns(self, page, url: str) -> List[Dict[str, str]]:
+        async with self.scraper.limiter:
+            logger.info('Fetching transcript %s', url)
+            await page.goto(url)
+        await page.wait_for_selector(TURN_SELECTOR, timeout=15000)
+        await page.wait_for_load_state('networkidle')
+        return await page.evaluate(EXTRACT_TURNS_JS, TURN_SELECTOR)
+
+    async def worker(self, queue: asyncio.Queue, sink, stats: Dict[str, int]) -> None:
+        """Fetch queued conversations on one page until a None sentinel, then close the page"""
+        page = None
+        try:
+            page = await self.new_page()
+            while True:
+                conversation = await queue.get()
+                try:
+                    if conversation is None:
+                        return
+                    await self.process(page, conversation, sink, stats)
+                except Exception as e:
+                    stats['failed'] += 1
+                    logger.warning(f"Failed to fetch transcript {conversation['conversation_id']}: {str(e)}")
+                finally:
+                    queue.task_done()
+        finally:
+            if page is not None:
+                await page.close()
+
+    async def process(self, page, conversation: Dict[str, str], sink, stats: Dict[str, int]) -> None:
+        conversation_id = conversation['conversation_id']
+        turns = await self.fetch_turns(page, conversation['url'])
+        transcript_hash = hashlib.sha256(
+            json.dumps(turns, ensure_ascii=False).encode()
+        ).hexdigest()
+
+        previous = self.state.get(conversation_id, {})
+        if previous.get('transcript_hash') != transcript_hash:
+            await sink.write([
+                {
+                    'conversation_id': conversation_id,
+                    'title': conversation.get('title'),
+                    'turn': index,
+                    'role': turn['role'],
+                    'content': turn['content']
+                }
+                for index, turn in enumerate(turns)
+            ])
+            stats['fetched'] += 1
+        else:
+            stats['unchanged'] += 1
+
+        await self.record(conversation_id, {
+            'listing_hash': listing_hash(conversation),
+            'transcript_hash': transcript_hash
+        })
+
+    async def fetch_all(self, conversations: List[Dict[str, str]], sink) -> Dict[str, int]:
+        """Fetch every conversation with an ID, streaming turns into the sink"""
+        stats = {'fetched': 0, 'unchanged': 0, 'skipped': 0, 'failed': 0}
+        queue = asyncio.Queue()
+        for conversation in conversations:
+            conversation_id = conversation.get('conversation_id')
+            if not conversation_id:
+                continue
+            if self.state.get(conversation_id, {}).get('listing_hash') == listing_hash(conversation):
+                stats['skipped'] += 1
+                continue
+            queue.put_nowait(conversation)
+
+        workers = min(self.concurrency, queue.qsize())
+        for _ in range(workers):
+            queue.put_nowait(None)
+        logger.info(f"Fetching {queue.qsize() - workers} transcripts with {workers} pages "
+                    f"({stats['skipped']} unchanged since last run)")
+        try:
+            # A worker that cannot open its page leaves its share to the others
+            results = await asyncio.gather(*(self.worker(queue, sink, stats) for _ in range(workers)),
+                                           return_exceptions=True)
+            errors = [result for result in results if isinstance(result, BaseException)]
+            for error in errors:
+                logger.error(f"Transcript worker failed: {str(error)}")
+            if errors and len(errors) == workers:
+                raise errors[0]
+        finally:
+            for context in self.contexts:
+                await context.close()
+            self.contexts = []
+            await self.save_state()
+        return stats
+
+async def scrape_transcripts(scraper, sink, cookies_file: Optional[str] = None,
+                             concurrency: int = 4,
+                             state_file: str = 'transcripts_state.json') -> Dict[str, int]:
+    """List conversations from the sidebar, then fetch every transcript"""
+    try:
+        await scraper.prepare(cookies_file)
+        await scraper.open_url(scraper.urls[0])
+        await scraper.expand()
+        conversations = await scraper.extract_conversations()
+
+        fetcher = TranscriptFetcher(scraper, concurrency=concurrency, state_file=state_file)
+        stats = await fetcher.fetch_all(conversations, sink)
+        logger.info(f"Transcripts: {stats}")
+        return stats
+    finally:
+        await sink.close()
+        await scraper.close()